@@ -19,6 +19,7 @@ from PyQt6.QtCore import QThread, QMetaObject, Qt, pyqtSlot
 from dataHandling.HistoryManagement.HistoricalDataManagement import HistoricalDataManager
 from dataHandling.HistoryManagement.FinazonDataManager import FinazonDataManager
 from dataHandling.HistoryManagement.IndicatorProcessor import IndicatorProcessor
+from dataHandling.HistoryManagement.DataBuffer import DataBuffers
 
 from dataHandling.TradeManagement.OrderManagement import OrderManager
 from dataHandling.TradeManagement.PositionDataManagement import PositionDataManager
@@ -37,6 +38,8 @@ class ConnectionThreadManager:
     history_manager = None
     indicator_processor = None
     connectivty_ver = None
+        #launcher processes on the same buffers share one copy of the bars through memory-mapped files
+    share_bars = True
 
     running_workers = dict()
 
@@ -83,6 +86,7 @@ class ConnectionThreadManager:
         if identifier == 'general_history' and (self.history_manager is not None):
             history_manager = self.history_manager
         else:
+            if self.share_bars: DataBuffers.setupSharing(Constants.BUFFER_FOLDER)
             history_manager = HistoricalDataManager(self.local_address, int(self.trading_socket), self.next_id, name="HistoricalDataManager")
             history_manager.api_updater.connect(self.apiUpdate, Qt.ConnectionType.QueuedConnection)
 
@@ -98,6 +102,7 @@ class ConnectionThreadManager:
         if identifier == 'general_history' and (self.history_manager is not None):
             finazon_history_manager = self.history_manager
         else:
+            if self.share_bars: DataBuffers.setupSharing(Constants.FINAZON_BUFFER_FOLDER)
             finazon_history_manager = FinazonDataManager()
             self.finazon_thread = QThread()
             finazon_history_manager.moveToThread(self.finazon_thread)
@@ -87,7 +87,13 @@ class ComparisonProcessor(DataProcessor):
                 self.updateFrameForHistory([uid])
 
             
-        elif signal == Constants.ALL_DATA_LOADED or signal == Constants.DATA_LOADED_FROM_FILE or signal == Constants.HISTORICAL_UPDATE_COMPLETE:
+        elif signal == Constants.DATA_LOADED_FROM_FILE:
+                #buffers are loaded in the background, each signal covers the uids loaded since the previous one
+            loaded_uids = [uid for uid in sub_signal['uids'] if uid in self._stock_list]
+            if len(loaded_uids) > 0:
+                self.updateFrameForHistory(loaded_uids)
+
+        elif signal == Constants.ALL_DATA_LOADED or signal == Constants.HISTORICAL_UPDATE_COMPLETE:
             self.updateFrameForHistory()
 
 
@@ -137,7 +137,10 @@ class ComparisonList(ComparisonWindow):
 
     @pyqtSlot(str, dict)
     def bufferUpdate(self, signal, sub_signal):
-        pass
+        if signal == Constants.DATA_LOADED_FROM_FILE:
+                #the history can be fetched once all buffers of the list are loaded
+            if sub_signal.get('loaded', 0) == sub_signal.get('total', 0):
+                self.setHistoryEnabled(True)
 
 
     @pyqtSlot(str, dict)
@@ -146,8 +149,6 @@ class ComparisonList(ComparisonWindow):
             pass
         elif ((signal == Constants.HISTORICAL_GROUP_COMPLETE) and (sub_signal['type'] == 'range_group')) or (signal == Constants.ALL_DATA_LOADED):
             self.setHistoryEnabled(True)
-        elif signal == Constants.DATA_LOADED_FROM_FILE:
-            self.setHistoryEnabled(True, self.data_processor.isUpdatable())
     
 
 ############## BUTTON ACTIONS
@@ -225,10 +226,9 @@ class ComparisonList(ComparisonWindow):
         addCheckableTickersTo(self.visible_ticker_box, self.stock_list, self.check_list)
         addCheckableTickersTo(self.focus_box, filtered_list, self.focus_list)
         
-        self.fetch_full_button.setEnabled(True)
-        self.fetch_range_button.setEnabled(True)
+            #enabled again once the buffers of the list are loaded
+        self.setHistoryEnabled(False)
         self.keep_up_box.setChecked(False)
-        self.keep_up_box.setEnabled(False)
         
 
     def modeSelection(self, button, value):
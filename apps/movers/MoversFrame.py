@@ -16,6 +16,9 @@
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
+import numpy as np
+import pandas as pd
+
 from PyQt6.QtCore import QObject, QReadWriteLock, pyqtSignal, QThread
 from dataHandling.Constants import Constants
 
@@ -25,6 +28,12 @@ class MoversFrame(QObject):
     processing_updater = pyqtSignal(str, dict)
 
     _data_frame = None
+    _update_depth = 0
+
+    def __init__(self):
+        super().__init__()
+        self._pending_values = dict()
+
 
     def setDataFrame(self, data_frame):
         self.processing_updater.emit(Constants.DATA_WILL_CHANGE, dict())
@@ -83,6 +92,11 @@ class MoversFrame(QObject):
 
 
     def getValueFor(self, uid, column_name):
+            #values written during an update are visible to the writer before the commit
+        pending_values = self._pending_values.get(column_name)
+        if pending_values is not None and uid in pending_values:
+            return pending_values[uid]
+
         self._lock.lockForRead()
         value = self._data_frame.loc[uid, column_name]
         self._lock.unlock()
@@ -90,6 +104,10 @@ class MoversFrame(QObject):
 
 
     def updateValueFor(self, uid, column_name, new_value):
+        if self._update_depth > 0:
+            self._pending_values.setdefault(column_name, dict())[uid] = new_value
+            return
+
         self._lock.lockForWrite()
         change = self._data_frame.loc[uid, column_name] != new_value
         self._data_frame.loc[uid, column_name] = new_value    
@@ -99,3 +117,86 @@ class MoversFrame(QObject):
             self.processing_updater.emit(Constants.DATA_DID_CHANGE, {'row_index': row_index, 'column_name': column_name, 'new_value': new_value})
 
 
+    def getValuesFor(self, uids, column_name):
+        if isinstance(column_name, list):
+            return np.column_stack([self.getValuesFor(uids, column) for column in column_name])
+
+        self._lock.lockForRead()
+        try:
+            values = np.array(self._data_frame.loc[uids, column_name].to_numpy())
+        finally:
+            self._lock.unlock()
+
+        pending_values = self._pending_values.get(column_name)
+        if pending_values:
+            for row, uid in enumerate(uids):
+                if uid in pending_values:
+                    values[row] = pending_values[uid]
+        return values
+
+    ################ Batched updates
+        #Between beginUpdate and commit all writes are collected, commit applies them per column
+        #and emits a single signal with the changed row ranges per column. Calls can be nested,
+        #only the outermost commit applies the changes
+
+    def beginUpdate(self):
+        self._update_depth += 1
+
+
+    def updateValues(self, column_values):
+            #column_values maps a column name to {uid: value} or to a Series indexed by uid
+        in_transaction = self._update_depth > 0
+        if not in_transaction:
+            self.beginUpdate()
+
+        for column_name, new_values in column_values.items():
+            if isinstance(new_values, pd.Series):
+                new_values = dict(zip(new_values.index, new_values.to_numpy()))
+            self._pending_values.setdefault(column_name, dict()).update(new_values)
+
+        if not in_transaction:
+            self.commit()
+
+
+    def updateColumnsFor(self, uids, column_values):
+            #whole column writes for many symbols at once
+        self.updateValues({column_name: dict(zip(uids, new_values)) for column_name, new_values in column_values.items()})
+
+
+    def commit(self):
+        self._update_depth = max(self._update_depth - 1, 0)
+        if self._update_depth > 0 or len(self._pending_values) == 0:
+            return
+
+        pending_values = self._pending_values
+        self._pending_values = dict()
+
+        changed_ranges = dict()
+        self._lock.lockForWrite()
+        try:
+            for column_name, new_values in pending_values.items():
+                new_series = pd.Series(list(new_values.values()), index=list(new_values.keys()))
+                    #uids that are no longer in the frame, like after a list change, are left out
+                new_series = new_series[new_series.index.isin(self._data_frame.index)]
+                if len(new_series) == 0:
+                    continue
+                current_series = self._data_frame.loc[new_series.index, column_name]
+                changed = ~((current_series == new_series) | (current_series.isna() & new_series.isna()))
+                if changed.any():
+                    changed_uids = new_series.index[changed.to_numpy()]
+                    self._data_frame.loc[changed_uids, column_name] = new_series[changed.to_numpy()].to_numpy()
+                    changed_ranges[column_name] = self.rowRanges(self._data_frame.index.get_indexer(changed_uids))
+        finally:
+            self._lock.unlock()
+
+        if len(changed_ranges) > 0:
+            self.processing_updater.emit(Constants.DATA_DID_CHANGE, {'changed_ranges': changed_ranges})
+
+
+    def rowRanges(self, row_indices):
+            #sorted row indices as a list of (first, last) runs of consecutive rows
+        row_indices = np.sort(row_indices)
+        breaks = np.flatnonzero(np.diff(row_indices) != 1) + 1
+        firsts = row_indices[np.concatenate(([0], breaks))]
+        lasts = row_indices[np.concatenate((breaks - 1, [len(row_indices) - 1]))]
+        return list(zip(firsts.tolist(), lasts.tolist()))
@@ -27,7 +27,8 @@ from dataHandling.Constants import Constants, TableType
 from dataHandling.DataProcessor import DataProcessor
 from .MoversFrame import MoversFrame
 from dataHandling.HistoryManagement.BufferedManager import BufferedDataManager
-from generalFunctionality.GenFunctions import addRSIsEMAs, getLowsHighsCount, calculateCorrelation
+from dataHandling.HistoryManagement.StreamingIndicators import StreamingIndicatorEngine
+from generalFunctionality.GenFunctions import getLowsHighsCount, getLowsHighsCounts, calculateLastRSIs, calculateCorrelation
 from generalFunctionality.DateTimeFunctions import subtract_days, subtract_weeks, subtract_months
 
 class MoversProcessor(DataProcessor):
@@ -39,6 +40,12 @@ class MoversProcessor(DataProcessor):
 
     corr_bar_type = Constants.FIVE_MIN_BAR
     corr_bar_count = 24
+    step_bar_count = 50
+
+        #from this many symbols on the table is filled by the vectorized batch functions
+    batch_min_count = 20
+        #Wilder smoothing has long converged over this many bars, so the batch RSI matches the one over the full buffer
+    rsi_bar_count = 250
         
     max_delay_min = 5
 
@@ -69,6 +76,7 @@ class MoversProcessor(DataProcessor):
 
     def __init__(self, history_manager, bar_types, stock_list, index_list=None):
         self.data_wrapper = MoversFrame()
+        self.indicator_engine = StreamingIndicatorEngine()
         self.buffered_manager = BufferedDataManager(history_manager)
         super().__init__(stock_list, index_list)
         self.bar_types = bar_types
@@ -117,7 +125,9 @@ class MoversProcessor(DataProcessor):
 
                 self.updateFrameForHistory(updates_uids=[uid], bar_types=bars, updated_from=updated_from)
         elif signal == Constants.DATA_LOADED_FROM_FILE:
-            self.updateFrameForHistory()
+                #buffers are loaded in the background, each signal covers the uids loaded since the previous one
+            loaded_uids = [uid for uid in sub_signal['uids'] if uid in self._stock_list]
+            self.updateFrameForHistory(updates_uids=loaded_uids)
 
 
 
@@ -130,6 +140,16 @@ class MoversProcessor(DataProcessor):
 
         if self.stock_df is None:
             self.initDataFrame()
+
+            #all table writes of one refresh go out to the table as a single change
+        self.data_wrapper.beginUpdate()
+        try:
+            self.updateFrameValues(updates_uids, bar_types, updated_from)
+        finally:
+            self.data_wrapper.commit()
+
+
+    def updateFrameValues(self, updates_uids=None, bar_types=None, updated_from=None):
         
         if updates_uids is None:
             updates_uids = self.stock_df.index.values
@@ -141,21 +161,39 @@ class MoversProcessor(DataProcessor):
 
         if len(updated_pairs) > 0:
 
-            self.updatePrices(updates_uids)
+            batch_mode = len(updates_uids) >= self.batch_min_count
+            if bar_types is None:
+                bar_types = self.bar_types
+
+            if batch_mode:
+                self.batchUpdatePrices(updates_uids)
+            else:
+                self.updatePrices(updates_uids)
 
             if self.buffered_manager.initial_fetch or (self.current_table_type == TableType.overview or self.current_table_type == TableType.from_low or self.current_table_type == TableType.from_high):
-                self.calculateDayMove(updated_list=updates_uids)
-                self.calculateMinMax(self.time_period, updated_list=updates_uids)
-                self.calculateFromLowHigh(updated_list=updates_uids)
+                if batch_mode:
+                    self.batchDayMove(updates_uids)
+                    self.batchMinMax(self.time_period, updates_uids)
+                    self.batchFromLowHigh(updates_uids)
+                else:
+                    self.calculateDayMove(updated_list=updates_uids)
+                    self.calculateMinMax(self.time_period, updated_list=updates_uids)
+                    self.calculateFromLowHigh(updated_list=updates_uids)
             
             if self.buffered_manager.initial_fetch or (self.current_table_type == TableType.rsi):
-                self.computeRSIs(updated_pairs=updated_pairs, from_indices=updated_from)
+                if batch_mode:
+                    self.batchRSIs(updates_uids, bar_types)
+                else:
+                    self.computeRSIs(updated_pairs=updated_pairs, from_indices=updated_from)
 
             if self.buffered_manager.initial_fetch or (self.current_table_type == TableType.rel_rsi):
                 self.computeRelRSIs(updated_pairs=updated_pairs)
 
             if self.buffered_manager.initial_fetch or (self.current_table_type == TableType.up_step or self.current_table_type == TableType.down_step):
-                self.computeSteps(updated_pairs=updated_pairs)
+                if batch_mode:
+                    self.batchSteps(updates_uids, bar_types)
+                else:
+                    self.computeSteps(updated_pairs=updated_pairs)
             
             if self.buffered_manager.initial_fetch or (self.current_table_type == TableType.index_corr):
                 self.calculateIndexCorrelation(updated_list=updates_uids)
@@ -166,7 +204,7 @@ class MoversProcessor(DataProcessor):
     @pyqtSlot(str)
     def updatePeriodSelection(self, value):
         self.time_period = value
-        self.calculateMinMax(self.time_period)
+        self.batchMinMax(self.time_period, self.stock_df.index.values)
 
 
     @pyqtSlot(TableType)
@@ -237,10 +275,10 @@ class MoversProcessor(DataProcessor):
             
             if self.data_buffers.bufferExists(uid, bar_type):
 
-                stock_frame = self.data_buffers.getBufferFor(uid, bar_type)
+                step_bars = self.data_buffers.getSnapshotFor(uid, bar_type, count=self.step_bar_count, columns=[Constants.LOW, Constants.HIGH])
                 
                 try:
-                    low_move, high_move, inner_bar_specs = getLowsHighsCount(stock_frame)
+                    low_move, high_move, inner_bar_specs = getLowsHighsCount(step_bars, count=self.step_bar_count)
 
                     self.data_wrapper.updateValueFor(uid, bar_type + "_UpSteps", low_move['count'])
                     self.data_wrapper.updateValueFor(uid, bar_type + "_DownSteps", high_move['count'])
@@ -271,16 +309,17 @@ class MoversProcessor(DataProcessor):
             if (from_indices is not None) and (bar_type in from_indices):
                 starting_index = from_indices[bar_type]
             if self.data_buffers.bufferExists(uid, bar_type):
-                stock_frame = self.data_buffers.getBufferFor(uid, bar_type)
-                rsi_padded_frame = addRSIsEMAs(stock_frame, starting_index)
-                self.data_buffers.setBufferFor(uid, bar_type, rsi_padded_frame)
-                latest_rsi = rsi_padded_frame.iloc[-1]['rsi']
-                self.data_wrapper.updateValueFor(uid, bar_type + "_RSI", latest_rsi)
-
-        day_rsi = self.stock_df.loc[uid, "1 day_RSI"]
-        five_rsi = self.stock_df.loc[uid, "5 mins_RSI"]
-        fifteen_rsi = self.stock_df.loc[uid, "15 mins_RSI"]
-        hour_rsi = self.stock_df.loc[uid, "1 hour_RSI"]
+                bars = self.data_buffers.getSnapshotFor(uid, bar_type, columns=[Constants.CLOSE, 'up_ema', 'down_ema'])
+                updated = self.indicator_engine.updateRSIs(uid, bar_type, bars, starting_index)
+                if updated is not None:
+                    updated_indices, indicator_values = updated
+                    self.data_buffers.setColumnValuesAtIndices(uid, bar_type, updated_indices, indicator_values)
+                    self.data_wrapper.updateValueFor(uid, bar_type + "_RSI", indicator_values['rsi'][-1])
+
+        day_rsi = self.data_wrapper.getValueFor(uid, "1 day_RSI")
+        five_rsi = self.data_wrapper.getValueFor(uid, "5 mins_RSI")
+        fifteen_rsi = self.data_wrapper.getValueFor(uid, "15 mins_RSI")
+        hour_rsi = self.data_wrapper.getValueFor(uid, "1 hour_RSI")
         short_rsis = [five_rsi, fifteen_rsi, hour_rsi]
         difference_rsi = max(abs(day_rsi - short_rsi) for short_rsi in short_rsis)
         self.data_wrapper.updateValueFor(uid, "Difference_RSI", difference_rsi)
@@ -306,7 +345,6 @@ class MoversProcessor(DataProcessor):
         #         else:
         #             self.relative_frame_buffer[(uid, self.comp_uid), bar_type] = orig_buffer.loc[overlapping_indices]/comp_buffer.loc[overlapping_indices]
 
-        #         self.relative_frame_buffer[(uid, self.comp_uid), bar_type] = addRSIsEMAs(self.relative_frame_buffer[(uid, self.comp_uid), bar_type])
         #         latest_rsi = self.relative_frame_buffer[(uid, self.comp_uid), bar_type].iloc[-1]['rsi']
         #         self.data_wrapper.updateValueFor(uid, bar_type + "_REL_RSI", latest_rsi)
 
@@ -330,17 +368,22 @@ class MoversProcessor(DataProcessor):
             if self.data_buffers.bufferExists(uid, Constants.DAY_BAR):
 
                 price = self.data_wrapper.getValueFor(uid, Constants.PRICE)
-                stock_frame = self.data_buffers.getBufferFor(uid, Constants.DAY_BAR)
+                day_bars = self.data_buffers.getSnapshotFor(uid, Constants.DAY_BAR, columns=[Constants.LOW, Constants.HIGH])
 
+                start = 0
                 if time_period != "Max":
                     begin_date = self.period_functions[time_period]
-                    stock_frame = stock_frame[stock_frame.index >= begin_date]
-
-                if not stock_frame.empty:
-                    self.data_wrapper.updateValueFor(uid, Constants.MAX, stock_frame[Constants.HIGH].max())
-                    self.data_wrapper.updateValueFor(uid, Constants.MAX_DATE, stock_frame[Constants.HIGH].idxmax())
-                    self.data_wrapper.updateValueFor(uid, Constants.MIN, stock_frame[Constants.LOW].min())
-                    self.data_wrapper.updateValueFor(uid, Constants.MIN_DATE, stock_frame[Constants.LOW].idxmin())
+                    start = day_bars.positionFrom(begin_date)
+
+                highs = day_bars[Constants.HIGH][start:]
+                lows = day_bars[Constants.LOW][start:]
+                if len(highs) > 0 and not (np.isnan(highs).all() or np.isnan(lows).all()):
+                    max_pos = np.nanargmax(highs)
+                    min_pos = np.nanargmin(lows)
+                    self.data_wrapper.updateValueFor(uid, Constants.MAX, highs[max_pos])
+                    self.data_wrapper.updateValueFor(uid, Constants.MAX_DATE, day_bars.index[start + max_pos])
+                    self.data_wrapper.updateValueFor(uid, Constants.MIN, lows[min_pos])
+                    self.data_wrapper.updateValueFor(uid, Constants.MIN_DATE, day_bars.index[start + min_pos])
                     
                     min_perc_move = (price - self.data_wrapper.getValueFor(uid, Constants.MIN))/self.data_wrapper.getValueFor(uid, Constants.MIN)*100
                     max_perc_move = (self.data_wrapper.getValueFor(uid, Constants.MAX)-price)/self.data_wrapper.getValueFor(uid, Constants.MAX)*100
@@ -357,18 +400,22 @@ class MoversProcessor(DataProcessor):
             if self.data_buffers.bufferExists(uid, Constants.DAY_BAR):
         
                 price = self.data_wrapper.getValueFor(uid, Constants.PRICE)
-                stock_frame = self.data_buffers.getBufferFor(uid, Constants.DAY_BAR)
+                day_bars = self.data_buffers.getSnapshotFor(uid, Constants.DAY_BAR, columns=[Constants.LOW, Constants.HIGH])
+                lows = day_bars[Constants.LOW]
+                highs = day_bars[Constants.HIGH]
 
-                self.data_wrapper.updateValueFor(uid, Constants.DAY_LOW, stock_frame[Constants.LOW].iloc[-1])
-                self.data_wrapper.updateValueFor(uid, Constants.DAY_HIGH, stock_frame[Constants.HIGH].iloc[-1])
-                self.data_wrapper.updateValueFor(uid, Constants.DAY_LOW_DIFF, price - stock_frame[Constants.LOW].iloc[-1])
-                self.data_wrapper.updateValueFor(uid, Constants.DAY_HIGH_DIFF, stock_frame[Constants.HIGH].iloc[-1] - price)
+                self.data_wrapper.updateValueFor(uid, Constants.DAY_LOW, lows[-1])
+                self.data_wrapper.updateValueFor(uid, Constants.DAY_HIGH, highs[-1])
+                self.data_wrapper.updateValueFor(uid, Constants.DAY_LOW_DIFF, price - lows[-1])
+                self.data_wrapper.updateValueFor(uid, Constants.DAY_HIGH_DIFF, highs[-1] - price)
 
                 for period_key, max_date in self.period_functions.items():
-                    sub_frame = stock_frame[stock_frame.index >= max_date]
+                    start = day_bars.positionFrom(max_date)
+                    period_low = np.nanmin(lows[start:]) if start < len(lows) else np.nan
+                    period_high = np.nanmax(highs[start:]) if start < len(highs) else np.nan
 
-                    self.data_wrapper.updateValueFor(uid, period_key + '_' + Constants.LOW, sub_frame[Constants.LOW].min())
-                    self.data_wrapper.updateValueFor(uid, period_key + '_' + Constants.HIGH, sub_frame[Constants.HIGH].max())
+                    self.data_wrapper.updateValueFor(uid, period_key + '_' + Constants.LOW, period_low)
+                    self.data_wrapper.updateValueFor(uid, period_key + '_' + Constants.HIGH, period_high)
 
                     self.data_wrapper.updateValueFor(uid, period_key + '_' + Constants.LOW + '_DIFF', price - self.data_wrapper.getValueFor(uid, period_key + '_' + Constants.LOW))
                     self.data_wrapper.updateValueFor(uid, period_key + '_' + Constants.HIGH + '_DIFF', self.data_wrapper.getValueFor(uid, period_key + '_' + Constants.HIGH) - price)
@@ -383,14 +430,14 @@ class MoversProcessor(DataProcessor):
 
                 last_known_price = self.data_wrapper.getValueFor(uid, Constants.PRICE)
                 
-                day_buffer = self.data_buffers.getBufferFor(uid, Constants.DAY_BAR)
-                if len(day_buffer) > 1:
+                day_bars = self.data_buffers.getSnapshotFor(uid, Constants.DAY_BAR, count=2, columns=[Constants.CLOSE])
+                if len(day_bars) > 1:
                         #if we have a bar for today we want to go back 1 day. If there is no bar yet, we take the last completed
-                    dt_object = datetime.fromtimestamp(day_buffer[Constants.CLOSE].index[-1])
+                    dt_object = datetime.fromtimestamp(day_bars.index[-1])
                     if dt_object.date() == datetime.today().date():
-                        last_day_close = day_buffer[Constants.CLOSE].iloc[-2]
+                        last_day_close = day_bars[Constants.CLOSE][-2]
                     else:
-                        last_day_close = day_buffer[Constants.CLOSE].iloc[-1]
+                        last_day_close = day_bars[Constants.CLOSE][-1]
                     price_move_perc = ((last_known_price-last_day_close)/last_day_close)*100
 
                     self.data_wrapper.updateValueFor(uid, Constants.DAY_MOVE, price_move_perc)
@@ -409,17 +456,138 @@ class MoversProcessor(DataProcessor):
                     index_symbol = self._index_list[index_uid][Constants.SYMBOL]
 
                     if self.data_buffers.bufferExists(uid, self.corr_bar_type) and self.data_buffers.bufferExists(index_uid, self.corr_bar_type):
-                        stock_frame = self.data_buffers.getBufferFor(uid, self.corr_bar_type)
-                        comp_frame = self.data_buffers.getBufferFor(index_uid, self.corr_bar_type)
-                        overlapping_indices = stock_frame.index.intersection(comp_frame.index)
-                        if len(overlapping_indices) > self.corr_bar_count:
-                            overlapping_indices = overlapping_indices[-self.corr_bar_count:]
-                        stock_closes = self.data_buffers.getValueForColumnByIndex(uid, self.corr_bar_type, Constants.CLOSE, overlapping_indices)
-                        index_closes = self.data_buffers.getValueForColumnByIndex(index_uid, self.corr_bar_type, Constants.CLOSE, overlapping_indices)
+                        stock_bars = self.data_buffers.getSnapshotFor(uid, self.corr_bar_type, columns=[Constants.CLOSE])
+                        comp_bars = self.data_buffers.getSnapshotFor(index_uid, self.corr_bar_type, columns=[Constants.CLOSE])
+                        _, stock_positions, index_positions = np.intersect1d(stock_bars.index, comp_bars.index, assume_unique=True, return_indices=True)
+                        stock_closes = stock_bars[Constants.CLOSE][stock_positions[-self.corr_bar_count:]]
+                        index_closes = comp_bars[Constants.CLOSE][index_positions[-self.corr_bar_count:]]
 
                         self.data_wrapper.updateValueFor(uid, index_symbol + "_CORR", calculateCorrelation(stock_closes, index_closes))
-                        
 
 
-        
-
+    ################ Batch computations
+        #the functions below compute a value for all given symbols in one vectorized pass over
+        #(symbols x bars) arrays, and write every resulting column to the table in one assignment
+
+    def batchUpdatePrices(self, uid_list):
+        uids = [uid for uid in uid_list if self.data_buffers.bufferExists(uid, Constants.FIVE_MIN_BAR)]
+        if len(uids) > 0:
+            prices = [self.data_buffers.getLatestPrice(uid) for uid in uids]
+            self.data_wrapper.updateColumnsFor(uids, {Constants.PRICE: prices})
+
+
+    def batchSteps(self, uid_list, bar_types):
+        for bar_type in bar_types:
+            uids, _, step_bars = self.data_buffers.getStackedBarsFor(uid_list, bar_type, [Constants.LOW, Constants.HIGH], count=self.step_bar_count)
+            if len(uids) == 0:
+                continue
+
+            low_move, high_move, inner_bar_specs = getLowsHighsCounts(step_bars[Constants.LOW], step_bars[Constants.HIGH])
+            self.data_wrapper.updateColumnsFor(uids, {bar_type + "_UpSteps": low_move['count'],
+                                                        bar_type + "_DownSteps": high_move['count'],
+                                                        bar_type + "_UpSteps_Level": low_move['level'],
+                                                        bar_type + "_DownSteps_Level": high_move['level'],
+                                                        bar_type + "_UpSteps_Apex": low_move['apex'],
+                                                        bar_type + "_DownSteps_Apex": high_move['apex'],
+                                                        bar_type + "_UpSteps_Move": low_move['move'],
+                                                        bar_type + "_DownSteps_Move": high_move['move'],
+                                                        bar_type + "_InnerCount": inner_bar_specs['count']})
+
+
+    def batchRSIs(self, uid_list, bar_types):
+        for bar_type in bar_types:
+            uids, timestamps, bars = self.data_buffers.getStackedBarsFor(uid_list, bar_type, [Constants.CLOSE], count=self.rsi_bar_count)
+            if len(uids) > 0:
+                closes = bars[Constants.CLOSE]
+                rsis, up_emas, down_emas = calculateLastRSIs(closes, period=self.indicator_engine.rsi_period)
+                self.data_wrapper.updateColumnsFor(uids, {bar_type + "_RSI": rsis})
+                    #live updates continue from the last completed bar instead of recomputing every symbol
+                for row in np.flatnonzero(~np.isnan(up_emas)):
+                    self.indicator_engine.setRSIState(uids[row], bar_type, timestamps[row, -2], closes[row, -2], up_emas[row], down_emas[row])
+
+        short_columns = ["5 mins_RSI", "15 mins_RSI", "1 hour_RSI"]
+        if all(column in self.stock_df.columns for column in short_columns + ["1 day_RSI"]):
+            day_rsis = self.data_wrapper.getValuesFor(uid_list, "1 day_RSI").astype(float)
+            short_rsis = self.data_wrapper.getValuesFor(uid_list, short_columns).astype(float)
+            difference_rsis = np.max(np.abs(day_rsis[:, None] - short_rsis), axis=1)
+            self.data_wrapper.updateColumnsFor(uid_list, {"Difference_RSI": difference_rsis})
+
+
+    def batchMinMax(self, time_period, uid_list):
+        uids, timestamps, day_bars = self.data_buffers.getStackedBarsFor(uid_list, Constants.DAY_BAR, [Constants.LOW, Constants.HIGH])
+        if len(uids) == 0:
+            return
+
+        begin_date = 0
+        if time_period != "Max":
+            begin_date = self.period_functions[time_period]
+
+        in_period = timestamps >= begin_date
+        rows = np.arange(len(uids))
+        max_positions, max_values = self.periodExtremes(day_bars[Constants.HIGH], in_period, np.argmax, -np.inf)
+        min_positions, min_values = self.periodExtremes(day_bars[Constants.LOW], in_period, np.argmin, np.inf)
+
+        valid = np.isfinite(max_values) & np.isfinite(min_values)
+        if np.any(valid):
+            valid_uids = [uid for uid, is_valid in zip(uids, valid) if is_valid]
+            prices = self.data_wrapper.getValuesFor(valid_uids, Constants.PRICE).astype(float)
+            max_values = max_values[valid]
+            min_values = min_values[valid]
+            self.data_wrapper.updateColumnsFor(valid_uids, {Constants.MAX: max_values,
+                                                            Constants.MAX_DATE: timestamps[rows, max_positions][valid],
+                                                            Constants.MIN: min_values,
+                                                            Constants.MIN_DATE: timestamps[rows, min_positions][valid],
+                                                            Constants.MIN_FROM: (prices - min_values)/min_values*100,
+                                                            Constants.MAX_FROM: (max_values - prices)/max_values*100})
+
+
+    def periodExtremes(self, values, in_period, arg_function, fill_value):
+        masked = np.where(in_period & ~np.isnan(values), values, fill_value)
+        positions = arg_function(masked, axis=1)
+        return positions, masked[np.arange(len(masked)), positions]
+
+
+    def batchFromLowHigh(self, uid_list):
+        uids, timestamps, day_bars = self.data_buffers.getStackedBarsFor(uid_list, Constants.DAY_BAR, [Constants.LOW, Constants.HIGH])
+        if len(uids) == 0:
+            return
+
+        prices = self.data_wrapper.getValuesFor(uids, Constants.PRICE).astype(float)
+        lows = day_bars[Constants.LOW]
+        highs = day_bars[Constants.HIGH]
+
+        column_values = {Constants.DAY_LOW: lows[:, -1],
+                        Constants.DAY_HIGH: highs[:, -1],
+                        Constants.DAY_LOW_DIFF: prices - lows[:, -1],
+                        Constants.DAY_HIGH_DIFF: highs[:, -1] - prices}
+
+        for period_key, max_date in self.period_functions.items():
+            in_period = timestamps >= max_date
+            _, period_lows = self.periodExtremes(lows, in_period, np.argmin, np.inf)
+            _, period_highs = self.periodExtremes(highs, in_period, np.argmax, -np.inf)
+            period_lows[~np.isfinite(period_lows)] = np.nan
+            period_highs[~np.isfinite(period_highs)] = np.nan
+
+            column_values[period_key + '_' + Constants.LOW] = period_lows
+            column_values[period_key + '_' + Constants.HIGH] = period_highs
+            column_values[period_key + '_' + Constants.LOW + '_DIFF'] = prices - period_lows
+            column_values[period_key + '_' + Constants.HIGH + '_DIFF'] = period_highs - prices
+
+        self.data_wrapper.updateColumnsFor(uids, column_values)
+
+
+    def batchDayMove(self, uid_list):
+        uids, timestamps, day_bars = self.data_buffers.getStackedBarsFor(uid_list, Constants.DAY_BAR, [Constants.CLOSE], count=2)
+        has_previous = timestamps[:, 0] != 0
+        if not np.any(has_previous):
+            return
+
+            #if we have a bar for today we want to go back 1 day. If there is no bar yet, we take the last completed
+        today_start = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        closes = day_bars[Constants.CLOSE][has_previous]
+        last_day_closes = np.where(timestamps[has_previous, -1] >= today_start, closes[:, 0], closes[:, 1])
+
+        uids = [uid for uid, previous in zip(uids, has_previous) if previous]
+        last_known_prices = self.data_wrapper.getValuesFor(uids, Constants.PRICE).astype(float)
+        price_move_percs = ((last_known_prices-last_day_closes)/last_day_closes)*100
+        self.data_wrapper.updateColumnsFor(uids, {Constants.DAY_MOVE: price_move_percs, Constants.YESTERDAY_CLOSE: last_day_closes})
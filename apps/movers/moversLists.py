@@ -53,6 +53,7 @@ class MoversList(MoversWindow):
     period_update_signal = pyqtSignal(str)
     cancel_update_signal = pyqtSignal()
     index_selection_signal = pyqtSignal(str)
+    prioritize_buffers_signal = pyqtSignal(list)
     continuous_updating_on = False
     bar_types = DT_BAR_TYPES
     counter = 0
@@ -102,6 +103,8 @@ class MoversList(MoversWindow):
         self.index_selection_signal.connect(self.data_processor.compSelection, Qt.ConnectionType.QueuedConnection)
         self.gui_change_signal.connect(self.data_processor.guiSelectionChange, Qt.ConnectionType.QueuedConnection)
         self.data_processor.data_buffers.buffer_updater.connect(self.bufferUpdate, Qt.ConnectionType.QueuedConnection)
+        self.prioritize_buffers_signal.connect(self.data_processor.data_buffers.prioritizeBuffers, Qt.ConnectionType.QueuedConnection)
+        self.overview_table.verticalScrollBar().valueChanged.connect(self.prioritizeVisibleRows)
 
         
     def initTableModels(self):
@@ -194,18 +197,26 @@ class MoversList(MoversWindow):
     def apiUpdate(self, signal, sub_signal):
         if signal == Constants.ALL_DATA_LOADED:
             self.setHistoryEnabled(True)
-        elif signal == Constants.DATA_LOADED_FROM_FILE:
-            self.setHistoryEnabled(True, self.data_processor.isUpdatable())
     
 
     @pyqtSlot(str, dict)
     def bufferUpdate(self, signal, sub_signal):
-        pass
-        # if signal == Constants.ALL_DATA_LOADED:
-        #     self.setHistoryEnabled(True)
-        # elif signal == Constants.DATA_LOADED_FROM_FILE:
-        #     self.setHistoryEnabled(True, self.data_processor.isUpdatable())
-        
+        if signal == Constants.DATA_LOADED_FROM_FILE:
+                #the history can be fetched once all buffers of the list are loaded
+            if sub_signal.get('loaded', 0) == sub_signal.get('total', 0):
+                self.setHistoryEnabled(True, self.data_processor.isUpdatable())
+
+
+    def prioritizeVisibleRows(self):
+            #the buffers of the rows on screen are loaded before the rest of the list, the tables scroll together
+        first_row = self.overview_table.rowAt(0)
+        if first_row >= 0:
+            last_row = self.overview_table.rowAt(self.overview_table.viewport().height() - 1)
+            if last_row < 0:
+                last_row = self.overview_table.model().rowCount() - 1
+            visible_uids = [self.table_data.getIndexForRow(row) for row in range(first_row, last_row + 1)]
+            self.prioritize_buffers_signal.emit([uid for uid in visible_uids if uid is not None])
+
         
 
 ############## Index lists
@@ -266,11 +277,8 @@ class MoversList(MoversWindow):
         self.initTableModels()
         #self.fetchShortRates()
         
-        self.update_button.setEnabled(True)
-        self.full_fetch_button.setEnabled(True)
-        self.keep_up_button.setEnabled(False)
-
-        self.setHistoryEnabled(True, self.data_processor.isUpdatable())
+            #enabled again once the buffers of the list are loaded
+        self.setHistoryEnabled(False)
         
 
     
@@ -0,0 +1,157 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Compares the cold start load time of the buffers of 500 symbols from the old per buffer pickles
+    #with the partitioned bar archive, loaded in full and limited to the last month. Also times saving
+    #every buffer after one new bar came in, which rewrote the full pickle before, and how a single
+    #buffer scales with the length of its history.
+    #Run from the repository root: python -m benchmarks.coldStartLoad
+
+import os, time, tempfile
+from datetime import datetime, timedelta
+from pytz import utc
+import numpy as np
+import pandas as pd
+
+from dataHandling.Constants import Constants, MAIN_BAR_TYPES, MINUTES_PER_BAR
+from dataHandling.HistoryManagement.DataBuffer import DataBuffers
+
+
+SYMBOL_COUNT = 500
+BARS_PER_BUFFER = {Constants.FIVE_MIN_BAR: 20_000, Constants.FIFTEEN_MIN_BAR: 8_000, Constants.HOUR_BAR: 3_000, Constants.FOUR_HOUR_BAR: 800, Constants.DAY_BAR: 700}
+
+
+def writePickles(data_folder):
+        #the format written by saveBuffer before the archive
+    rng = np.random.default_rng(0)
+    now = int(datetime.now(utc).timestamp())
+    for uid in range(SYMBOL_COUNT):
+        for bar_type in MAIN_BAR_TYPES:
+            bar_count = BARS_PER_BUFFER[bar_type]
+            seconds = 60 * MINUTES_PER_BAR[bar_type]
+            closes = 100 + np.cumsum(rng.normal(size=bar_count))
+            frame = pd.DataFrame({Constants.OPEN: closes, Constants.HIGH: closes + 0.5, Constants.LOW: closes - 0.5, Constants.CLOSE: closes, Constants.VOLUME: np.ones(bar_count)}, index=now - seconds * np.arange(bar_count)[::-1])
+            frame.attrs['requested_ranges'] = [(datetime.fromtimestamp(frame.index[0], utc), datetime.fromtimestamp(frame.index[-1], utc))]
+            frame.to_pickle(data_folder + str(uid) + '_' + bar_type + '.pkl')
+
+
+def resetBuffers():
+    DataBuffers._buffers.clear()
+    DataBuffers._locks.clear()
+    DataBuffers._date_ranges.clear()
+    DataBuffers._unsaved_from.clear()
+
+
+def loadPickles(data_folder):
+    data_buffers = DataBuffers(data_folder)
+    for uid in range(SYMBOL_COUNT):
+        for bar_type in MAIN_BAR_TYPES:
+            existing_buffer = pd.read_pickle(data_folder + str(uid) + '_' + bar_type + '.pkl')
+            data_buffers.setBufferFor(uid, bar_type, existing_buffer, req_ranges_list=existing_buffer.attrs['requested_ranges'])
+
+
+def loadArchive(data_folder, date_range=None):
+    data_buffers = DataBuffers(data_folder)
+    for uid in range(SYMBOL_COUNT):
+        for bar_type in MAIN_BAR_TYPES:
+            data_buffers.loadExistingBuffer(uid, bar_type, date_range=date_range)
+
+
+def appendBar(data_buffers):
+    for (uid, bar_type), store in list(DataBuffers._buffers.items()):
+        last_bar = data_buffers.getBarsFromIntIndex(uid, bar_type, -1)
+        last_bar.index = last_bar.index + 60 * MINUTES_PER_BAR[bar_type]
+        data_buffers.addToBuffer(uid, bar_type, last_bar)
+
+
+def savePickles(data_folder):
+    data_buffers = DataBuffers(data_folder)
+    appendBar(data_buffers)
+    for uid, bar_type in list(DataBuffers._buffers.keys()):
+        frame = data_buffers.getBufferFor(uid, bar_type)
+        frame.attrs['requested_ranges'] = data_buffers.getRangesForBuffer(uid, bar_type)
+        frame.to_pickle(data_folder + str(uid) + '_' + bar_type + '.pkl')
+
+
+def saveArchive(data_folder):
+    data_buffers = DataBuffers(data_folder)
+    appendBar(data_buffers)
+    for uid, bar_type in list(DataBuffers._buffers.keys()):
+        data_buffers.saveBuffer(uid, bar_type)
+
+
+def historyScaling(data_folder, bar_counts=[20_000, 100_000, 400_000], repeats=20):
+        #save after one new bar and load of the last month for one 5 min buffer with a growing history
+    data_buffers = DataBuffers(data_folder)
+    bar_type = Constants.FIVE_MIN_BAR
+    now = int(datetime.now(utc).timestamp())
+    last_month = (datetime.now(utc) - timedelta(days=30), datetime.now(utc))
+    for bar_count in bar_counts:
+        resetBuffers()
+        uid = 'scaling_' + str(bar_count)
+        closes = 100 + np.cumsum(np.random.default_rng(0).normal(size=bar_count))
+        frame = pd.DataFrame({Constants.OPEN: closes, Constants.HIGH: closes + 0.5, Constants.LOW: closes - 0.5, Constants.CLOSE: closes, Constants.VOLUME: np.ones(bar_count)}, index=now - 300 * np.arange(bar_count)[::-1])
+        data_buffers.setBufferFor(uid, bar_type, frame, req_ranges_list=[(datetime.fromtimestamp(frame.index[0], utc), datetime.fromtimestamp(frame.index[-1], utc))])
+        data_buffers.saveBuffer(uid, bar_type)
+        pickle_file = data_folder + uid + '.pkl'
+
+        timings = {'pickle save': 0, 'archive save': 0, 'pickle load': 0, 'archive load, last month': 0}
+        for _ in range(repeats):
+            appendBar(data_buffers)
+            start_time = time.perf_counter()
+            data_buffers.getBufferFor(uid, bar_type).to_pickle(pickle_file)
+            timings['pickle save'] += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            data_buffers.saveBuffer(uid, bar_type)
+            timings['archive save'] += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            pd.read_pickle(pickle_file)
+            timings['pickle load'] += time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            data_buffers.bar_archive.load(uid, bar_type, last_month)
+            timings['archive load, last month'] += time.perf_counter() - start_time
+
+        print(f"{bar_count:>9,} bars: " + ", ".join(f"{name} {1000*total/repeats:6.1f} ms" for name, total in timings.items()))
+
+
+def timed(function, *args):
+    resetBuffers()
+    start_time = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start_time
+    bar_count = sum(len(store) for store in DataBuffers._buffers.values())
+    return elapsed, bar_count
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_folder:
+        data_folder = temp_folder + '/'
+        writePickles(data_folder)
+
+        migration_time, _ = timed(loadArchive, data_folder)
+        print(f"{'migrating pickles':>22}: {migration_time:7.2f} s")
+
+        last_month = (datetime.now(utc) - timedelta(days=30), datetime.now(utc))
+        for name, function, args in [('pickles', loadPickles, (data_folder,)), ('archive, full', loadArchive, (data_folder,)), ('archive, last month', loadArchive, (data_folder, last_month))]:
+            elapsed, bar_count = timed(function, *args)
+            print(f"{name:>22}: {elapsed:7.2f} s for {bar_count:,} bars")
+
+        for name, save_function in [('pickles', savePickles), ('archive', saveArchive)]:
+            resetBuffers()
+            loadArchive(data_folder)
+            start_time = time.perf_counter()
+            save_function(data_folder)
+            print(f"{'saving after a bar, ' + name:>22}: {time.perf_counter() - start_time:7.2f} s")
+
+        historyScaling(data_folder)
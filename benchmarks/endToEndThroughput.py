@@ -0,0 +1,175 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #End-to-end throughput of the HistoricalDataManager, OptionChainManager and OrderManager against the local
+    #IB simulator: 5 min bar updates for a universe of symbols, an option chain with price snapshots for the
+    #near strikes and expirations, and bracket orders. The simulator runs SPEED times as fast as the market,
+    #which shortens its latencies and the historical pacing windows, and the client pacer is scaled to match.
+    #The managers run on the main thread with its event loop. Buffers and chains go to a temporary folder.
+    #Run from the repository root: python -m benchmarks.endToEndThroughput
+
+import contextlib, io, os, tempfile, time
+from datetime import datetime, timedelta
+from pytz import utc
+from PyQt6.QtCore import QCoreApplication, Qt
+from ibapi.contract import Contract
+
+from dataHandling.Constants import Constants
+from dataHandling.DataStructures import DetailObject
+from dataHandling.IBConnectivity import IBConnectivity
+from dataHandling.IBSimulator import IBSimulator
+from dataHandling.RequestPacer import RequestPacer
+
+
+SPEED = 600
+SYMBOL_COUNT = 200
+HISTORY_DAYS = 5
+OPTION_SYMBOL = 'SIMU'
+OPTION_DAYS = 60
+STRIKE_RANGE = 0.15
+BRACKET_COUNT = 50
+
+
+class ScaledPacer(RequestPacer):
+
+    historical_limit = (RequestPacer.historical_limit[0], RequestPacer.historical_limit[1] / SPEED)
+    contract_limit = (RequestPacer.contract_limit[0], RequestPacer.contract_limit[1] / SPEED)
+    identical_limit = (RequestPacer.identical_limit[0], RequestPacer.identical_limit[1] / SPEED)
+
+
+def runManager(app, manager, on_ready):
+        #calls on_ready with a finish function once the connection is up, and runs the event loop until it is called
+    results = dict()
+    def finish():
+        results['duration'] = time.perf_counter() - results['start']
+        app.quit()
+
+    def update(signal, sub_signal):
+        if signal == Constants.MANAGED_ACCOUNT_LIST:
+            results['start'] = time.perf_counter()
+            on_ready(results, finish)
+
+    manager.api_updater.connect(update, Qt.ConnectionType.QueuedConnection)
+    with contextlib.redirect_stdout(io.StringIO()):
+        manager.startConnection()
+        app.exec()
+        manager.stop()
+    return results
+
+
+def benchmarkHistory(app, simulator):
+    from dataHandling.HistoryManagement.HistoricalDataManagement import HistoricalDataManager
+
+    manager = HistoricalDataManager(simulator.host, simulator.port, 11)
+    owner_id = manager.registerOwner()
+    symbols = [f"S{index:04d}" for index in range(SYMBOL_COUNT)]
+    stock_list = {simulator.market.conIdFor(symbol): {'symbol': symbol, 'sec_type': Constants.STOCK, 'exchange': 'NASDAQ', 'time_zone': Constants.NYC_TIMEZONE,
+                  'long_name': symbol, 'currency': Constants.USD} for symbol in symbols}
+    begin_date = datetime.now(utc) - timedelta(days=HISTORY_DAYS)
+    begin_dates = {uid: begin_date for uid in stock_list}
+
+    def on_ready(results, finish):
+        manager.api_updater.connect(lambda signal, sub_signal: finish() if signal == Constants.HISTORICAL_UPDATE_COMPLETE else None, Qt.ConnectionType.QueuedConnection)
+        manager.requestUpdates(owner_id, stock_list, begin_dates, Constants.FIVE_MIN_BAR, False)
+
+    bars_before = simulator.getMetrics().get('bars', 0)
+    results = runManager(app, manager, on_ready)
+
+    bar_count = simulator.getMetrics().get('bars', 0) - bars_before
+    latencies = manager.getQueueLatencies().get('reqHistoricalData', {})
+    print(f"HistoricalDataManager: {SYMBOL_COUNT} requests, {bar_count:,} bars in {results['duration']:.2f} s, {SYMBOL_COUNT / results['duration']:.1f} requests/s, "
+          f"{bar_count / results['duration']:,.0f} bars/s, queue latency p50 {latencies.get('p50', 0):.0f} ms p99 {latencies.get('p99', 0):.0f} ms")
+
+
+def benchmarkOptions(app, simulator):
+    from dataHandling.OptionManagement.OptionChainManager import OptionChainManager
+
+    manager = OptionChainManager(simulator.host, simulator.port, 12)
+    con_id = simulator.market.conIdFor(OPTION_SYMBOL)
+    details = DetailObject(numeric_id=con_id, symbol=OPTION_SYMBOL, sec_type=Constants.STOCK, exchange='NASDAQ', time_zone=Constants.NYC_TIMEZONE, long_name=OPTION_SYMBOL, currency=Constants.USD)
+    price = float(simulator.market.priceAt(con_id, [simulator.clock.now()])[0])
+
+    def on_ready(results, finish):
+        def update(signal, sub_signal):
+            if signal == Constants.OPTION_INFO_LOADED and sub_signal['is_verified']:
+                results['chain'] = time.perf_counter() - results['start']
+                results['contracts'] = len(manager.chain_inf.getContractItems())
+                manager.requestForAllStrikesAndExpirations([Constants.CALL, Constants.PUT], (1 - STRIKE_RANGE) * price, (1 + STRIKE_RANGE) * price, 0, OPTION_DAYS)
+                results['snapshots'] = manager.total_requests
+            elif signal == Constants.OPTIONS_LOADED:
+                finish()
+
+        manager.api_updater.connect(update, Qt.ConnectionType.QueuedConnection)
+        manager.makeStockSelection(details)
+
+    results = runManager(app, manager, on_ready)
+    snapshot_duration = results['duration'] - results['chain']
+    latencies = manager.getQueueLatencies().get('reqMktData', {})
+    recalculations = manager.getBufferedFrame().recalculation_scheduler.getMetrics()
+    print(f"OptionChainManager: chain of {results['contracts']:,} contracts in {results['chain']:.2f} s, {results['snapshots']} snapshots in {snapshot_duration:.2f} s, "
+          f"{results['snapshots'] / snapshot_duration:.1f} snapshots/s, queue latency p50 {latencies.get('p50', 0):.0f} ms p99 {latencies.get('p99', 0):.0f} ms, "
+          f"{recalculations['marks']:,} price changes in {recalculations['recalculations']} recalculations of {recalculations['compute_ms']['mean']:.0f} ms")
+
+
+def benchmarkOrders(app, simulator):
+    from dataHandling.TradeManagement.OrderManagement import OrderManager
+
+    manager = OrderManager(simulator.host, simulator.port, 13, stair_manager_on=False)
+    contract = Contract()
+    contract.symbol, contract.secType, contract.exchange, contract.currency = 'ORDR', Constants.STOCK, Constants.SMART, Constants.USD
+    contract.conId = simulator.market.conIdFor('ORDR')
+
+        #entries fill, the profit and stop orders attached to them are submitted
+    expected_statuses = dict()
+    def on_ready(results, finish):
+        def orderUpdate(order_id, properties):
+            if expected_statuses.get(order_id) == properties.get('status'):
+                del expected_statuses[order_id]
+                if len(expected_statuses) == 0:
+                    finish()
+
+        manager.order_update_signal.connect(orderUpdate, Qt.ConnectionType.QueuedConnection)
+        order_ids = manager.getNextOrderIDs(3 * BRACKET_COUNT)
+        for index in range(BRACKET_COUNT):
+            entry_id, profit_id, stop_id = order_ids[3 * index: 3 * index + 3]
+            entry = manager.createLimitOrder(entry_id, Constants.BUY, 100, 50.0)
+            profit = manager.createLimitOrder(profit_id, Constants.SELL, 100, 55.0, parent_id=entry_id)
+            stop = manager.createStopOrder(stop_id, Constants.SELL, 100, 45.0, parent_id=entry_id)
+            stop.transmit = True
+            expected_statuses.update({entry_id: 'Filled', profit_id: 'Submitted', stop_id: 'Submitted'})
+            manager.placeBracketOrder([entry, profit, stop], contract)
+
+    results = runManager(app, manager, on_ready)
+    latencies = manager.getQueueLatencies().get('placeOrder', {})
+    print(f"OrderManager: {3 * BRACKET_COUNT} orders in {BRACKET_COUNT} brackets in {results['duration']:.2f} s, {3 * BRACKET_COUNT / results['duration']:.1f} orders/s, "
+          f"queue latency p50 {latencies.get('p50', 0):.0f} ms p99 {latencies.get('p99', 0):.0f} ms")
+
+
+if __name__ == "__main__":
+    app = QCoreApplication([])
+    data_folder = tempfile.mkdtemp()
+    Constants.BUFFER_FOLDER = os.path.join(data_folder, 'buffers') + os.sep
+    Constants.OPTION_CHAIN_FOLDER = os.path.join(data_folder, 'options') + os.sep
+    os.makedirs(Constants.BUFFER_FOLDER)
+    os.makedirs(Constants.OPTION_CHAIN_FOLDER)
+    IBConnectivity.pacer = ScaledPacer()
+
+    simulator = IBSimulator(speed=SPEED).start()
+    print(f"Simulator at {SPEED}x on port {simulator.port}")
+    for benchmark in [benchmarkHistory, benchmarkOptions, benchmarkOrders]:
+        benchmark(app, simulator)
+
+    print(f"Pacer: {IBConnectivity.pacer.getMetrics()}")
+    print(f"Simulator: {simulator.getMetrics()}")
+    simulator.stop()
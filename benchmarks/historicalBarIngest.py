@@ -0,0 +1,144 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Bars per second ingested from a simulated 100k bar response, with the bars handed from the callback
+    #thread to the manager thread one queued signal per bar and in batches through the BarBatcher.
+    #Measured from the first bar until the frame of the completed request is built on the manager thread.
+    #Run from the repository root: python -m benchmarks.historicalBarIngest
+
+import time
+from threading import Thread
+from PyQt6.QtCore import QCoreApplication, QObject, QThread, Qt, pyqtSignal, pyqtSlot
+from ibapi.common import BarData
+
+from dataHandling.HistoryManagement.BarAccumulator import BarAccumulator
+from dataHandling.HistoryManagement.BarBatcher import BarBatcher
+
+
+BAR_COUNT = 100_000
+REQ_ID = 5_000_000
+
+
+def createBars():
+    bars = []
+    for index in range(BAR_COUNT):
+        bar = BarData()
+        bar.date = str(1_700_000_000 + 60 * index)
+        bar.open, bar.high, bar.low, bar.close, bar.volume = 100.0, 101.0, 99.0, 100.5, 1_000
+        bars.append(bar)
+    return bars
+
+
+class PerBarReceiver(QObject):
+
+    bar_signal = pyqtSignal(int, BarData)
+    end_signal = pyqtSignal(int)
+    finished = pyqtSignal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.accumulator = BarAccumulator()
+        self.bar_signal.connect(self.processBar, Qt.ConnectionType.QueuedConnection)
+        self.end_signal.connect(self.processEnd, Qt.ConnectionType.QueuedConnection)
+
+
+    def historicalData(self, req_id, bar):
+        self.bar_signal.emit(req_id, bar)
+
+
+    @pyqtSlot(int, BarData)
+    def processBar(self, req_id, bar):
+        if bar.volume != 0:
+            self.accumulator.addBar(int(bar.date), bar.open, bar.high, bar.low, bar.close, float(bar.volume))
+
+
+    @pyqtSlot(int)
+    def processEnd(self, req_id):
+        self.finished.emit(len(self.accumulator.toFrame()))
+
+
+class BatchReceiver(QObject):
+
+    bars_signal = pyqtSignal()
+    end_signal = pyqtSignal(int)
+    finished = pyqtSignal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.accumulator = BarAccumulator()
+        self.bar_batcher = BarBatcher(self.bars_signal.emit)
+        self.batch_count = 0
+        self.bars_signal.connect(self.processBatches, Qt.ConnectionType.QueuedConnection)
+        self.end_signal.connect(self.processEnd, Qt.ConnectionType.QueuedConnection)
+
+
+    def historicalData(self, req_id, bar):
+        self.bar_batcher.addBar(req_id, bar)
+
+
+    @pyqtSlot()
+    def processBatches(self):
+        for req_id, rows in self.bar_batcher.drain().items():
+            self.processRows(rows)
+
+
+    def processRows(self, rows):
+        self.batch_count += 1
+        for row in rows:
+            if row[5] != 0:
+                self.accumulator.addBar(*row)
+
+
+    @pyqtSlot(int)
+    def processEnd(self, req_id):
+        self.processRows(self.bar_batcher.drainRequest(req_id))
+        self.finished.emit(len(self.accumulator.toFrame()))
+
+
+def measure(app, receiver_class, bars):
+    worker_thread = QThread()
+    worker_thread.start()
+    receiver = receiver_class()
+    receiver.moveToThread(worker_thread)
+
+    results = dict()
+    def finish(bar_count):
+        results['duration'] = time.perf_counter() - results['start']
+        results['bar_count'] = bar_count
+        app.quit()
+    receiver.finished.connect(finish, Qt.ConnectionType.QueuedConnection)
+
+        #the callback thread of the IB client
+    def feed():
+        results['start'] = time.perf_counter()
+        for bar in bars:
+            receiver.historicalData(REQ_ID, bar)
+        receiver.end_signal.emit(REQ_ID)
+
+    Thread(target=feed, daemon=True).start()
+    app.exec()
+    worker_thread.quit()
+    worker_thread.wait()
+
+    assert results['bar_count'] == BAR_COUNT
+    batches = f", {receiver.batch_count} batches" if hasattr(receiver, 'batch_count') else ""
+    print(f"{receiver_class.__name__:>15}: {results['duration']:6.2f} s, {BAR_COUNT / results['duration']:10,.0f} bars/s{batches}")
+
+
+if __name__ == "__main__":
+    app = QCoreApplication([])
+    bars = createBars()
+    print(f"{BAR_COUNT:,} bars")
+    for receiver_class in [PerBarReceiver, BatchReceiver]:
+        measure(app, receiver_class, bars)
@@ -0,0 +1,99 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Memory of several app processes that read the 5 min bars of the same symbols, when every process loads
+    #the buffers from the archive and when they map the memory-mapped files published by one process.
+    #Reports the proportional set size (shared pages are divided over the processes that map them) and
+    #the private memory per reader, read from /proc so this only runs on linux.
+    #Run from the repository root: python -m benchmarks.sharedBarCache
+
+import tempfile, multiprocessing
+from datetime import datetime
+from pytz import utc
+import numpy as np
+import pandas as pd
+
+from dataHandling.Constants import Constants
+from dataHandling.HistoryManagement.DataBuffer import DataBuffers
+
+
+SYMBOL_COUNT = 200
+BAR_COUNT = 20_000
+READER_COUNTS = [1, 2, 4]
+
+
+def memoryUsage():
+    usage = dict()
+    with open('/proc/self/smaps_rollup', 'r') as file:
+        for line in file:
+            fields = line.split()
+            if fields[0] in ['Pss:', 'Private_Clean:', 'Private_Dirty:']:
+                usage[fields[0][:-1]] = int(fields[1]) / 1024
+    return usage['Pss'], usage['Private_Clean'] + usage['Private_Dirty']
+
+
+def publishBuffers(data_folder):
+    DataBuffers.share_bars = 'publish'
+    data_buffers = DataBuffers(data_folder)
+    rng = np.random.default_rng(0)
+    now = int(datetime.now(utc).timestamp())
+    for uid in range(SYMBOL_COUNT):
+        closes = 100 + np.cumsum(rng.normal(size=BAR_COUNT))
+        frame = pd.DataFrame({Constants.OPEN: closes, Constants.HIGH: closes + 0.5, Constants.LOW: closes - 0.5, Constants.CLOSE: closes, Constants.VOLUME: np.ones(BAR_COUNT)}, index=now - 300 * np.arange(BAR_COUNT)[::-1])
+        data_buffers.setBufferFor(uid, Constants.FIVE_MIN_BAR, frame, req_ranges_list=[(datetime.fromtimestamp(frame.index[0], utc), datetime.fromtimestamp(frame.index[-1], utc))])
+        data_buffers.saveBuffer(uid, Constants.FIVE_MIN_BAR)
+
+
+def readBars(data_folder, share_bars, start_barrier, done_barrier, results):
+    DataBuffers.share_bars = share_bars
+    data_buffers = DataBuffers(data_folder)
+    stock_list = {uid: dict() for uid in range(SYMBOL_COUNT)}
+    data_buffers.loadBuffers(stock_list, bar_types=[Constants.FIVE_MIN_BAR])
+    start_barrier.wait()
+        #every column is read through the snapshot views, so all pages of the bars are resident
+    checksum, read_count = 0, 0
+    for uid in stock_list:
+        if data_buffers.bufferExists(uid, Constants.FIVE_MIN_BAR):
+            snapshot = data_buffers.getSnapshotFor(uid, Constants.FIVE_MIN_BAR)
+            checksum += sum(float(np.nansum(snapshot[column])) for column in snapshot.columns)
+            read_count += 1
+    results.put((read_count, checksum) + memoryUsage())
+    done_barrier.wait()
+
+
+def measure(data_folder, share_bars, reader_count):
+    context = multiprocessing.get_context('spawn')
+    start_barrier, done_barrier, results = context.Barrier(reader_count), context.Barrier(reader_count), context.Queue()
+    readers = [context.Process(target=readBars, args=(data_folder, share_bars, start_barrier, done_barrier, results)) for _ in range(reader_count)]
+    for reader in readers:
+        reader.start()
+    reader_results = [results.get() for _ in readers]
+    for reader in readers:
+        reader.join()
+
+    assert all(result[0] == SYMBOL_COUNT for result in reader_results)
+    pss_total = sum(result[2] for result in reader_results)
+    private_mean = np.mean([result[3] for result in reader_results])
+    print(f"{share_bars or 'load':>5}, {reader_count} readers: {pss_total:8.1f} MB in total, {private_mean:7.1f} MB private per reader")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as temp_folder:
+        data_folder = temp_folder + '/'
+        publishBuffers(data_folder)
+        bar_megabytes = SYMBOL_COUNT * BAR_COUNT * 6 * 8 / 2**20
+        print(f"{SYMBOL_COUNT} symbols with {BAR_COUNT:,} bars, {bar_megabytes:.1f} MB of bars")
+        for share_bars in [None, 'map']:
+            for reader_count in READER_COUNTS:
+                measure(data_folder, share_bars, reader_count)
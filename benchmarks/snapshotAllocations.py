@@ -0,0 +1,80 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Compares the memory allocated by the movers read pattern during one HAS_NEW_DATA cycle
+    #when reading through copying getters versus read-only snapshots.
+    #Run from the repository root: python -m benchmarks.snapshotAllocations
+
+import time, tracemalloc
+import numpy as np
+import pandas as pd
+
+from dataHandling.Constants import Constants, MAIN_BAR_TYPES
+from dataHandling.HistoryManagement.DataBuffer import DataBuffers
+from generalFunctionality.GenFunctions import getLowsHighsCount
+
+
+SYMBOL_COUNT = 500
+BARS_PER_BUFFER = {Constants.FIVE_MIN_BAR: 5_000, Constants.FIFTEEN_MIN_BAR: 3_000, Constants.HOUR_BAR: 1_500, Constants.FOUR_HOUR_BAR: 800, Constants.DAY_BAR: 700}
+MONTH_AGO = 1_700_000_000
+
+
+def fillBuffers(data_buffers):
+    rng = np.random.default_rng(0)
+    for uid in range(SYMBOL_COUNT):
+        for bar_type, bar_count in BARS_PER_BUFFER.items():
+            closes = 100 + np.cumsum(rng.normal(size=bar_count))
+            frame = pd.DataFrame({Constants.OPEN: closes, Constants.HIGH: closes + 0.5, Constants.LOW: closes - 0.5, Constants.CLOSE: closes, Constants.VOLUME: np.ones(bar_count)}, index=MONTH_AGO - 300 * bar_count + 300 * np.arange(bar_count))
+            data_buffers.setBufferFor(uid, bar_type, frame)
+
+
+def copyingCycle(data_buffers):
+    for uid in range(SYMBOL_COUNT):
+        for bar_type in MAIN_BAR_TYPES:
+            getLowsHighsCount(data_buffers.getBufferFor(uid, bar_type))
+        day_frame = data_buffers.getBufferFor(uid, Constants.DAY_BAR)
+        day_frame = day_frame[day_frame.index >= MONTH_AGO - 86400 * 30]
+        day_frame[Constants.HIGH].max(), day_frame[Constants.LOW].min()
+        data_buffers.getBufferFor(uid, Constants.DAY_BAR)[Constants.CLOSE].iloc[-2]
+
+
+def snapshotCycle(data_buffers):
+    for uid in range(SYMBOL_COUNT):
+        for bar_type in MAIN_BAR_TYPES:
+            getLowsHighsCount(data_buffers.getSnapshotFor(uid, bar_type, count=50, columns=[Constants.LOW, Constants.HIGH]), count=50)
+        day_bars = data_buffers.getSnapshotFor(uid, Constants.DAY_BAR, columns=[Constants.LOW, Constants.HIGH])
+        start = day_bars.positionFrom(MONTH_AGO - 86400 * 30)
+        np.nanmax(day_bars[Constants.HIGH][start:]), np.nanmin(day_bars[Constants.LOW][start:])
+        data_buffers.getSnapshotFor(uid, Constants.DAY_BAR, count=2, columns=[Constants.CLOSE])[Constants.CLOSE][-2]
+
+
+def measure(cycle, data_buffers):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    cycle(data_buffers)
+    elapsed = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total_allocated = sum(stat.size for stat in snapshot.statistics('filename'))
+    return elapsed, peak, total_allocated
+
+
+if __name__ == "__main__":
+    data_buffers = DataBuffers(Constants.BUFFER_FOLDER)
+    fillBuffers(data_buffers)
+
+    for name, cycle in [('copying getters', copyingCycle), ('snapshots', snapshotCycle)]:
+        elapsed, peak, retained = measure(cycle, data_buffers)
+        print(f"{name:>16}: {elapsed*1000:8.1f} ms per cycle, peak traced {peak/1e6:8.2f} MB, retained {retained/1e6:6.2f} MB")
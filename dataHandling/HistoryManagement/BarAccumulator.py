@@ -0,0 +1,72 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+import numpy as np
+import pandas as pd
+from pytz import utc
+
+from dataHandling.Constants import Constants
+
+
+class BarAccumulator:
+    """
+    Collects the bars of one request in growable arrays, which are turned into a frame once the request
+    completes. Bars are keyed by the integer form of their IB date: epoch seconds for intraday bars and
+    YYYYMMDD for day bars, which are converted all at once. A bar with the key of the one before replaces
+    it, like the revisions of the last bar of a request that keeps up to date.
+    """
+
+    def __init__(self):
+        self.keys = array('q')
+        self.columns = [array('d') for _ in range(5)]
+        self._ordered = True
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def addBar(self, key, open_value, high, low, close, volume):
+        values = (open_value, high, low, close, volume)
+        if len(self.keys) > 0 and key <= self.keys[-1]:
+            if key == self.keys[-1]:
+                for column, value in zip(self.columns, values):
+                    column[-1] = value
+                return
+            self._ordered = False
+
+        self.keys.append(key)
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+
+    def toFrame(self, day_time_zone=None):
+            #with a time zone the keys are dates, which become the epoch seconds of midnight in that zone
+        keys = np.frombuffer(self.keys, dtype=np.int64) if len(self.keys) > 0 else np.empty(0, dtype=np.int64)
+        values = [np.frombuffer(column, dtype=np.float64) if len(column) > 0 else np.empty(0) for column in self.columns]
+        if not self._ordered:
+                #the last bar with a key wins, as with the frame insertion this replaces
+            reversed_keys = keys[::-1]
+            _, last_positions = np.unique(reversed_keys, return_index=True)
+            positions = len(keys) - 1 - last_positions
+            keys = keys[positions]
+            values = [column[positions] for column in values]
+
+        if day_time_zone is not None and len(keys) > 0:
+            dates = pd.to_datetime(keys.astype(str), format="%Y%m%d").tz_localize(day_time_zone)
+            keys = dates.tz_convert(utc).asi8 // 10**9
+
+        columns = [Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME]
+        return pd.DataFrame({name: np.array(column) for name, column in zip(columns, values)}, index=np.array(keys, dtype=np.int64))
@@ -0,0 +1,173 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Aggregation of bars into bars of a higher order on int64 epoch timestamps, without datetime objects.
+    #New York time is derived from the US daylight saving rules, those since 2007 and the ones before.
+
+from functools import lru_cache
+import numpy as np
+
+from dataHandling.Constants import Constants, RESAMPLING_SECONDS
+
+
+EST_OFFSET = -5 * 3600
+EDT_OFFSET = -4 * 3600
+SESSION_START = 9 * 3600 + 30 * 60
+    #day bars take the bars from 9:30 through the one starting at 15:59
+SESSION_LAST = 15 * 3600 + 59 * 60
+
+
+def sundayOnOrAfter(days):
+        #days since epoch, 1970-01-01 was a Thursday
+    return days + (3 - days) % 7
+
+
+def newYorkOffsets(timestamps):
+        #the utc offset in seconds of New York time at every timestamp
+    years = timestamps.astype('datetime64[s]').astype('datetime64[Y]')
+    unique_years, year_index = np.unique(years, return_inverse=True)
+    months = unique_years.astype('datetime64[M]')
+    since_2007 = unique_years.astype(np.int64) >= 2007 - 1970
+    def firstDayOf(month_offset):
+        return (months + month_offset).astype('datetime64[D]').astype(np.int64)
+
+        #since 2007 from the second sunday of march through the first sunday of november,
+        #before from the first sunday of april through the last sunday of october. Both at 2:00 local time
+    start_days = np.where(since_2007, sundayOnOrAfter(firstDayOf(2)) + 7, sundayOnOrAfter(firstDayOf(3)))
+    end_days = np.where(since_2007, sundayOnOrAfter(firstDayOf(10)), sundayOnOrAfter(firstDayOf(9) + 24))
+    dst_start = start_days * 86400 + 2 * 3600 - EST_OFFSET
+    dst_end = end_days * 86400 + 2 * 3600 - EDT_OFFSET
+    in_dst = (timestamps >= dst_start[year_index.ravel()]) & (timestamps < dst_end[year_index.ravel()])
+    return np.where(in_dst, EDT_OFFSET, EST_OFFSET)
+
+
+def bucketLabels(timestamps, to_bar_type):
+    """
+    The label of the bar of to_bar_type that every timestamp falls in, and a mask of the timestamps that
+    count. Intraday bars are anchored to BASE_TIMESTAMP_NY, 4 hour bars to New York midnight and day bars
+    take the regular session only and are labeled New York midnight
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if to_bar_type == Constants.FOUR_HOUR_BAR or to_bar_type == Constants.DAY_BAR:
+        offsets = newYorkOffsets(timestamps)
+        local_times = timestamps + offsets
+        seconds = RESAMPLING_SECONDS[to_bar_type]
+        local_labels = (local_times // seconds) * seconds
+            #the label takes the offset at its own time, which differs from the bar's on the daylight saving sundays
+        labels = local_labels - newYorkOffsets(local_labels - offsets)
+        if to_bar_type == Constants.DAY_BAR:
+            time_of_day = local_times % 86400
+            return labels, (time_of_day >= SESSION_START) & (time_of_day <= SESSION_LAST)
+        return labels, None
+    else:
+        seconds = RESAMPLING_SECONDS[to_bar_type]
+        return ((timestamps - Constants.BASE_TIMESTAMP_NY) // seconds) * seconds + Constants.BASE_TIMESTAMP_NY, None
+
+
+def aggregateBars(timestamps, opens, highs, lows, closes, volumes, to_bar_type):
+    """
+    Aggregates sorted bars into bars of to_bar_type. Returns the labels and the open, high, low, close
+    and volume arrays of the new bars. As before, bars with a NaN in any of their values are left out
+    """
+    labels, mask = bucketLabels(timestamps, to_bar_type)
+    columns = [np.asarray(values, dtype=np.float64) for values in (opens, highs, lows, closes, volumes)]
+    if mask is not None:
+        labels = labels[mask]
+        columns = [values[mask] for values in columns]
+
+    if len(labels) == 0:
+        return labels, tuple(np.empty(0) for _ in range(5))
+
+    starts = np.concatenate(([0], np.flatnonzero(labels[1:] != labels[:-1]) + 1))
+    ends = np.concatenate((starts[1:], [len(labels)])) - 1
+    opens, highs, lows, closes, volumes = columns
+    bars = (opens[starts], np.fmax.reduceat(highs, starts), np.fmin.reduceat(lows, starts), closes[ends], np.add.reduceat(np.nan_to_num(volumes), starts))
+
+    complete = ~np.any(np.isnan(np.vstack(bars)), axis=0)
+    return labels[starts][complete], tuple(values[complete] for values in bars)
+
+
+@lru_cache(maxsize=64)
+def daylightSavingBounds(year):
+    timestamps = np.array([np.datetime64(str(year), 's').astype(np.int64)])
+    offsets = newYorkOffsets(timestamps + np.arange(0, 366 * 86400, 3600))
+    switches = np.flatnonzero(offsets[1:] != offsets[:-1]) + 1
+    return tuple(int(timestamps[0] + 3600 * switch) for switch in switches)
+
+
+def newYorkOffset(timestamp):
+        #the scalar version of newYorkOffsets, for the live path
+    dst_start, dst_end = daylightSavingBounds(int(np.datetime64(int(timestamp), 's').astype('datetime64[Y]').astype(np.int64)) + 1970)
+    return EDT_OFFSET if dst_start <= timestamp < dst_end else EST_OFFSET
+
+
+def bucketLabel(timestamp, to_bar_type):
+        #the label of a single timestamp, None when it falls outside the bars of to_bar_type
+    seconds = RESAMPLING_SECONDS[to_bar_type]
+    if to_bar_type == Constants.FOUR_HOUR_BAR or to_bar_type == Constants.DAY_BAR:
+        offset = newYorkOffset(timestamp)
+        local_time = timestamp + offset
+        if to_bar_type == Constants.DAY_BAR and not (SESSION_START <= local_time % 86400 <= SESSION_LAST):
+            return None
+        local_label = (local_time // seconds) * seconds
+        return local_label - newYorkOffset(local_label - offset)
+    return ((timestamp - Constants.BASE_TIMESTAMP_NY) // seconds) * seconds + Constants.BASE_TIMESTAMP_NY
+
+
+class BucketState:
+    """
+    Running accumulators of the last bar of a higher order, built from the bars that fall in it. The last
+    of those bars may still be revised, so it is kept apart from the accumulated open, high, low and volume
+    of the ones before it. Every bar is a tuple of open, high, low, close and volume.
+    """
+
+    __slots__ = ('label', 'base', 'last_timestamp', 'last_bar')
+
+    def __init__(self, label, base, last_timestamp, last_bar):
+        self.label = label
+        self.base = base
+        self.last_timestamp = last_timestamp
+        self.last_bar = last_bar
+
+
+    @classmethod
+    def fromBars(cls, label, timestamps, bars):
+            #bars holds the open, high, low, close and volume arrays of the bars in the bucket
+        opens, highs, lows, _, volumes = bars
+        base = None
+        if len(timestamps) > 1:
+            base = (opens[0], np.nanmax(highs[:-1]), np.nanmin(lows[:-1]), np.nansum(volumes[:-1]))
+        return cls(label, base, int(timestamps[-1]), tuple(values[-1] for values in bars))
+
+
+    def update(self, timestamp, bar):
+            #takes in a new or revised last bar, returns False when it comes before the last bar
+        if timestamp < self.last_timestamp:
+            return False
+        if timestamp > self.last_timestamp:
+            open_value, high, low, _, volume = self.combined()
+            self.base = (open_value, high, low, volume)
+            self.last_timestamp = timestamp
+        self.last_bar = bar
+        return True
+
+
+    def combined(self):
+        if self.base is None:
+            open_value, high, low, close, volume = self.last_bar
+            return (open_value, high, low, close, volume if volume == volume else 0.0)
+        open_value, high, low, volume = self.base
+        _, last_high, last_low, last_close, last_volume = self.last_bar
+            #like the reductions, NaNs are skipped in the high, low and volume
+        return (open_value, np.fmax(high, last_high), np.fmin(low, last_low), last_close, volume + (last_volume if last_volume == last_volume else 0.0))
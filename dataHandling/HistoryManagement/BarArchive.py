@@ -0,0 +1,253 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os, json, tempfile
+from datetime import datetime
+from threading import Lock
+import numpy as np
+import pandas as pd
+try:
+    import fcntl
+except ImportError:
+        #no advisory file locks (windows), saves are then only serialized within the process
+    fcntl = None
+
+from dataHandling.Constants import Constants, MINUTES_PER_BAR
+from dataHandling.HistoryManagement.RangeObject import RangeObject
+
+
+def writeAtomically(file_name, write_function):
+        #readers never see a half written file, the old one stays until the new one is complete. Every write
+        #gets its own temp file, so concurrent writers don't write into each other's
+    file_descriptor, temp_name = tempfile.mkstemp(dir=os.path.dirname(file_name) or '.', prefix=os.path.basename(file_name) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as file:
+            write_function(file)
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+def toTimestamp(date_value):
+    if isinstance(date_value, datetime):
+        return int(date_value.timestamp())
+    return int(date_value)
+
+
+class BarArchive:
+    """
+    On disk store for the bars of DataBuffers. Every (uid, bar_type) gets a folder with one .npy block of
+    timestamps and bar columns per month (per year for daily and longer bars), and a meta.json with the
+    requested ranges and the first/last timestamp and columns of every partition. A save only rewrites
+    the partitions from the first changed bar onward, and a load can be limited to a date range.
+    """
+
+    meta_file = 'meta.json'
+    lock_file = 'archive.lock'
+        #(modification time, metadata) by folder, shared like the buffers of DataBuffers are. The metadata is
+        #never changed in place, a save swaps in a changed copy once it is written
+    _metas = dict()
+        #saves and loads of a folder take its lock, which covers the threads of the process and, through a
+        #file lock, other processes
+    _folder_locks = dict()
+    _lock_files = dict()
+    _folder_locks_lock = Lock()
+
+    def __init__(self, data_folder):
+        self.data_folder = data_folder
+
+
+    def folderFor(self, uid, bar_type):
+        return os.path.join(self.data_folder, 'bars', str(uid), bar_type)
+
+
+    def exists(self, uid, bar_type):
+        folder = self.folderFor(uid, bar_type)
+        return folder in self._metas or os.path.exists(os.path.join(folder, self.meta_file))
+
+
+    def lockFolder(self, folder):
+        with self._folder_locks_lock:
+            if not (folder in self._folder_locks):
+                self._folder_locks[folder] = Lock()
+            folder_lock = self._folder_locks[folder]
+
+        folder_lock.acquire()
+        if fcntl is not None:
+            try:
+                lock_file = open(os.path.join(folder, self.lock_file), 'a')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            except BaseException:
+                folder_lock.release()
+                raise
+            self._lock_files[folder] = lock_file
+
+
+    def unlockFolder(self, folder):
+            #closing the file releases the file lock
+        lock_file = self._lock_files.pop(folder, None)
+        if lock_file is not None:
+            lock_file.close()
+        self._folder_locks[folder].release()
+
+
+    def partitionUnit(self, bar_type):
+        return 'M' if MINUTES_PER_BAR[bar_type] < MINUTES_PER_BAR[Constants.DAY_BAR] else 'Y'
+
+
+    def partitionBounds(self, bar_type, timestamps):
+            #the (key, start, stop) rows of every partition in a sorted timestamp array
+        partitions = np.asarray(timestamps, dtype='datetime64[s]').astype(f'datetime64[{self.partitionUnit(bar_type)}]')
+        boundaries = np.flatnonzero(partitions[1:] != partitions[:-1]) + 1
+        starts = np.concatenate(([0], boundaries))
+        stops = np.concatenate((boundaries, [len(partitions)]))
+        return [(str(partitions[start]), start, stop) for start, stop in zip(starts, stops)]
+
+
+    def partitionStart(self, bar_type, timestamp):
+            #the first timestamp of the partition that contains the given one
+        partition = np.datetime64(int(timestamp), 's').astype(f'datetime64[{self.partitionUnit(bar_type)}]')
+        return int(partition.astype('datetime64[s]').astype(np.int64))
+
+    ###### metadata
+
+    def readMeta(self, uid, bar_type):
+            #kept between reads, and read again when another process wrote it since
+        folder = self.folderFor(uid, bar_type)
+        meta_path = os.path.join(folder, self.meta_file)
+        modification_time = os.stat(meta_path).st_mtime_ns
+        if not (folder in self._metas) or self._metas[folder][0] != modification_time:
+            with open(meta_path, 'r') as file:
+                self._metas[folder] = (modification_time, json.load(file))
+        return self._metas[folder][1]
+
+
+    def writeMeta(self, uid, bar_type, meta):
+        meta_path = os.path.join(self.folderFor(uid, bar_type), self.meta_file)
+        meta_string = json.dumps(meta).encode()
+        writeAtomically(meta_path, lambda file: file.write(meta_string))
+        self._metas[self.folderFor(uid, bar_type)] = (os.stat(meta_path).st_mtime_ns, meta)
+
+    ###### saving
+
+    def save(self, uid, bar_type, frame, requested_ranges, partial=False):
+        """
+        Writes the bars in frame, which must run from the start of a partition through the last bar of
+        the buffer. Partitions with bars in the frame are replaced, older ones are left untouched.
+        requested_ranges are epoch second pairs as given by RangeObject.serialize. A partial buffer,
+        one that was loaded for a date range, is merged into the stored partitions and ranges instead,
+        as it lacks the bars and ranges outside that window
+        """
+        folder = self.folderFor(uid, bar_type)
+        os.makedirs(folder, exist_ok=True)
+        self.lockFolder(folder)
+        try:
+            self.saveLocked(uid, bar_type, frame, requested_ranges, partial)
+        finally:
+            self.unlockFolder(folder)
+
+
+    def saveLocked(self, uid, bar_type, frame, requested_ranges, partial):
+            #the metadata is read again under the folder lock, so saves of other threads and processes are kept
+        folder = self.folderFor(uid, bar_type)
+        stored_meta = self.readMeta(uid, bar_type) if os.path.exists(os.path.join(folder, self.meta_file)) else {'partitions': dict()}
+        meta = {**stored_meta, 'partitions': dict(stored_meta['partitions'])}
+
+        if partial and len(frame) > 0:
+                #incoming bars win unless they are NaN, as when they are merged into a buffer
+            stored_keys = [key for key, _, _ in self.partitionBounds(bar_type, frame.index.to_numpy(dtype=np.int64)) if key in meta['partitions']]
+            stored_bars = self.readPartitions(uid, bar_type, [(key, meta['partitions'][key]) for key in stored_keys])
+            frame = frame.combine_first(stored_bars)
+
+        if len(frame) > 0:
+            timestamps = frame.index.to_numpy(dtype=np.int64)
+            columns = list(frame.columns)
+                #one float64 block per partition, timestamps first. Epoch seconds are exact in a float64
+            block = np.column_stack([timestamps.astype(np.float64), frame.to_numpy(dtype=np.float64, na_value=np.nan)])
+            partition_bounds = self.partitionBounds(bar_type, timestamps)
+            for key, start, stop in partition_bounds:
+                writeAtomically(os.path.join(folder, key + '.npy'), lambda file: np.save(file, block[start:stop]))
+                meta['partitions'][key] = [int(timestamps[start]), int(timestamps[stop-1]), columns]
+
+            #the partitions after the last bar were written by an older save and are outdated now, unless
+            #the buffer only holds a window of the stored bars. Their files go once the metadata is written
+        outdated_keys = []
+        if len(frame) > 0 and not partial:
+            last_key = partition_bounds[-1][0]
+            outdated_keys = [key for key in meta['partitions'] if key > last_key]
+            for key in outdated_keys:
+                del meta['partitions'][key]
+
+        if partial:
+            stored_ranges = RangeObject.rangesFromSerialized(meta.get('requested_ranges', []))
+            requested_ranges = RangeObject(stored_ranges + RangeObject.rangesFromSerialized(requested_ranges)).serialize()
+        meta['requested_ranges'] = [list(rng) for rng in requested_ranges]
+        self.writeMeta(uid, bar_type, meta)
+        for key in outdated_keys:
+            os.remove(os.path.join(folder, key + '.npy'))
+
+    ###### loading
+
+    def load(self, uid, bar_type, date_range=None):
+        """
+        Returns the stored bars and requested ranges. With a date_range only the partitions that
+        overlap it are read and the requested ranges are clipped to it, so they never claim bars
+        that were not loaded
+        """
+        folder = self.folderFor(uid, bar_type)
+        self.lockFolder(folder)
+        try:
+            meta = self.readMeta(uid, bar_type)
+            partitions = sorted(meta['partitions'].items())
+            requested_ranges = meta['requested_ranges']
+            if date_range is not None:
+                range_start, range_end = toTimestamp(date_range[0]), toTimestamp(date_range[1])
+                partitions = [(key, (first, last, columns)) for key, (first, last, columns) in partitions if last >= range_start and first <= range_end]
+                requested_ranges = [(max(start, range_start), min(end, range_end)) for start, end in requested_ranges if end >= range_start and start <= range_end]
+            bars = self.readPartitions(uid, bar_type, partitions)
+        finally:
+            self.unlockFolder(folder)
+
+        return bars, RangeObject.rangesFromSerialized(requested_ranges)
+
+
+    def readPartitions(self, uid, bar_type, partitions):
+            #the bars of (key, (first, last, columns)) partitions in order as one frame
+        if len(partitions) == 0:
+            return pd.DataFrame()
+
+        blocks = [np.load(os.path.join(self.folderFor(uid, bar_type), key + '.npy')) for key, _ in partitions]
+        all_columns = list(dict.fromkeys(column for _, (_, _, columns) in partitions for column in columns))
+        if all(columns == all_columns for _, (_, _, columns) in partitions):
+            values = np.concatenate(blocks)
+        else:
+                #columns were added along the way, older partitions get NaNs for them
+            values = np.full((sum(len(block) for block in blocks), 1 + len(all_columns)), np.nan)
+            row = 0
+            for block, (_, (_, _, columns)) in zip(blocks, partitions):
+                values[row:row+len(block), [0] + [1 + all_columns.index(column) for column in columns]] = block
+                row += len(block)
+
+        return pd.DataFrame(values[:, 1:], columns=all_columns, index=pd.Index(values[:, 0].astype(np.int64)))
+
+    ###### migration
+
+    def migratePickle(self, uid, bar_type, pickle_file):
+            #moves a buffer saved by the pickle based versions into the archive, the pickle is left in place
+        existing_buffer = pd.read_pickle(pickle_file)
+        requested_ranges = RangeObject(RangeObject.rangesFromSerialized(existing_buffer.attrs.get('requested_ranges', []))).serialize()
+        existing_buffer.attrs = dict()
+        self.save(uid, bar_type, existing_buffer.sort_index(), requested_ranges)
@@ -0,0 +1,58 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from threading import Lock
+
+
+class BarBatcher:
+    """
+    Collects the bars of the IB callback thread per req_id, already parsed into tuples of the integer
+    date, open, high, low, close and volume. notify_function is called for the first bar after every
+    drain only, so the thread that drains gets one event for all bars that came in meanwhile rather than
+    one per bar.
+    """
+
+    def __init__(self, notify_function):
+        self.notify_function = notify_function
+        self._lock = Lock()
+        self._batches = dict()
+        self._notified = False
+
+
+    def addBar(self, req_id, bar):
+        row = (int(bar.date), bar.open, bar.high, bar.low, bar.close, float(bar.volume))
+        with self._lock:
+            if req_id in self._batches:
+                self._batches[req_id].append(row)
+            else:
+                self._batches[req_id] = [row]
+            notify = not self._notified
+            self._notified = True
+
+        if notify:
+            self.notify_function()
+
+
+    def drain(self):
+            #all bars collected since the last drain by req_id, in order of arrival
+        with self._lock:
+            batches = self._batches
+            self._batches = dict()
+            self._notified = False
+        return batches
+
+
+    def drainRequest(self, req_id):
+        with self._lock:
+            return self._batches.pop(req_id, [])
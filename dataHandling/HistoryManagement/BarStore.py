@@ -0,0 +1,439 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pandas as pd
+
+from dataHandling.Constants import Constants
+
+
+BAR_COLUMNS = [Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME]
+
+
+def readOnlyView(array):
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+class BarSnapshot:
+    """
+    Read-only NumPy views on the bars of a store, taken under the read lock. No data is copied.
+    Rows appended later are not visible, but a revision of an existing row (typically the last,
+    incomplete bar) is written in place and will show up. Compare `version` against
+    DataBuffers.getVersionFor when a consistent picture across calls matters.
+    """
+
+    def __init__(self, timestamps, columns, version):
+        self.index = readOnlyView(timestamps)
+        self._columns = {column: readOnlyView(values) for column, values in columns.items()}
+        self.version = version
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def __getitem__(self, column):
+        return self._columns[column]
+
+
+    def __contains__(self, column):
+        return column in self._columns
+
+
+    @property
+    def columns(self):
+        return list(self._columns.keys())
+
+
+    @property
+    def empty(self):
+        return len(self.index) == 0
+
+
+    def positionFrom(self, label):
+        return int(np.searchsorted(self.index, label, side='left'))
+
+
+    def toFrame(self):
+        return pd.DataFrame({column: values.copy() for column, values in self._columns.items()}, index=pd.Index(self.index.copy()))
+
+
+class FrameBarStore:
+    """
+    Keeps the bars for one (uid, bar_type) as a pandas DataFrame indexed by int timestamps.
+    This is the original storage of DataBuffers and is kept as a reference backend.
+    """
+
+    def __init__(self, frame):
+        self._frame = frame
+        self._version = 0
+
+
+    @classmethod
+    def fromFrame(cls, frame):
+        return cls(frame)
+
+
+    def __len__(self):
+        return len(self._frame)
+
+
+    @property
+    def version(self):
+        return self._version
+
+
+    def merge(self, new_data):
+        self._version += 1
+        if len(new_data) < 3:
+            for idx, row in new_data.iterrows():
+                self._frame.loc[idx, row.keys()] = row
+        else:
+            self._frame = new_data.combine_first(self._frame)
+
+
+    def mergeBar(self, timestamp, bar):
+        self.merge(pd.DataFrame([bar], index=[timestamp]))
+
+
+    def toFrame(self, start=None, stop=None, columns=None):
+        frame = self._frame.iloc[start:stop]
+        if columns is not None:
+            frame = frame[[column for column in columns if column in frame.columns]]
+        return frame.copy()
+
+
+    def fromLabel(self, label, columns=None):
+        frame = self._frame.loc[label:]
+        if columns is not None:
+            frame = frame[[column for column in columns if column in frame.columns]]
+        return frame.copy()
+
+
+    def snapshot(self, start=None, columns=None):
+        if columns is None:
+            columns = self._frame.columns
+        frame = self._frame.iloc[start:]
+        column_views = {column: frame[column].to_numpy() for column in columns if column in frame.columns}
+        return BarSnapshot(frame.index.to_numpy(), column_views, self._version)
+
+
+    def rowAt(self, pos):
+        return self._frame.iloc[pos].copy()
+
+
+    def valueAt(self, pos, column):
+        return self._frame.iloc[pos][column]
+
+
+    def labelAt(self, pos):
+        return self._frame.index[pos]
+
+
+    def containsLabel(self, label):
+        return label in self._frame.index
+
+
+    def getIndices(self):
+        return self._frame.index
+
+
+    def hasColumn(self, column):
+        return column in self._frame.columns
+
+
+    def getColumns(self):
+        return list(self._frame.columns)
+
+
+    def columnFor(self, column):
+        if column in self._frame:
+            return self._frame[column].copy()
+        return None
+
+
+    def valuesForLabels(self, column, labels):
+        return self._frame.loc[labels, column].values
+
+
+    def setValuesForLabels(self, column, labels, values):
+        self._version += 1
+        self._frame.loc[labels, column] = values
+
+
+
+class ColumnarBarStore:
+    """
+    Keeps the bars for one (uid, bar_type) in preallocated NumPy arrays, one float64 array per column
+    and a sorted int64 timestamp array. Arrays grow geometrically, so appending a bar is amortized O(1),
+    a revision of the last bar is written in place and lookups by time are a binary search.
+    Merging follows DataFrame.combine_first: incoming values win unless they are NaN.
+    """
+
+    min_capacity = 256
+    growth_factor = 1.5
+
+
+    def __init__(self, capacity=None):
+        self._capacity = max(self.min_capacity, capacity or 0)
+        self._size = 0
+        self._version = 0
+        self._timestamps = np.empty(self._capacity, dtype=np.int64)
+        self._columns = {column: self.emptyColumn() for column in BAR_COLUMNS}
+
+
+    @classmethod
+    def fromFrame(cls, frame):
+        store = cls(capacity=int(len(frame) * cls.growth_factor))
+        store.merge(frame)
+        return store
+
+
+    @classmethod
+    def fromSnapshot(cls, snapshot):
+            #a read-only store around the views of a snapshot, without copying them
+        store = cls.__new__(cls)
+        store._capacity = store._size = len(snapshot)
+        store._version = snapshot.version
+        store._timestamps = snapshot.index
+        store._columns = {column: snapshot[column] for column in snapshot.columns}
+        return store
+
+
+    def __len__(self):
+        return self._size
+
+
+    @property
+    def version(self):
+        return self._version
+
+
+    def emptyColumn(self):
+        return np.full(self._capacity, np.nan, dtype=np.float64)
+
+
+    def addColumn(self, column):
+        if column not in self._columns:
+            self._columns[column] = self.emptyColumn()
+
+
+    def ensureCapacity(self, required):
+        if required > self._capacity:
+            new_capacity = max(required, int(self._capacity * self.growth_factor))
+            self._timestamps = self.resized(self._timestamps, new_capacity, 0)
+            for column in self._columns:
+                self._columns[column] = self.resized(self._columns[column], new_capacity, np.nan)
+            self._capacity = new_capacity
+
+
+    def resized(self, array, new_capacity, fill_value):
+        new_array = np.full(new_capacity, fill_value, dtype=array.dtype)
+        new_array[:self._size] = array[:self._size]
+        return new_array
+
+    ###### writing
+
+    def merge(self, new_data):
+        if len(new_data) == 0:
+            return
+
+        self._version += 1
+        timestamps = new_data.index.to_numpy(dtype=np.int64)
+        columns = list(new_data.columns)
+        values = new_data.to_numpy(dtype=np.float64, na_value=np.nan)
+
+            #bars normally arrive in order, but we don't want to rely on it
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            order = np.argsort(timestamps, kind='stable')
+            timestamps = timestamps[order]
+            values = values[order]
+
+        for column in columns:
+            self.addColumn(column)
+
+        if self._size == 0 or timestamps[0] >= self._timestamps[self._size-1]:
+            self.mergeAtEnd(timestamps, columns, values)
+        else:
+            self.mergeInterleaved(timestamps, columns, values)
+
+
+    def mergeBar(self, timestamp, bar):
+            #a single bar as a dict by column, without going through a DataFrame
+        self._version += 1
+        columns = list(bar.keys())
+        for column in columns:
+            self.addColumn(column)
+
+        timestamps = np.array([timestamp], dtype=np.int64)
+        values = np.array([list(bar.values())], dtype=np.float64)
+        if self._size == 0 or timestamp >= self._timestamps[self._size-1]:
+            self.mergeAtEnd(timestamps, columns, values)
+        else:
+            self.mergeInterleaved(timestamps, columns, values)
+
+
+    def mergeAtEnd(self, timestamps, columns, values):
+        start = 0
+        if self._size > 0 and timestamps[0] == self._timestamps[self._size-1]:
+                #the most common live case: the last (incomplete) bar got revised
+            self.overwriteRows(np.array([self._size-1]), columns, values[:1])
+            start = 1
+
+        new_count = len(timestamps) - start
+        if new_count > 0:
+            self.ensureCapacity(self._size + new_count)
+            self._timestamps[self._size:self._size+new_count] = timestamps[start:]
+            for col_index, column in enumerate(columns):
+                self._columns[column][self._size:self._size+new_count] = values[start:, col_index]
+            for column in self._columns.keys() - set(columns):
+                self._columns[column][self._size:self._size+new_count] = np.nan
+            self._size += new_count
+
+
+    def mergeInterleaved(self, timestamps, columns, values):
+        current_stamps = self._timestamps[:self._size]
+        positions = np.searchsorted(current_stamps, timestamps)
+        existing = (positions < self._size) & (current_stamps[np.minimum(positions, self._size-1)] == timestamps)
+
+        if np.any(existing):
+            self.overwriteRows(positions[existing], columns, values[existing])
+
+        new_mask = ~existing
+        new_count = int(np.count_nonzero(new_mask))
+        if new_count > 0:
+            new_stamps = timestamps[new_mask]
+            new_values = values[new_mask]
+            merged_size = self._size + new_count
+
+                #every row moves forward by the number of rows inserted before it
+            new_destinations = positions[new_mask] + np.arange(new_count)
+            old_destinations = np.arange(self._size) + np.searchsorted(new_stamps, current_stamps)
+
+            capacity = max(self._capacity, int(merged_size * self.growth_factor))
+            merged_stamps = np.empty(capacity, dtype=np.int64)
+            merged_stamps[old_destinations] = current_stamps
+            merged_stamps[new_destinations] = new_stamps
+
+            for column in self._columns:
+                merged_column = np.full(capacity, np.nan, dtype=np.float64)
+                merged_column[old_destinations] = self._columns[column][:self._size]
+                if column in columns:
+                    merged_column[new_destinations] = new_values[:, columns.index(column)]
+                self._columns[column] = merged_column
+
+            self._timestamps = merged_stamps
+            self._capacity = capacity
+            self._size = merged_size
+
+
+    def overwriteRows(self, positions, columns, values):
+        for col_index, column in enumerate(columns):
+            column_values = values[:, col_index]
+            valid = ~np.isnan(column_values)
+            self._columns[column][positions[valid]] = column_values[valid]
+
+    ###### reading
+
+    def positionOf(self, label):
+        pos = int(np.searchsorted(self._timestamps[:self._size], label))
+        if pos < self._size and self._timestamps[pos] == label:
+            return pos
+        raise KeyError(label)
+
+
+    def positionsOf(self, labels):
+        labels = np.asarray(labels, dtype=np.int64)
+        positions = np.searchsorted(self._timestamps[:self._size], labels)
+        found = (positions < self._size) & (self._timestamps[np.minimum(positions, max(self._size-1, 0))] == labels)
+        if not np.all(found):
+            raise KeyError(labels[~found].tolist())
+        return positions
+
+
+    def toFrame(self, start=None, stop=None, columns=None):
+        if columns is None:
+            columns = self._columns.keys()
+        selection = slice(start, stop)
+        data = {column: self._columns[column][:self._size][selection].copy() for column in columns if column in self._columns}
+        return pd.DataFrame(data, index=pd.Index(self._timestamps[:self._size][selection].copy()))
+
+
+    def fromLabel(self, label, columns=None):
+        pos = int(np.searchsorted(self._timestamps[:self._size], label, side='left'))
+        return self.toFrame(start=pos, columns=columns)
+
+
+    def snapshot(self, start=None, columns=None):
+        if columns is None:
+            columns = self._columns.keys()
+        selection = slice(start, None)
+        column_views = {column: self._columns[column][:self._size][selection] for column in columns if column in self._columns}
+        return BarSnapshot(self._timestamps[:self._size][selection], column_views, self._version)
+
+
+    def rowAt(self, pos):
+        pos = range(self._size)[pos]
+        return pd.Series({column: values[pos] for column, values in self._columns.items()}, name=self._timestamps[pos])
+
+
+    def valueAt(self, pos, column):
+        return self._columns[column][:self._size][pos]
+
+
+    def labelAt(self, pos):
+        return self._timestamps[:self._size][pos]
+
+
+    def containsLabel(self, label):
+        try:
+            self.positionOf(label)
+            return True
+        except KeyError:
+            return False
+
+
+    def getIndices(self):
+        return pd.Index(self._timestamps[:self._size].copy())
+
+
+    def hasColumn(self, column):
+        return column in self._columns
+
+
+    def getColumns(self):
+        return list(self._columns.keys())
+
+
+    def columnFor(self, column):
+        if column in self._columns:
+            return pd.Series(self._columns[column][:self._size].copy(), index=self.getIndices(), name=column)
+        return None
+
+
+    def valuesForLabels(self, column, labels):
+        if np.ndim(labels) == 0:
+            return self._columns[column][self.positionOf(labels)]
+        return self._columns[column][self.positionsOf(labels)]
+
+
+    def setValuesForLabels(self, column, labels, values):
+        self._version += 1
+        self.addColumn(column)
+        if np.ndim(labels) == 0:
+            self._columns[column][self.positionOf(labels)] = values
+        else:
+            self._columns[column][self.positionsOf(labels)] = values
@@ -0,0 +1,110 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from threading import Thread, Condition
+
+
+class BufferLoader:
+    """
+    Prefetches buffers from disk on a background thread, one uid (all its bar types) at a time in the
+    order they were queued. Uids can be moved to the front, e.g. the rows that are on screen. Loading
+    itself goes through load_function, which also serves buffers that are accessed before their turn.
+    progress_function gets the uids loaded since its last call, the number loaded and the total queued,
+    at most every progress_interval seconds and once the queue is empty.
+    """
+
+    def __init__(self, load_function, progress_function, progress_interval=0.25):
+        self.load_function = load_function
+        self.progress_function = progress_function
+        self.progress_interval = progress_interval
+
+            #bar types to load by uid, in loading order
+        self._queue = dict()
+        self._condition = Condition()
+        self._running = True
+        self._loaded_count = 0
+        self._total_count = 0
+
+        self._thread = Thread(target=self.run, name="BufferLoader", daemon=True)
+        self._thread.start()
+
+
+    def enqueue(self, uids, bar_types):
+        with self._condition:
+            for uid in uids:
+                if uid in self._queue:
+                    self._queue[uid] = list(dict.fromkeys(self._queue[uid] + list(bar_types)))
+                else:
+                    self._queue[uid] = list(bar_types)
+                    self._total_count += 1
+            self._condition.notify_all()
+
+
+    def prioritize(self, uids):
+            #queued uids in the given order go before all others
+        with self._condition:
+            prioritized = {uid: self._queue[uid] for uid in uids if uid in self._queue}
+            self._queue = {**prioritized, **{uid: bar_types for uid, bar_types in self._queue.items() if not (uid in prioritized)}}
+
+
+    def discard(self, uid):
+        with self._condition:
+            if self._queue.pop(uid, None) is not None:
+                self._total_count -= 1
+
+
+    def queueDepth(self):
+        with self._condition:
+            return len(self._queue)
+
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._queue = dict()
+            self._condition.notify_all()
+        self._thread.join()
+
+    ###### worker thread
+
+    def run(self):
+        loaded_uids = []
+        last_report = time.monotonic()
+        while True:
+            with self._condition:
+                while self._running and len(self._queue) == 0:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                uid = next(iter(self._queue))
+                bar_types = self._queue.pop(uid)
+
+            for bar_type in bar_types:
+                try:
+                    self.load_function(uid, bar_type)
+                except Exception as inst:
+                    print(f"BufferLoader.run failed to load {uid} {bar_type}: {inst}")
+            loaded_uids.append(uid)
+
+            with self._condition:
+                self._loaded_count += 1
+                loaded_count, total_count, queue_empty = self._loaded_count, self._total_count, len(self._queue) == 0
+                if queue_empty:
+                    self._loaded_count, self._total_count = 0, 0
+
+            if queue_empty or (time.monotonic() - last_report) >= self.progress_interval:
+                self.progress_function(loaded_uids, loaded_count, total_count)
+                loaded_uids = []
+                last_report = time.monotonic()
@@ -0,0 +1,134 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time, atexit
+from threading import Thread, Condition
+
+
+class BufferSaver:
+    """
+    Saves buffers of DataBuffers on a background thread, so the thread that takes in the bars never
+    waits on the disk. Buffers are marked dirty and saved once they have been dirty for coalesce_window
+    seconds; all saves of one (uid, bar_type) within that window become one write. The archive writes
+    are atomic, so a crash mid-save leaves the previous version. Pending saves are flushed on stop and
+    when the interpreter exits.
+    """
+
+    def __init__(self, save_function, coalesce_window=2.0):
+        self.save_function = save_function
+        self.coalesce_window = coalesce_window
+
+            #time at which each (uid, bar_type) became dirty, in order of marking
+        self._dirty = dict()
+        self._saving = set()
+        self._condition = Condition()
+        self._flushing = False
+        self._running = True
+
+        self._metrics = {'marked': 0, 'coalesced': 0, 'saved': 0, 'failed': 0, 'max_queue_depth': 0, 'last_save_duration': 0.0}
+
+        self._thread = Thread(target=self.run, name="BufferSaver", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+
+    def markDirty(self, uid, bar_type):
+        with self._condition:
+            self._metrics['marked'] += 1
+            if (uid, bar_type) in self._dirty:
+                self._metrics['coalesced'] += 1
+            else:
+                self._dirty[uid, bar_type] = time.monotonic()
+                self._metrics['max_queue_depth'] = max(self._metrics['max_queue_depth'], len(self._dirty))
+                self._condition.notify_all()
+
+
+    def queueDepth(self):
+        with self._condition:
+            return len(self._dirty) + len(self._saving)
+
+
+    def getMetrics(self):
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics['queue_depth'] = len(self._dirty) + len(self._saving)
+            if len(self._dirty) > 0:
+                metrics['oldest_dirty_age'] = time.monotonic() - next(iter(self._dirty.values()))
+            return metrics
+
+
+    def flush(self, timeout=None):
+            #saves everything that is dirty right away and waits for it, returns whether it completed in time
+        with self._condition:
+            self._flushing = True
+            self._condition.notify_all()
+            completed = self._condition.wait_for(lambda: (len(self._dirty) == 0 and len(self._saving) == 0) or not self._thread.is_alive(), timeout)
+            self._flushing = False
+            return completed
+
+
+    def stop(self, timeout=None):
+        if self._running:
+            self.flush(timeout)
+            with self._condition:
+                self._running = False
+                self._condition.notify_all()
+            self._thread.join(timeout)
+            atexit.unregister(self.stop)
+
+    ###### worker thread
+
+    def run(self):
+        while True:
+            with self._condition:
+                due_keys = self.waitForDueKeys()
+                if due_keys is None:
+                    return
+                for key in due_keys:
+                    del self._dirty[key]
+                self._saving.update(due_keys)
+
+            for uid, bar_type in due_keys:
+                start_time = time.perf_counter()
+                try:
+                    self.save_function(uid, bar_type)
+                    succeeded = True
+                except Exception as inst:
+                    print(f"BufferSaver.run failed to save {uid} {bar_type}: {inst}")
+                    succeeded = False
+
+                with self._condition:
+                    self._saving.discard((uid, bar_type))
+                    self._metrics['saved' if succeeded else 'failed'] += 1
+                    self._metrics['last_save_duration'] = time.perf_counter() - start_time
+                    self._condition.notify_all()
+
+
+    def waitForDueKeys(self):
+            #called holding the condition, returns None once stopped and nothing is left
+        while True:
+            if len(self._dirty) > 0:
+                if self._flushing or not self._running:
+                    return list(self._dirty.keys())
+
+                now = time.monotonic()
+                due_keys = [key for key, marked_at in self._dirty.items() if now - marked_at >= self.coalesce_window]
+                if len(due_keys) > 0:
+                    return due_keys
+                    #the first key is the oldest, as keys are only added when they become dirty
+                self._condition.wait(self.coalesce_window - (now - next(iter(self._dirty.values()))))
+            elif not self._running:
+                return None
+            else:
+                self._condition.wait()
@@ -1,4 +1,3 @@
-
 # Copyright (c) 2024 Jelmer de Vries
 #
 # This program is free software: you can redistribute it and/or modify
@@ -16,31 +15,85 @@
 from dataHandling.Constants import Constants, MAIN_BAR_TYPES, DT_BAR_TYPES, MINUTES_PER_BAR, RESAMPLING_BARS, RESAMPLING_DT_BARS, RESAMPLING_SECONDS
 from generalFunctionality.GenFunctions import stringRange
 from dataHandling.HistoryManagement.RangeObject import RangeObject
+from dataHandling.HistoryManagement.BarStore import ColumnarBarStore
+from dataHandling.HistoryManagement.BarArchive import BarArchive
+from dataHandling.HistoryManagement.MappedBarCache import MappedBarCache
+from dataHandling.HistoryManagement.BufferSaver import BufferSaver
+from dataHandling.HistoryManagement.BufferLoader import BufferLoader
+from dataHandling.HistoryManagement.BarAggregation import aggregateBars, bucketLabels, bucketLabel, BucketState
+import os
+from threading import RLock
+import numpy as np
 import pandas as pd
 from numpy import int64
 from datetime import datetime, timedelta
 from pytz import utc
 from zoneinfo import ZoneInfo
-from PyQt6.QtCore import pyqtSignal, QThread, QReadWriteLock, QObject
+from PyQt6.QtCore import pyqtSignal, pyqtSlot, QThread, QReadWriteLock, QObject
 
 
 class DataBuffers(QObject):
 
     save_on = False
+        #saves go through one background saver per data folder, as the buffers are shared per process too
+    save_in_background = True
+    save_coalesce_window = 2.0
+    _savers = dict()
+        #buffers are registered by loadBuffers and read from disk on first access or by the background loader of
+        #the instance that registered them, the date range and that instance are kept per (uid, bar_type)
+    lazy_loading = True
+    load_progress_interval = 0.25
+    _loadable = dict()
+    _load_lock = RLock()
+        #live single bar updates are propagated through running accumulators of the last bar per (uid, bar_type)
+    incremental_propagation = True
+    _bucket_states = dict()
 
     _locks = dict()
     _buffers = dict()
     _indicators = dict()
     _date_ranges = dict()
+        #the first timestamp per (uid, bar_type) that changed since the last save, 0 when nothing was saved yet
+    _unsaved_from = dict()
+        #buffers loaded for a date range, their saves are merged into what is stored
+    _partial_buffers = set()
 
     buffer_updater = pyqtSignal(str, dict)
 
     bars_to_propagate = DT_BAR_TYPES
 
+        #storage backend per (uid, bar_type), FrameBarStore keeps the old pandas behaviour
+    store_type = ColumnarBarStore
+        #indicator columns are recomputed after loading, so they are not saved
+    unsaved_columns = ['rsi', 'up_ema', 'down_ema']
+        #with 'publish' loaded and saved buffers are also written to memory-mapped files, that processes set
+        #to 'map' read from for every buffer they did not load themselves. Those share one copy of the bars in
+        #memory. setupSharing picks the mode per data folder, otherwise share_bars holds for all
+    share_bars = None
+    _sharing_modes = dict()
+    _published = set()
+
 
     def __init__(self, data_folder):
         super().__init__()
         self.data_folder = data_folder
+        self.bar_archive = BarArchive(data_folder)
+        self.share_bars = self._sharing_modes.get(data_folder, self.share_bars)
+        self.shared_cache = MappedBarCache(self.sharedFolderFor(data_folder)) if self.share_bars is not None else None
+        self._loader = None
+
+
+    @staticmethod
+    def sharedFolderFor(data_folder):
+        return os.path.join(data_folder, 'shared')
+
+
+    @classmethod
+    def setupSharing(cls, data_folder):
+            #the first process on a data folder publishes its buffers and later ones map them, for instances created after this
+        if not (data_folder in cls._sharing_modes):
+            is_publisher = MappedBarCache.claimPublisher(cls.sharedFolderFor(data_folder))
+            cls._sharing_modes[data_folder] = None if is_publisher is None else ('publish' if is_publisher else 'map')
 
     ###### read/write protected buffer interactions
 
@@ -49,7 +102,8 @@ class DataBuffers(QObject):
             self._locks[uid, bar_type] = QReadWriteLock()
 
         self._locks[uid, bar_type].lockForWrite()
-        self._buffers[uid, bar_type] = buffered_data
+        self._buffers[uid, bar_type] = self.store_type.fromFrame(buffered_data)
+        self._unsaved_from[uid, bar_type] = 0
         
         if not((uid, bar_type) in self._date_ranges) or (req_ranges_list is not None):
             self._date_ranges[uid, bar_type] = RangeObject(requested_ranges=req_ranges_list) 
@@ -57,24 +111,33 @@ class DataBuffers(QObject):
 
 
     def clearBufferFor(self, uid):
+            #a load that is running finishes first, so it can't put the buffer back after it is cleared
+        with self._load_lock:
+            for key in [key for key in self._loadable if key[0] == uid]:
+                del self._loadable[key]
+
         matching_keys = [key for key in self._buffers if key[0] == uid]
         
         for key in matching_keys:
             self._locks[key] = QReadWriteLock()
             del self._buffers[key]
             del self._date_ranges[key]
+            self._unsaved_from.pop(key, None)
             self._locks[key].unlock()
             del self._locks[key]
 
+        for key in [key for key in self._bucket_states if key[0] == uid]:
+            del self._bucket_states[key]
+        self._partial_buffers.difference_update([key for key in self._partial_buffers if key[0] == uid])
+        if self._loader is not None:
+            self._loader.discard(uid)
+
 
     def addToBuffer(self, uid, bar_type, new_data, new_req_range=None):
         self._locks[uid, bar_type].lockForWrite()
-        
-        if len(new_data) < 3:
-            for idx, row in new_data.iterrows():
-                self._buffers[uid, bar_type].loc[idx, row.keys()] = row
-        else: 
-            self._buffers[uid, bar_type] = new_data.combine_first(self._buffers[uid, bar_type])
+        self._buffers[uid, bar_type].merge(new_data)
+        if len(new_data) > 0:
+            self.markUnsaved(uid, bar_type, new_data.index.min())
         
         if (new_req_range is not None):
             self._date_ranges[uid, bar_type].addRanges(new_req_range)
@@ -82,20 +145,110 @@ class DataBuffers(QObject):
         self._locks[uid, bar_type].unlock()
         
 
+    def addBarToBuffer(self, uid, bar_type, timestamp, bar, new_req_range=None):
+        self._locks[uid, bar_type].lockForWrite()
+        self._buffers[uid, bar_type].mergeBar(timestamp, bar)
+        self.markUnsaved(uid, bar_type, timestamp)
+
+        if (new_req_range is not None):
+            self._date_ranges[uid, bar_type].addRanges(new_req_range)
+
+        self._locks[uid, bar_type].unlock()
+
+
     def getBufferFor(self, uid, bar_type):
-        
+        self.ensureLoaded(uid, bar_type)
+        if self.isSharedOnly(uid, bar_type):
+            return self.shared_cache.snapshot(uid, bar_type).toFrame()
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].copy()
+            return self._buffers[uid, bar_type].toFrame()
         finally:
             self._locks[uid, bar_type].unlock()
     
 
+    def getSnapshotFor(self, uid, bar_type, count=None, columns=None):
+            #read-only views, for consumers that only look at the last bars or a few columns
+        start = -count if count is not None else None
+        self.ensureLoaded(uid, bar_type)
+        if self.isSharedOnly(uid, bar_type):
+            return self.shared_cache.snapshot(uid, bar_type, start=start, columns=columns)
+
+        self._locks[uid, bar_type].lockForRead()
+        try:
+            return self._buffers[uid, bar_type].snapshot(start=start, columns=columns)
+        finally:
+            self._locks[uid, bar_type].unlock()
+
+
+    def getStackedBarsFor(self, uids, bar_type, columns, count=None):
+            #the trailing bars of several symbols as (symbols x bars) arrays, right aligned and NaN padded at the front.
+            #Without a count the width is that of the longest buffer. Symbols without bars are left out
+        snapshots = dict()
+        for uid in uids:
+            if self.bufferExists(uid, bar_type):
+                snapshot = self.getSnapshotFor(uid, bar_type, count=count, columns=columns)
+                if not snapshot.empty:
+                    snapshots[uid] = snapshot
+
+        width = count if count is not None else max((len(snapshot) for snapshot in snapshots.values()), default=0)
+        timestamps = np.zeros((len(snapshots), width), dtype=np.int64)
+        stacked = {column: np.full((len(snapshots), width), np.nan) for column in columns}
+        for row, snapshot in enumerate(snapshots.values()):
+            length = len(snapshot)
+            timestamps[row, width-length:] = snapshot.index
+            for column in columns:
+                if column in snapshot:
+                    stacked[column][row, width-length:] = snapshot[column]
+
+        return list(snapshots.keys()), timestamps, stacked
+
+
+    def getVersionFor(self, uid, bar_type):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).version
+
+        self._locks[uid, bar_type].lockForRead()
+        try:
+            return self._buffers[uid, bar_type].version
+        finally:
+            self._locks[uid, bar_type].unlock()
+
+
     def bufferExists(self, uid, bar_type):
+        self.ensureLoaded(uid, bar_type)
+        if self.isSharedOnly(uid, bar_type):
+            return self.shared_cache.contains(uid, bar_type)
         return (uid, bar_type) in self._buffers
 
 
+    def isSharedOnly(self, uid, bar_type):
+        return self.share_bars == 'map' and not ((uid, bar_type) in self._buffers)
+
+
+    def sharedStoreFor(self, uid, bar_type):
+            #a read-only store on the mapped bars, for the getters of buffers this process did not load
+        return ColumnarBarStore.fromSnapshot(self.shared_cache.snapshot(uid, bar_type))
+
+
+    def sharedRangesFor(self, uid, bar_type):
+        return RangeObject(RangeObject.rangesFromSerialized(self.shared_cache.requestedRanges(uid, bar_type)))
+
+
+    def copySharedBuffer(self, uid, bar_type):
+            #mapped buffers are read-only, a process that maps them takes its own copy of the ones it writes to
+        if self.isSharedOnly(uid, bar_type) and self.shared_cache.contains(uid, bar_type):
+            snapshot = self.shared_cache.snapshot(uid, bar_type)
+            self.setBufferFor(uid, bar_type, snapshot.toFrame(), req_ranges_list=self.sharedRangesFor(uid, bar_type).getRanges())
+                #the bars are stored already by the process that published them
+            del self._unsaved_from[uid, bar_type]
+
+
     def containsRange(self, uid, bar_type, inner_range):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedRangesFor(uid, bar_type).containsRange(inner_range)
+
         self._locks[uid, bar_type].lockForRead()
         try:
             return self._date_ranges[uid, bar_type].containsRange(inner_range)
@@ -104,6 +257,9 @@ class DataBuffers(QObject):
     
 
     def withinRange(self, uid, bar_type, dt_obj):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedRangesFor(uid, bar_type).withinRange(dt_obj)
+
         self._locks[uid, bar_type].lockForRead()
         try:
             return self._date_ranges[uid, bar_type].withinRange(dt_obj)
@@ -116,25 +272,34 @@ class DataBuffers(QObject):
 
 
     def getValuesForColumn(self, uid, bar_type, column_name):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).columnFor(column_name).values
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].loc[column_name].values
+            return self._buffers[uid, bar_type].columnFor(column_name).values
         finally:
             self._locks[uid, bar_type].unlock()
 
 
     def getIndicesFor(self, uid, bar_type):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).getIndices()
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].index
+            return self._buffers[uid, bar_type].getIndices()
         finally:
             self._locks[uid, bar_type].unlock()
 
 
     def getValueForColumnByIndex(self, uid, bar_type, column, indices):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).valuesForLabels(column, indices)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].loc[indices, column].values
+            return self._buffers[uid, bar_type].valuesForLabels(column, indices)
         finally:
             self._locks[uid, bar_type].unlock()
 
@@ -147,9 +312,12 @@ class DataBuffers(QObject):
                 break
 
         if smallest_bar_type is not None:
+            if self.isSharedOnly(uid, smallest_bar_type):
+                return self.sharedStoreFor(uid, smallest_bar_type).valueAt(-1, Constants.CLOSE)
+
             self._locks[uid, smallest_bar_type].lockForRead()
             try:
-                return self._buffers[uid, smallest_bar_type].iloc[-1][Constants.CLOSE].copy()
+                return self._buffers[uid, smallest_bar_type].valueAt(-1, Constants.CLOSE)
             finally:
                 self._locks[uid, smallest_bar_type].unlock()
         else:
@@ -157,114 +325,147 @@ class DataBuffers(QObject):
 
 
     def getLatestRow(self, uid, bar_type):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).rowAt(-1)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].iloc[-1].copy()
+            return self._buffers[uid, bar_type].rowAt(-1)
         finally:
             self._locks[uid, bar_type].unlock()
 
         
 
     def getBarsFromLabelIndex(self, uid, bar_type, index):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).fromLabel(index)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].loc[index:].copy()
+            return self._buffers[uid, bar_type].fromLabel(index)
         finally:
             self._locks[uid, bar_type].unlock()
 
 
     def hasBarForDtIndex(self, uid, bar_type, dt_index):
         ts_index = dt_index.timestamp()
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).containsLabel(ts_index)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return ts_index in self._buffers[uid, bar_type].index
+            return self._buffers[uid, bar_type].containsLabel(ts_index)
         finally:
             self._locks[uid, bar_type].unlock()
 
     def getBarForIntIndex(self, uid, bar_type, int_index):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).rowAt(int_index)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].iloc[int_index].copy()
+            return self._buffers[uid, bar_type].rowAt(int_index)
         finally:
             self._locks[uid, bar_type].unlock()
 
 
     def getBarsFromIntIndex(self, uid, bar_type, int_index):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).toFrame(start=int_index)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].iloc[int_index:].copy()
+            return self._buffers[uid, bar_type].toFrame(start=int_index)
         finally:
             self._locks[uid, bar_type].unlock()
 
 
     def setValueForColumnAtIndex(self, uid, bar_type, column, indices, values):
+        self.copySharedBuffer(uid, bar_type)
+        self._locks[uid, bar_type].lockForWrite()
+        self._buffers[uid, bar_type].setValuesForLabels(column, indices, values)
+        if not (column in self.unsaved_columns):
+            self.markUnsaved(uid, bar_type, np.min(indices))
+        self._locks[uid, bar_type].unlock()
+
+
+    def markUnsaved(self, uid, bar_type, from_index):
+        self._unsaved_from[uid, bar_type] = min(self._unsaved_from.get((uid, bar_type), from_index), from_index)
+
+
+    def setColumnValuesAtIndices(self, uid, bar_type, indices, column_values):
+        self.copySharedBuffer(uid, bar_type)
         self._locks[uid, bar_type].lockForWrite()
-        self._buffers[uid, bar_type].loc[indices, column] = value
+        for column, values in column_values.items():
+            self._buffers[uid, bar_type].setValuesForLabels(column, indices, values)
+            #indicator columns that are not saved leave the partitions on disk as they are
+        if any(not (column in self.unsaved_columns) for column in column_values):
+            self.markUnsaved(uid, bar_type, np.min(indices))
         self._locks[uid, bar_type].unlock()
 
 
     def getIndexAtPos(self, uid, bar_type, pos):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).labelAt(pos)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].index[pos]
+            return self._buffers[uid, bar_type].labelAt(pos)
         finally:
             self._locks[uid, bar_type].unlock()
 
 
     def getLastIndexLabel(self, uid, bar_type):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).labelAt(-1)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].index[-1]
+            return self._buffers[uid, bar_type].labelAt(-1)
         finally:
             self._locks[uid, bar_type].unlock()
         
 
     def getColumnValueForPos(self, uid, bar_type, column, pos):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).valueAt(pos, column)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            return self._buffers[uid, bar_type].iloc[pos][column]
+            return self._buffers[uid, bar_type].valueAt(pos, column)
         finally:
             self._locks[uid, bar_type].unlock()
 
 
     def getColumnFor(self, uid, bar_type, column_name):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedStoreFor(uid, bar_type).columnFor(column_name)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            if column_name in self._buffers[uid, bar_type]:
-                return self._buffers[uid, bar_type][column_name].copy()
-            else:
-                return None
+            return self._buffers[uid, bar_type].columnFor(column_name)
         finally:
             self._locks[uid, bar_type].unlock()
 
 
-    ##################### Sorting
-
-    def sortIndex(self, uid, bar_type, ascending=True):
-        self._locks[uid, bar_type].lockForWrite()
-        self._buffers[uid, bar_type].sort_index(ascending=ascending, inplace=True)
-        self._locks[uid, bar_type].unlock()
-
-
-    def sortValuesForColumn(self, uid, bar_type, column, ascending=True):
-        self._locks[uid, bar_type].lockForWrite()
-        self._buffers[uid, bar_type].sort_values(column, ascending=ascending, inplace=True)
-        self._locks[uid, bar_type].unlock()
-
-
    ##################### Range management
 
 
     def getMissingRangesFor(self, uid, bar_type, desired_range):
+        if self.isSharedOnly(uid, bar_type):
+            return self.sharedRangesFor(uid, bar_type).missingRanges(desired_range)
+
         self._locks[uid, bar_type].lockForRead()
         try:
-            current_ranges = self._date_ranges[uid, bar_type].getRanges()
-            return self.determineMissingRanges(desired_range, current_ranges)
+            return self._date_ranges[uid, bar_type].missingRanges(desired_range)
         finally:
             self._locks[uid, bar_type].unlock()
 
 
     def getRangesForBuffer(self, uid, bar_type):
+        if self.isSharedOnly(uid, bar_type):
+            return RangeObject.rangesFromSerialized(self.shared_cache.requestedRanges(uid, bar_type))
+
         self._locks[uid, bar_type].lockForRead()
         try:
             if (uid, bar_type) in self._date_ranges:
@@ -274,28 +475,14 @@ class DataBuffers(QObject):
             self._locks[uid, bar_type].unlock()
 
 
-    def determineMissingRanges(self, desired_range, current_ranges):
-        desired_start, desired_end = desired_range
-        missing_ranges = []
-        current_start = desired_start
-
-        for start, end in current_ranges:
-            if start > current_start:  # There is a gap before this range begins
-                # Ensure we add a gap only if it's within the desired range
-                if current_start < min(desired_end, start):
-                    missing_ranges.append((current_start, min(desired_end, start)))
-            current_start = max(current_start, end)  # Move current_start beyond the current range
-        
-        # After processing all existing ranges, check if there's still a gap at the end
-        if current_start < desired_end:
-            missing_ranges.append((current_start, desired_end))
-        return missing_ranges
-
-
    ##################### Indicator addition
 
     def setIndicatorValues(self, uid, bar_type, new_value_dict):
-        
+        if self.isSharedOnly(uid, bar_type):
+                #the indicators are kept per process, mapped buffers have no lock to take
+            self._indicators.setdefault((uid, bar_type), dict()).update(new_value_dict)
+            return
+
         self._locks[uid, bar_type].lockForWrite()
         if not((uid, bar_type) in self._indicators):
             self._indicators[uid, bar_type] = dict()
@@ -304,6 +491,12 @@ class DataBuffers(QObject):
 
 
     def getIndicatorValues(self, uid, bar_type, indicators):
+        if self.isSharedOnly(uid, bar_type):
+            indicator_values = self._indicators.get((uid, bar_type), dict())
+            if all(indicator in indicator_values for indicator in indicators):
+                return {ind: value for ind, value in indicator_values.items() if ind in indicators}
+            return None
+
         self._locks[uid, bar_type].lockForRead()
         try:
             if ((uid, bar_type) in self._indicators) and all(indicator in self._indicators[uid, bar_type] for indicator in indicators):
@@ -318,38 +511,161 @@ class DataBuffers(QObject):
 
     ##################### Loading and saving
 
-    def loadBuffers(self, stock_list=None, force_load=False, reset_existing_buffers=False, bar_types=MAIN_BAR_TYPES):
+    def loadBuffers(self, stock_list=None, force_load=False, reset_existing_buffers=False, bar_types=MAIN_BAR_TYPES, date_range=None):
         if reset_existing_buffers:
             self._buffers = dict()
+
+        if self.lazy_loading:
+            self.registerLoadable(stock_list, bar_types, date_range)
+            return
         
         for uid in stock_list:
             for bar_type in bar_types:
                     #we only load if not loaded yet as an already loaded buffer likely contains more data
                 if not self.bufferExists(uid, bar_type):
-                    self.loadExistingBuffer(uid, bar_type)
+                    self.loadExistingBuffer(uid, bar_type, date_range=date_range)
 
         self.buffer_updater.emit(Constants.DATA_LOADED_FROM_FILE, {'uids': list(stock_list.keys())})
 
 
-    def loadExistingBuffer(self, uid, bar_type):
+    def registerLoadable(self, stock_list, bar_types, date_range=None):
+            #uids are prefetched in the order of stock_list, progress goes out as DATA_LOADED_FROM_FILE for the uids loaded so far
+        queued_uids = []
+        for uid in stock_list:
+            loadable_bars = [bar_type for bar_type in bar_types if not self.bufferExists(uid, bar_type)]
+            for bar_type in loadable_bars:
+                self._loadable[uid, bar_type] = (date_range, self)
+            if len(loadable_bars) > 0:
+                queued_uids.append(uid)
+
+            #the uids that are in memory already can be shown right away
+        loaded_uids = [uid for uid in stock_list if not (uid in queued_uids)]
+        self.buffer_updater.emit(Constants.DATA_LOADED_FROM_FILE, {'uids': loaded_uids, 'loaded': 0, 'total': len(queued_uids)})
+
+        if len(queued_uids) > 0:
+            if self._loader is None:
+                self._loader = BufferLoader(self.ensureLoaded, self.emitLoadProgress, progress_interval=self.load_progress_interval)
+            self._loader.enqueue(queued_uids, bar_types)
+
+
+    @pyqtSlot(list)
+    def prioritizeBuffers(self, uids):
+            #e.g. the rows that are visible, these are loaded before the rest of the list
+        if self._loader is not None:
+            self._loader.prioritize(uids)
+
+
+    def emitLoadProgress(self, uids, loaded_count, total_count):
+        self.buffer_updater.emit(Constants.DATA_LOADED_FROM_FILE, {'uids': uids, 'loaded': loaded_count, 'total': total_count})
+
+
+    def ensureLoaded(self, uid, bar_type):
+            #reads a registered buffer from disk, on first access or when the background loader gets to it
+        if (uid, bar_type) in self._loadable:
+            with self._load_lock:
+                if (uid, bar_type) in self._loadable:
+                    date_range, data_buffers = self._loadable[uid, bar_type]
+                        #bars that came in before the buffer was loaded would be overwritten by it
+                    if not ((uid, bar_type) in self._buffers):
+                        data_buffers.loadExistingBuffer(uid, bar_type, date_range=date_range)
+                        #the key stays registered until the buffer is set, so writers that check it wait on the lock
+                    self._loadable.pop((uid, bar_type), None)
+
+
+    def loadExistingBuffer(self, uid, bar_type, date_range=None):
         try:
-            file_name = self.data_folder + str(uid) + '_' + bar_type + '.pkl'
-            existing_buffer = pd.read_pickle(file_name)
-            self.setBufferFor(uid, bar_type, existing_buffer, req_ranges_list=existing_buffer.attrs['requested_ranges'])
+            if not self.bar_archive.exists(uid, bar_type):
+                    #buffers saved as pickles by earlier versions are moved into the archive on first load
+                pickle_file = self.data_folder + str(uid) + '_' + bar_type + '.pkl'
+                if not os.path.exists(pickle_file):
+                    return
+                self.bar_archive.migratePickle(uid, bar_type, pickle_file)
+
+            existing_buffer, requested_ranges = self.bar_archive.load(uid, bar_type, date_range)
+            if date_range is not None:
+                self._partial_buffers.add((uid, bar_type))
+            if len(existing_buffer) > 0:
+                self.setBufferFor(uid, bar_type, existing_buffer, req_ranges_list=requested_ranges)
+                del self._unsaved_from[uid, bar_type]
+                if self.share_bars == 'publish':
+                    self._locks[uid, bar_type].lockForRead()
+                    try:
+                        self.publishBuffer(uid, bar_type, self._buffers[uid, bar_type].getColumns(), None)
+                    finally:
+                        self._locks[uid, bar_type].unlock()
         except Exception as inst:
             pass
 
 
+    def requestSave(self, uid, bar_type):
+        if self.save_in_background:
+            if not (self.data_folder in self._savers):
+                self._savers[self.data_folder] = BufferSaver(self.saveBuffer, coalesce_window=self.save_coalesce_window)
+            self._savers[self.data_folder].markDirty(uid, bar_type)
+        else:
+            self.saveBuffer(uid, bar_type)
+
+
+    def flushSaves(self, timeout=None):
+        if self.data_folder in self._savers:
+            return self._savers[self.data_folder].flush(timeout)
+        return True
+
+
+    def getSaveMetrics(self):
+            #queue depth, number of saves, saves coalesced into pending ones, failures and last save duration
+        if self.data_folder in self._savers:
+            return self._savers[self.data_folder].getMetrics()
+        return dict()
+
+
     def saveBuffer(self, uid, bar_type):
-        file_name = self.data_folder + str(uid) + '_' + bar_type + '.pkl'
+            #the changed bars are copied under the read lock, the disk is written without holding it
+        if not ((uid, bar_type) in self._buffers):
+            return      #cleared while waiting for the background saver
+
         self._locks[uid, bar_type].lockForRead()
-        
-        cols_to_exclude = ['rsi', 'up_ema', 'down_ema']
-        temp_df = self._buffers[uid, bar_type][self._buffers[uid, bar_type].columns.difference(cols_to_exclude)]
-        temp_df.attrs['requested_ranges'] = self._date_ranges[uid, bar_type].getRequestedRanges()
-        temp_df.to_pickle(file_name)
+        try:
+                #only the partitions holding changed bars are rewritten
+            saved_columns = [column for column in self._buffers[uid, bar_type].getColumns() if column not in self.unsaved_columns]
+            unsaved_from = self._unsaved_from.pop((uid, bar_type), None)
+            if unsaved_from is None:
+                changed_bars = pd.DataFrame()
+            else:
+                partition_start = self.bar_archive.partitionStart(bar_type, unsaved_from)
+                changed_bars = self._buffers[uid, bar_type].fromLabel(partition_start, columns=saved_columns)
+            requested_ranges = self._date_ranges[uid, bar_type].serialize()
+        finally:
+            self._locks[uid, bar_type].unlock()
 
-        self._locks[uid, bar_type].unlock()
+        try:
+            self.bar_archive.save(uid, bar_type, changed_bars, requested_ranges, partial=((uid, bar_type) in self._partial_buffers))
+            if self.share_bars == 'publish':
+                self._locks[uid, bar_type].lockForRead()
+                try:
+                    self.publishBuffer(uid, bar_type, saved_columns, unsaved_from)
+                finally:
+                    self._locks[uid, bar_type].unlock()
+        except Exception:
+                #the bars stay marked, so the next save writes them
+            if unsaved_from is not None:
+                self._locks[uid, bar_type].lockForWrite()
+                self.markUnsaved(uid, bar_type, unsaved_from)
+                self._locks[uid, bar_type].unlock()
+            raise
+
+
+    def publishBuffer(self, uid, bar_type, columns, unsaved_from):
+            #the first publish of a process writes everything, the loaded buffer may differ from what was published before
+        snapshot = self._buffers[uid, bar_type].snapshot(columns=columns)
+        if (uid, bar_type) not in self._published:
+            from_position = 0
+        elif unsaved_from is None:
+            from_position = len(snapshot)
+        else:
+            from_position = snapshot.positionFrom(unsaved_from)
+        self.shared_cache.publish(uid, bar_type, snapshot, self._date_ranges[uid, bar_type].serialize(), from_position)
+        self._published.add((uid, bar_type))
 
 
     ##################### Processing
@@ -370,8 +686,13 @@ class DataBuffers(QObject):
         
         if len(data_dict['data']) > 0:
             
+            if self.share_bars == 'map':
+                for bar_type in [curr_bar_type] + (self.getBarsAbove(curr_bar_type) if propagate_data else []):
+                    self.copySharedBuffer(uid, bar_type)
+
                 #we put the new data in the buffer
-            if self.bufferExists(uid, curr_bar_type):
+            self.ensureLoaded(uid, curr_bar_type)
+            if (uid, curr_bar_type) in self._buffers:
                 self.addToBuffer(uid, curr_bar_type, data_dict['data'], new_req_range=data_dict['requested_range'])
             else:
                 self.setBufferFor(uid, curr_bar_type, data_dict['data'], req_ranges_list=[data_dict['requested_range']])
@@ -385,9 +706,25 @@ class DataBuffers(QObject):
                     #we want to use the updated bars on lower time frames to complete bars on higher time frames
                 greater_bars = self.getBarsAbove(curr_bar_type)
 
+                    #a single new or revised bar only changes the last bar of each higher order
+                updated_bars = dict()
+                if self.incremental_propagation and len(data_dict['data']) == 1:
+                    updated_bars[curr_bar_type] = (int(data_dict['data'].index[0]), data_dict['data'].iloc[0].to_dict())
+
                 for to_bar_type in greater_bars:
 
                     from_bar_type = self.getUpdateBarType(to_bar_type)
+                    if from_bar_type in updated_bars:
+                        label, bar = updated_bars[from_bar_type]
+                        new_bar = self.propagateBar(uid, to_bar_type, label, bar, data_dict['requested_range'])
+                        if new_bar is not None:
+                            if len(new_bar) > 0:
+                                updated_bars[to_bar_type] = new_bar
+                                first_indices[to_bar_type] = new_bar[0]
+                                last_indices[to_bar_type] = new_bar[0]
+                                updated_bar_types.append(to_bar_type)
+                            continue
+
                     if (from_bar_type in first_indices):    #this ensures the from has been updated, but may be superfluous
                         new_indices, return_type = self.propagateUpdates(uid, from_bar_type, to_bar_type, data_dict['requested_range'])
                         if len(new_indices) > 0:
@@ -401,36 +738,13 @@ class DataBuffers(QObject):
                 #if it was proper fetch we want to save
             if (data_dict['requested_range'] is not None) and self.save_on:
                 for bar_type in updated_bar_types:
-                    if self.isSavableBartype(bar_type): self.saveBuffer(uid, bar_type)
+                    if self.isSavableBartype(bar_type): self.requestSave(uid, bar_type)
             
 
-    def propagateToHighOrderBars(self, origin_bars, to_bar_type):
-        origin_bars['datetime_utc'] = pd.to_datetime(origin_bars.index, unit='s') 
-        origin_bars['datetime_nyc'] = origin_bars['datetime_utc'].dt.tz_localize(utc).dt.tz_convert(Constants.NYC_TIMEZONE)
-        origin_bars.set_index('datetime_nyc', inplace=True)
-
-        if to_bar_type == Constants.FOUR_HOUR_BAR:
-            updated_bars = origin_bars.resample('4H').agg({Constants.OPEN: 'first', Constants.HIGH: 'max', Constants.LOW: 'min', Constants.CLOSE: 'last', Constants.VOLUME: 'sum'}).dropna()
-        elif to_bar_type == Constants.DAY_BAR:
-            origin_bars = origin_bars.between_time('09:30', '15:59')
-            updated_bars = origin_bars.resample('D').agg({Constants.OPEN: 'first', Constants.HIGH: 'max', Constants.LOW: 'min', Constants.CLOSE: 'last', Constants.VOLUME: 'sum'}).dropna()
-
-        updated_bars.index = updated_bars.index.map(lambda x: int(x.timestamp()))
-        updated_bars.index.name = None
-        
-        updated_indices = updated_bars.index
-        return updated_indices, updated_bars
-        
-        
-    def propagateToLowerOrderBars(self, origin_bars, to_bar_type):
-        indices_for_grouping = ((origin_bars.index - Constants.BASE_TIMESTAMP_NY) // RESAMPLING_SECONDS[to_bar_type]) * RESAMPLING_SECONDS[to_bar_type] + Constants.BASE_TIMESTAMP_NY
-        origin_bars['Grouping Indices'] = indices_for_grouping.tolist()
-
-        updated_bars = origin_bars.groupby('Grouping Indices').agg({Constants.OPEN: 'first', Constants.HIGH: 'max', Constants.LOW: 'min', Constants.CLOSE: 'last', Constants.VOLUME: 'sum'}).dropna()
-        updated_bars.index.name = None
-
-        updated_indices = updated_bars.index
-        return updated_indices, updated_bars    
+    def aggregateBarsTo(self, timestamps, bars, to_bar_type):
+        labels, (opens, highs, lows, closes, volumes) = aggregateBars(timestamps, bars[Constants.OPEN], bars[Constants.HIGH], bars[Constants.LOW], bars[Constants.CLOSE], bars[Constants.VOLUME], to_bar_type)
+        updated_bars = pd.DataFrame({Constants.OPEN: opens, Constants.HIGH: highs, Constants.LOW: lows, Constants.CLOSE: closes, Constants.VOLUME: volumes}, index=pd.Index(labels))
+        return updated_bars.index, updated_bars
 
 
     def propagateUpdates(self, uid, from_bar_type, to_bar_type, new_req_range, update_full=True):
@@ -440,25 +754,90 @@ class DataBuffers(QObject):
             # we ensure the origin data exists
         if updatable_range is not None:
             if self.bufferExists(uid, from_bar_type):
-                from_frame = self.getBufferFor(uid, from_bar_type)
-                    
-                existing_indices = from_frame.index
-                indices_in_range = existing_indices[(existing_indices >= updatable_range[0].timestamp()) & (existing_indices < updatable_range[1].timestamp())]
-                origin_bars = from_frame.loc[indices_in_range]
-
-                if to_bar_type == Constants.FOUR_HOUR_BAR or to_bar_type == Constants.DAY_BAR:
-                    updated_indices, updated_bars = self.propagateToHighOrderBars(origin_bars, to_bar_type)
-                else:
-                    updated_indices, updated_bars = self.propagateToLowerOrderBars(origin_bars, to_bar_type)
-
-                if self.bufferExists(uid, to_bar_type):   
+                    #only the bars in the updatable range are aggregated, read through views without copying the buffer
+                origin_bars = self.getSnapshotFor(uid, from_bar_type, columns=[Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME])
+                first = np.searchsorted(origin_bars.index, updatable_range[0].timestamp(), side='left')
+                last = np.searchsorted(origin_bars.index, updatable_range[1].timestamp(), side='left')
+                updated_indices, updated_bars = self.aggregateBarsTo(origin_bars.index[first:last], {column: origin_bars[column][first:last] for column in origin_bars.columns}, to_bar_type)
+
+                self.ensureLoaded(uid, to_bar_type)
+                if (uid, to_bar_type) in self._buffers:
                     self.addToBuffer(uid, to_bar_type, updated_bars, new_req_range=updatable_range)
                 else:
                     self.setBufferFor(uid, to_bar_type, updated_bars, req_ranges_list=[updatable_range])
+
+                if self.incremental_propagation:
+                    self.seedBucketState(uid, to_bar_type, origin_bars.index[first:last], origin_bars, first, last)
             
         return updated_indices, to_bar_type
 
 
+    def seedBucketState(self, uid, to_bar_type, timestamps, origin_bars, first, last):
+            #the accumulators of the last bar continue from the bars that fell in it, which only holds for the last bar of the buffer
+        self._bucket_states.pop((uid, to_bar_type), None)
+        if last < len(origin_bars):
+            return
+        labels, mask = bucketLabels(timestamps, to_bar_type)
+        positions = np.flatnonzero(mask) if mask is not None else np.arange(len(labels))
+        if len(positions) > 0:
+            last_label = labels[positions[-1]]
+            in_bucket = positions[labels[positions] == last_label]
+            bars = tuple(origin_bars[column][first:last][in_bucket] for column in [Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME])
+            self._bucket_states[uid, to_bar_type] = BucketState.fromBars(int(last_label), timestamps[in_bucket], bars)
+
+
+    def propagateBar(self, uid, to_bar_type, timestamp, bar, requested_range):
+        """
+        Updates the bar of to_bar_type that the bar at timestamp falls in from the running accumulators, at a
+        cost independent of the length of the buffers. Returns the label and bar written, an empty tuple when
+        the bar doesn't count for to_bar_type and None when the accumulators can't take it, in which case the
+        range is propagated in full
+        """
+        state = self._bucket_states.get((uid, to_bar_type))
+        if state is None or not ((uid, to_bar_type) in self._buffers):
+            return None
+
+        label = bucketLabel(timestamp, to_bar_type)
+        if label is None:
+            return ()
+        if label < state.label:
+            return None
+
+        values = (bar[Constants.OPEN], bar[Constants.HIGH], bar[Constants.LOW], bar[Constants.CLOSE], bar[Constants.VOLUME])
+        if label > state.label:
+                #the bar only starts the bucket if no earlier bars fell in it
+            if self.hasEarlierBarsInBucket(uid, to_bar_type, label, timestamp):
+                return None
+            new_state = BucketState(label, None, timestamp, values)
+        else:
+            new_state = BucketState(state.label, state.base, state.last_timestamp, state.last_bar)
+            if not new_state.update(timestamp, values):
+                return None
+
+        combined = new_state.combined()
+        if any(value != value for value in combined):
+            return None
+
+        self._bucket_states[uid, to_bar_type] = new_state
+        new_bar = dict(zip([Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME], combined))
+        new_req_range = None
+        if requested_range is not None:
+            new_req_range = (datetime.fromtimestamp(label, utc), requested_range[1])
+        self.addBarToBuffer(uid, to_bar_type, label, new_bar, new_req_range=new_req_range)
+        return label, new_bar
+
+
+    def hasEarlierBarsInBucket(self, uid, to_bar_type, label, timestamp):
+            #whether the buffer the bar came from holds bars before timestamp that count for the bar of to_bar_type at label
+        from_bar_type = self.getUpdateBarType(to_bar_type)
+        if not self.bufferExists(uid, from_bar_type):
+            return True
+        from_bars = self.getSnapshotFor(uid, from_bar_type, columns=[])
+        earlier_timestamps = from_bars.index[from_bars.positionFrom(label):from_bars.positionFrom(timestamp)]
+        _, mask = bucketLabels(earlier_timestamps, to_bar_type)
+        return len(earlier_timestamps) > 0 and (mask is None or bool(mask.any()))
+
+
     def getNearestNineThirties(self, dt):
         dt_nyc_time = dt.astimezone(ZoneInfo(Constants.NYC_TIMEZONE))
         current_day_930 = dt_nyc_time.replace(hour=9, minute=30, second=0, microsecond=0)
@@ -33,6 +33,10 @@ from PyQt6.QtCore import QThread, QObject, Qt, pyqtSignal, pyqtSlot, QTimer
 
 
 from dataHandling.HistoryManagement.DataBuffer import DataBuffers
+from dataHandling.HistoryManagement.RequestScheduler import RequestScheduler
+from dataHandling.HistoryManagement.RangeObject import RangeObject
+from dataHandling.HistoryManagement.BarAccumulator import BarAccumulator
+from dataHandling.HistoryManagement.BarBatcher import BarBatcher
 from dataHandling.DataStructures import DetailObject
 from dataHandling.Constants import Constants, MINUTES_PER_BAR
 from dataHandling.IBConnectivity import IBConnectivity
@@ -40,7 +44,7 @@ from dataHandling.IBConnectivity import IBConnectivity
 
 class HistoricalDataManager(IBConnectivity):
 
-    historical_bar_signal = pyqtSignal(int, BarData)
+    historical_bars_signal = pyqtSignal()
     historial_end_signal = pyqtSignal(int, str, str)
     cleanup_done_signal = pyqtSignal()        
 
@@ -55,6 +59,8 @@ class HistoricalDataManager(IBConnectivity):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)        
         self.initializeRequestTracking()
+            #bars are collected on the callback thread and handed over in batches
+        self.bar_batcher = BarBatcher(self.historical_bars_signal.emit)
         self.data_buffers = DataBuffers(Constants.BUFFER_FOLDER)
         self.most_recent_first = True       #order in which requests are processed
         self.smallest_bar_first = True
@@ -65,7 +71,7 @@ class HistoricalDataManager(IBConnectivity):
     def initializeRequestTracking(self):
         
             #queue of to submit historical requests
-        self._request_queue = []    
+        self._request_queue = RequestScheduler(self.requestSortKey)
 
             #id's by req_id
         self._uid_by_req = dict()
@@ -75,6 +81,11 @@ class HistoricalDataManager(IBConnectivity):
         self.earliest_uid_by_req = dict()
 
         self._grouped_req_ids = []
+
+            #queued or running requests by (uid, bar_type), that later requests for the same bars can join
+        self._pending_by_buffer = dict()
+        self._joined_req_ids = set()
+        self._coalescing_metrics = {'requested': 0, 'joined': 0, 'covered': 0}
         
             #update tracking
         self._update_requests = set()        #open updating requests
@@ -87,7 +98,7 @@ class HistoricalDataManager(IBConnectivity):
         self._contract_details_by_uid = dict()
 
             #data bufffers
-        self._historical_dfs = dict()          #frames for data collection 
+        self._historical_bars = dict()          #bar accumulators for data collection 
 
         self._cancelling_req_ids = set()
 
@@ -100,6 +111,12 @@ class HistoricalDataManager(IBConnectivity):
     def getDataBuffer(self):
         return self.data_buffers
 
+
+    def stop(self):
+            #buffers still waiting for the background saver are written before we go
+        self.data_buffers.flushSaves()
+        super().stop()
+
     def registerOwner(self):
 
         owner_id = super().registerOwner()
@@ -107,7 +124,13 @@ class HistoricalDataManager(IBConnectivity):
         return owner_id
 
 
+    def setOwnerPriority(self, owner_id, priority):
+            #requests of owners with a higher priority are submitted first, owners of equal priority take turns
+        self._request_queue.setOwnerPriority(owner_id, priority)
+
+
     def deregisterOwner(self, owner_id):
+        self.stopActiveTimers(owner_id)
         super().deregisterOwner(owner_id)
         del self._req_by_owner[owner_id]
 
@@ -122,7 +145,7 @@ class HistoricalDataManager(IBConnectivity):
         self.timeout_timer.timeout.connect(self.handleTimeout)
 
             #we connect slots to be signalled from callbacks to get on the current thread
-        self.historical_bar_signal.connect(self.processHistoricalBar, Qt.ConnectionType.QueuedConnection)
+        self.historical_bars_signal.connect(self.processBarBatches, Qt.ConnectionType.QueuedConnection)
         self.historial_end_signal.connect(self.processHistoricalDataEnd, Qt.ConnectionType.QueuedConnection)
 
 
@@ -164,7 +187,7 @@ class HistoricalDataManager(IBConnectivity):
         
 
     def performCleanupFor(self, uid, relevant_requests):
-        if uid in self._historical_dfs: del self._historical_dfs[uid]
+        if uid in self._historical_bars: del self._historical_bars[uid]
         if uid in self._priority_uids: self._priority_uids.remove(uid)
 
         for req_id in relevant_requests:
@@ -204,8 +227,11 @@ class HistoricalDataManager(IBConnectivity):
 
     def stopActiveTimers(self, owner_id=None):
         if owner_id is not None:
-            for req in reversed(self._request_queue):
-                self._request_queue.remove(req)
+                #queued requests that other owners joined stay, under one of those owners
+            for request in self._request_queue.cancelOwner(owner_id):
+                other_owners = [other_id for other_id, req_ids in self._req_by_owner.items() if other_id != owner_id and request.req_id in req_ids]
+                if len(other_owners) > 0:
+                    self._request_queue.push(other_owners[0], request)
             if len(self._request_queue) == 0:
                 if hasattr(self, 'history_exec_timer') and (self.history_exec_timer is not None) and self.history_exec_timer.isActive():
                     self.history_exec_timer.stop()
@@ -216,7 +242,7 @@ class HistoricalDataManager(IBConnectivity):
             if hasattr(self, 'earliest_req_timer') and self.earliest_req_timer.isActive():
                 self.earliest_req_timer.stop()
             
-            self._request_queue = []
+            self._request_queue.clear()
 
 
     def stopActiveRequests(self, owner_id=None):
@@ -227,7 +253,7 @@ class HistoricalDataManager(IBConnectivity):
         # active_ids.update(self._all_req_ids)
         active_ids = self.req_id_manager.getAllHistIDs()
         if owner_id is not None:
-            active_ids = active_ids.intersection(self._req_by_owner[owner_id])
+            active_ids = self.exclusiveRequestsOf(owner_id, active_ids.intersection(self._req_by_owner[owner_id]))
 
         self._cancelling_req_ids.update(active_ids)
         for req_id in active_ids:
@@ -247,13 +273,80 @@ class HistoricalDataManager(IBConnectivity):
     @pyqtSlot(int, DetailObject, datetime, datetime, str)
     @pyqtSlot(int, DetailObject, datetime, datetime, str, bool)
     def createRequestsForContract(self, owner_id, contract_details, start_date, end_date, bar_type, propagate_data=False):
-        weeks, days, seconds = self.getTimeSplits(start_date, end_date)
-        
-        requests = self.createBufferRequests(owner_id, contract_details, end_date, bar_type, weeks, days, seconds, propagate_data)
+        self._coalescing_metrics['requested'] += 1
+        uncovered_ranges = self.uncoveredRanges(owner_id, contract_details.numeric_id, bar_type, (start_date, end_date), propagate_data)
+        if len(uncovered_ranges) == 0:
+            self._coalescing_metrics['covered'] += 1
+
+        for range_start, range_end in uncovered_ranges:
+            weeks, days, seconds = self.getTimeSplits(range_start, range_end)
+            requests = self.createBufferRequests(owner_id, contract_details, range_end, bar_type, weeks, days, seconds, propagate_data)
+            if len(requests) > 0:
+                self._request_queue.pushAll(owner_id, requests)
+
+
+    def uncoveredRanges(self, owner_id, uid, bar_type, desired_range, propagate_data):
+            #the parts of the range that are neither in the buffer nor pending, the owner joins the pending requests that overlap
+        if self.data_buffers.bufferExists(uid, bar_type):
+            missing_ranges = RangeObject(self.data_buffers.getRangesForBuffer(uid, bar_type)).missingRanges(desired_range)
+        else:
+            missing_ranges = [desired_range]
+
+        pending_ranges = RangeObject()
+        for req_id in self.pendingRequestsFor(uid, bar_type):
+            begin_date, end_date = self._date_ranges_by_req[req_id]
+            if any((begin_date < missing_end) and (end_date > missing_start) for missing_start, missing_end in missing_ranges):
+                self.joinRequest(owner_id, req_id, propagate_data)
+                pending_ranges.addRanges((begin_date, end_date))
+
+        return [uncovered for missing_range in missing_ranges for uncovered in pending_ranges.missingRanges(missing_range)]
+
+
+    def pendingRequestsFor(self, uid, bar_type):
+        pending = self._pending_by_buffer.get((uid, bar_type), set())
+            #req_ids are handed out again, so entries that no longer match are dropped on the way
+        for req_id in [req_id for req_id in pending if not self.isPendingRequestFor(req_id, uid, bar_type)]:
+            pending.remove(req_id)
+        return sorted(pending)
+
+
+    def isPendingRequestFor(self, req_id, uid, bar_type):
+        if not (self.req_id_manager.isActiveHistID(req_id) and self._uid_by_req.get(req_id) == uid and self._bar_type_by_req.get(req_id) == bar_type):
+            return False
+        if (req_id in self._cancelling_req_ids) or not (req_id in self._date_ranges_by_req):
+            return False
+            #a running keep up request has delivered its range once the first fetch is done
+        return not ((req_id in self._keep_up_requests) and self._initial_fetch_complete.get(req_id, False))
+
+
+    def addPendingRequest(self, uid, bar_type, req_id):
+        if not ((uid, bar_type) in self._pending_by_buffer):
+            self._pending_by_buffer[uid, bar_type] = set()
+        self._pending_by_buffer[uid, bar_type].add(req_id)
+
+
+    def joinRequest(self, owner_id, req_id, propagate_data):
+            #the data goes into the shared buffers, so joining is being tracked as one of its owners
+        self._coalescing_metrics['joined'] += 1
+        self._req_by_owner[owner_id].add(req_id)
+        self._propagating_data[req_id] = self._propagating_data.get(req_id, False) or propagate_data
+        self._joined_req_ids.add(req_id)
+
+
+    def getCoalescingMetrics(self):
+        return dict(self._coalescing_metrics)
+
+
+    def exclusiveRequestsOf(self, owner_id, req_ids):
+            #the requests no other owner waits for, the owner is taken off the shared ones
+        exclusive_ids = set()
+        for req_id in req_ids:
+            if any(req_id in other_req_ids for other_id, other_req_ids in self._req_by_owner.items() if other_id != owner_id):
+                self._req_by_owner[owner_id].discard(req_id)
+            else:
+                exclusive_ids.add(req_id)
+        return exclusive_ids
 
-        if len(requests) > 0:
-            self._request_queue += requests
-        
 
     def createBufferRequests(self, owner_id, contract_details, end_date, bar_type, weeks, days, seconds, propagate_data=False):
         requests = []
@@ -293,8 +386,13 @@ class HistoricalDataManager(IBConnectivity):
 
     @pyqtSlot(str)
     def groupCurrentRequests(self, group_type: str):
-        new_group = set([request.req_id for request in self._request_queue])
-        self._grouped_req_ids.append({'group_type': group_type, 'group_ids': new_group})
+        new_group = self._request_queue.requestIds().union(req_id for req_id in self._joined_req_ids if self.req_id_manager.isActiveHistID(req_id))
+        self._joined_req_ids = set()
+        if len(new_group) == 0:
+                #everything was covered already
+            self.api_updater.emit(Constants.HISTORICAL_GROUP_COMPLETE, {'type': group_type})
+        else:
+            self._grouped_req_ids.append({'group_type': group_type, 'group_ids': new_group})
 
 
     def addRequestTo(self, owner_id, requests, contract, bar_type, period, begin_date, end_date, propagate_data=False):
@@ -304,6 +402,7 @@ class HistoricalDataManager(IBConnectivity):
         self._propagating_data[req_id] = propagate_data
         self._bar_type_by_req[req_id] = bar_type
         self._date_ranges_by_req[req_id] = (begin_date, end_date)
+        self.addPendingRequest(contract.conId, bar_type, req_id)
         requests.append(HistoryRequest(req_id, contract, end_date, period, bar_type))
         return requests
 
@@ -364,9 +463,16 @@ class HistoricalDataManager(IBConnectivity):
 
 
     def createUpdateRequests(self, owner_id, contract_details, bar_type, time_in_sec, date_range, keep_up_to_date=True, propagate_updates=False):
+        self._coalescing_metrics['requested'] += 1
+        uid = contract_details.numeric_id
+            #an update that is still underway from an earlier or the same begin date covers this one
+        for pending_id in self.pendingRequestsFor(uid, bar_type):
+            if (pending_id in self._update_requests) and (self._date_ranges_by_req[pending_id][0] <= date_range[0]) and ((pending_id in self._keep_up_requests) or not keep_up_to_date):
+                self.joinRequest(owner_id, pending_id, propagate_updates)
+                return
+
         req_id = self.req_id_manager.getNextHistID(self._cancelling_req_ids)
         self._req_by_owner[owner_id].add(req_id)
-        uid = contract_details.numeric_id
         self._contract_details_by_uid[uid] = contract_details
         contract = self.getContractFor(contract_details)
 
@@ -376,15 +482,16 @@ class HistoricalDataManager(IBConnectivity):
 
         self._propagating_data[req_id] = propagate_updates
 
-        self._historical_dfs[req_id] = pd.DataFrame(columns=[Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME])
+        self._historical_bars[req_id] = BarAccumulator()
         self.addUIDbyReq(uid, req_id)
         self._bar_type_by_req[req_id] = bar_type
         self._date_ranges_by_req[req_id] = date_range
+        self.addPendingRequest(uid, bar_type, req_id)
         if time_in_sec > Constants.SECONDS_IN_DAY:
             total_days = int(math.ceil(time_in_sec/(Constants.SECONDS_IN_DAY)))
-            self._request_queue.append(HistoryRequest(req_id, contract, "", f"{total_days} D", bar_type, keep_up_to_date))
+            self._request_queue.push(owner_id, HistoryRequest(req_id, contract, "", f"{total_days} D", bar_type, keep_up_to_date))
         else:
-            self._request_queue.append(HistoryRequest(req_id, contract, "", f"{(time_in_sec+300)} S", bar_type, keep_up_to_date))
+            self._request_queue.push(owner_id, HistoryRequest(req_id, contract, "", f"{(time_in_sec+300)} S", bar_type, keep_up_to_date))
         
 
         self._update_requests.add(req_id)
@@ -445,8 +552,9 @@ class HistoricalDataManager(IBConnectivity):
 
 
     @pyqtSlot(int)
-    def iterateHistoryRequests(self, delay=11_000):
+    def iterateHistoryRequests(self, delay=100):
         # print(f"HistoricalDataManager.iterateHistoryRequests on: {int(QThread.currentThreadId())}")
+            #the pacer decides when requests can go, the delay only sets how often we check
         if self.hasQueuedRequests():
             self.history_exec_timer = QTimer()
             self.history_exec_timer.timeout.connect(self.executeHistoryRequest)
@@ -458,21 +566,10 @@ class HistoricalDataManager(IBConnectivity):
     def executeHistoryRequest(self):
         # print(f"HistoricalDataManager.executeHistoryRequest on: {int(QThread.currentThreadId())}")
         if self.hasQueuedRequests():
-            if self.req_id_manager.getActiveReqCount() < self.queue_cap:
+            if self.req_id_manager.getActiveReqCount() < self.queue_cap and self.pacer.delayFor(self.getHistoryRequestFor(self._request_queue.peek())) == 0:
                 hr = self.getNextHistoryRequest()   
-                self._historical_dfs[hr.req_id] = pd.DataFrame(columns=[Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME])
-                request = dict()
-                request['type'] = 'reqHistoricalData'
-                request['req_id'] = hr.req_id
-                request['contract'] = hr.contract
-                request['end_date'] = hr.getEndDateString()
-                request['duration'] = hr.period_string
-                request['bar_type'] = hr.bar_type
-                if hr.bar_type == Constants.DAY_BAR:
-                    request['regular_hours'] = 1
-                else:
-                    request['regular_hours'] = self.regular_hours
-                request['keep_up_to_date'] = hr.keep_updating
+                self._historical_bars[hr.req_id] = BarAccumulator()
+                request = self.getHistoryRequestFor(hr)
                 if not(hr.keep_updating): self.timeout_timer.start()
                 self.makeRequest(request)
                 self.api_updater.emit(Constants.HISTORICAL_REQUEST_SUBMITTED, {'req_id': hr.req_id})
@@ -482,18 +579,33 @@ class HistoricalDataManager(IBConnectivity):
             self.history_exec_timer = None
 
 
-    def getNextHistoryRequest(self):
-        if self.smallest_bar_first and self.most_recent_first:
-            next_element = max(self._request_queue, key=lambda x: (-MINUTES_PER_BAR[x.bar_type], x.end_date))
-        elif self.smallest_bar_first and self.most_recent_first:
-            next_element = min(self._request_queue, key=lambda x: MINUTES_PER_BAR[x.bar_type])
-        elif self.most_recent_first:
-            next_element = max(self._request_queue, key=lambda x: x.end_date)
+    def getHistoryRequestFor(self, hr):
+        request = dict()
+        request['type'] = 'reqHistoricalData'
+        request['req_id'] = hr.req_id
+        request['contract'] = hr.contract
+        request['end_date'] = hr.getEndDateString()
+        request['duration'] = hr.period_string
+        request['bar_type'] = hr.bar_type
+        if hr.bar_type == Constants.DAY_BAR:
+            request['regular_hours'] = 1
         else:
-            next_element = self._request_queue[0]
+            request['regular_hours'] = self.regular_hours
+        request['keep_up_to_date'] = hr.keep_updating
+        return request
+
+
+    def getNextHistoryRequest(self):
+        return self._request_queue.pop()
+
 
-        self._request_queue.remove(next_element)
-        return next_element
+    def requestSortKey(self, request):
+            #uids prioritized for live updating first, then by bar size and end date as set. Update requests end now
+        urgency = 0 if request.contract.conId in self._priority_uids else 1
+        bar_minutes = MINUTES_PER_BAR[request.bar_type] if self.smallest_bar_first else 0
+        end_timestamp = float('inf') if request.end_date == "" else request.end_date.timestamp()
+        recency = -end_timestamp if self.most_recent_first else 0
+        return (urgency, bar_minutes, recency)
 
 
 ####################
@@ -538,29 +650,31 @@ class HistoricalDataManager(IBConnectivity):
     def historicalData(self, req_id, bar):
         super().historicalData(req_id, bar)
         if self.req_id_manager.isHistDataRequest(req_id):
-            self.historical_bar_signal.emit(req_id, bar)
+            self.bar_batcher.addBar(req_id, bar)
             
             
 
     def historicalDataUpdate(self, req_id, bar):
         super().historicalDataUpdate(req_id, bar)
-        self.historical_bar_signal.emit(req_id, bar)
+        self.bar_batcher.addBar(req_id, bar)
+
+
+    @pyqtSlot()
+    def processBarBatches(self):
+        for req_id, rows in self.bar_batcher.drain().items():
+            self.processHistoricalBars(req_id, rows)
 
 
-    @pyqtSlot(int, BarData)
-    def processHistoricalBar(self, req_id, bar):
-        if (req_id in self._historical_dfs) and (req_id in self._uid_by_req) and bar.volume != 0:
+    def processHistoricalBars(self, req_id, rows):
+        if (req_id in self._historical_bars) and (req_id in self._uid_by_req):
             uid = self._uid_by_req[req_id]
-            instrument_tz = self._contract_details_by_uid[uid].time_zone
-            bar_type = self._bar_type_by_req[req_id]
-            new_row = {Constants.OPEN: bar.open, Constants.HIGH: bar.high, Constants.LOW: bar.low, Constants.CLOSE: bar.close, Constants.VOLUME: float(bar.volume)}
-
-            if bar_type == Constants.DAY_BAR:   # we need a special case, because for the day bar we get a date ("20231204"), rather than unix seconds timestamps
-                date_time = pd.to_datetime(bar.date, format="%Y%m%d")
-                date_time = date_time.tz_localize(instrument_tz)
-                self._historical_dfs[req_id].loc[int(date_time.astimezone(utc).timestamp())] = new_row
-            else:
-                self._historical_dfs[req_id].loc[int(bar.date)] = new_row
+            accumulator = self._historical_bars[req_id]
+                #for the day bar we get a date ("20231204") rather than unix seconds, these are converted when the request completes
+            rows = [row for row in rows if row[5] != 0]
+            for row in rows:
+                accumulator.addBar(*row)
+            if len(rows) == 0:
+                return
 
             if (req_id in self._keep_up_requests) and self._initial_fetch_complete[req_id] and (req_id in self._last_update_time):
                 if (uid in self._priority_uids) or ((time.time() - self._last_update_time[req_id]) > self.update_delay):
@@ -571,15 +685,14 @@ class HistoricalDataManager(IBConnectivity):
 
 
     def processGroupSignal(self, req_id, supress_signal=False):
-        for group_index in range(len(self._grouped_req_ids)):
-            if req_id in self._grouped_req_ids[group_index]['group_ids']:
-                self._grouped_req_ids[group_index]['group_ids'].remove(req_id)
-                if len(self._grouped_req_ids[group_index]['group_ids']) == 0:
-                    if not(supress_signal):
-                        group_type = self._grouped_req_ids[group_index]['group_type']
-                        self.api_updater.emit(Constants.HISTORICAL_GROUP_COMPLETE, {'type': group_type})
-                    del self._grouped_req_ids[group_index]
-                    return
+            #a joined request is in the groups of every owner that waits for it, each group it completes is signalled
+        for group in self._grouped_req_ids:
+            group['group_ids'].discard(req_id)
+        completed_groups = [group for group in self._grouped_req_ids if len(group['group_ids']) == 0]
+        self._grouped_req_ids = [group for group in self._grouped_req_ids if len(group['group_ids']) > 0]
+        if not(supress_signal):
+            for group in completed_groups:
+                self.api_updater.emit(Constants.HISTORICAL_GROUP_COMPLETE, {'type': group['group_type']})
 
 
     def historicalDataEnd(self, req_id: int, start: str, end: str):
@@ -591,6 +704,8 @@ class HistoricalDataManager(IBConnectivity):
     @pyqtSlot(int, str, str)
     def processHistoricalDataEnd(self, req_id, start, end):
         self.timeout_timer.start()
+            #bars that came in after the last batch was handed over
+        self.processHistoricalBars(req_id, self.bar_batcher.drainRequest(req_id))
         if self.req_id_manager.isActiveHistID(req_id):
             completed_req = self.createCompletedReqFor(req_id, start, end)
             if completed_req is not None:
@@ -614,11 +729,12 @@ class HistoricalDataManager(IBConnectivity):
 
             
             if not(req_id in self._keep_up_requests):
+                self._pending_by_buffer.get((uid, self._bar_type_by_req[req_id]), set()).discard(req_id)
                 del self._uid_by_req[req_id]
                 del self._bar_type_by_req[req_id]
                 del self._date_ranges_by_req[req_id]
-                if req_id in self._historical_dfs:
-                    del self._historical_dfs[req_id]     #in case we come here through a timeout
+                if req_id in self._historical_bars:
+                    del self._historical_bars[req_id]     #in case we come here through a timeout
 
                 for key in self._req_by_owner:
                     if req_id in self._req_by_owner[key]: self._req_by_owner[key].remove(req_id)
@@ -630,15 +746,21 @@ class HistoricalDataManager(IBConnectivity):
     def createCompletedReqFor(self, req_id, start, end):
         completed_req = dict()
         completed_req['key'] = self._uid_by_req[req_id]
-        completed_req['data'] = self._historical_dfs.pop(req_id)
+        bar_type = self._bar_type_by_req[req_id]
+        accumulator = self._historical_bars.pop(req_id)
+        if (req_id in self._keep_up_requests):
+            self._historical_bars[req_id] = BarAccumulator()
+
+        if len(accumulator) == 0: return None
 
-        if len(completed_req['data']) == 0: return None
+        day_time_zone = self._contract_details_by_uid[completed_req['key']].time_zone if bar_type == Constants.DAY_BAR else None
+        completed_req['data'] = accumulator.toFrame(day_time_zone)
         
         first_date_stamp = datetime.fromtimestamp(completed_req['data'].index.min(), tz=utc)
         last_date_stamp = datetime.fromtimestamp(completed_req['data'].index.max(), tz=utc)
         
         completed_req['req_id'] = req_id
-        completed_req['bar type'] = self._bar_type_by_req[req_id]
+        completed_req['bar type'] = bar_type
 
         if not ((start is None) or (end is None)):
             completed_req['requested_range'] = self._date_ranges_by_req[req_id]
@@ -650,9 +772,6 @@ class HistoricalDataManager(IBConnectivity):
             completed_req['requested_range'] = (first_date_stamp, range_end)
             # completed_req['returned_range'] = ret_range
 
-        if (req_id in self._keep_up_requests):
-            self._historical_dfs[req_id] = pd.DataFrame(columns=[Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME])
-
         return completed_req
 
 
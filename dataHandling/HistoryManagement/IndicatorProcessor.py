@@ -18,7 +18,8 @@ from dataHandling.Constants import Constants, DT_BAR_TYPES
 from PyQt6.QtCore import pyqtSignal, pyqtSlot, QObject, Qt, QThread
 
 import itertools
-from generalFunctionality.GenFunctions import addRSIsEMAs, getLowsHighsCount, addEMAColumns
+from generalFunctionality.GenFunctions import getLowsHighsCount
+from dataHandling.HistoryManagement.StreamingIndicators import StreamingIndicatorEngine
 
 class IndicatorProcessor(QObject):
 
@@ -34,6 +35,7 @@ class IndicatorProcessor(QObject):
     rsi_bar_types = DT_BAR_TYPES
     ema_bar_types = DT_BAR_TYPES
     step_bar_types = DT_BAR_TYPES
+    step_bar_count = 50
 
 
     def __init__(self, data_buffers, indicators={'rsi', 'steps', 'emas'}, rsi_bars=DT_BAR_TYPES, ema_bars=DT_BAR_TYPES, step_bars=DT_BAR_TYPES):
@@ -43,6 +45,7 @@ class IndicatorProcessor(QObject):
         self.rsi_bar_types = rsi_bars
         self.ema_bar_types = ema_bars
         self.step_bar_types = step_bars
+        self.indicator_engine = StreamingIndicatorEngine()
 
         
 
@@ -134,9 +137,9 @@ class IndicatorProcessor(QObject):
         for uid, bar_type in itertools.product(updated_uids, bar_types):
 
             if self.data_buffers.bufferExists(uid, bar_type):
-                stock_frame = self.data_buffers.getBufferFor(uid, bar_type)
+                step_bars = self.data_buffers.getSnapshotFor(uid, bar_type, count=self.step_bar_count, columns=[Constants.LOW, Constants.HIGH])
                 
-                low_move, high_move, inner_bar_specs = getLowsHighsCount(stock_frame)
+                low_move, high_move, inner_bar_specs = getLowsHighsCount(step_bars, count=self.step_bar_count)
 
                 new_value_dict = {'UpSteps': low_move['count'], 'DownSteps': high_move['count'], 'UpLevel': low_move['level'] , 'DownLevel': high_move['level'], 'UpApex': low_move['apex'], 'DownApex': high_move['apex'], 'UpMove': low_move['move'], 'DownMove': high_move['move'], 'InnerCount': inner_bar_specs['count']}
                 self.data_buffers.setIndicatorValues(uid, bar_type, new_value_dict)
@@ -158,10 +161,13 @@ class IndicatorProcessor(QObject):
             if (from_indices is not None) and (bar_type in from_indices):
                 starting_index = from_indices[bar_type]
             if self.data_buffers.bufferExists(uid, bar_type):
-                stock_frame = self.data_buffers.getBufferFor(uid, bar_type)
-                if len(stock_frame) > 14:
-                    ema_padded_frame = addEMAColumns(stock_frame, periods, starting_index)
-                    self.data_buffers.setBufferFor(uid, bar_type, ema_padded_frame)
+                ema_columns = ['ema_' + str(period) for period in periods]
+                bars = self.data_buffers.getSnapshotFor(uid, bar_type, columns=[Constants.CLOSE] + ema_columns)
+                if len(bars) > 14:
+                    for period in periods:
+                        updated = self.indicator_engine.updateEMAs(uid, bar_type, bars, period, starting_index)
+                        if updated is not None:
+                            self.data_buffers.setColumnValuesAtIndices(uid, bar_type, *updated)
                     if not supress_signal:
                         self.indicator_updater.emit(Constants.HAS_NEW_VALUES, {'uid': uid, 'bar_type': bar_type, 'update_type': 'ema'})
 
@@ -180,10 +186,10 @@ class IndicatorProcessor(QObject):
             if (from_indices is not None) and (bar_type in from_indices):
                 starting_index = from_indices[bar_type]
             if self.data_buffers.bufferExists(uid, bar_type):
-                stock_frame = self.data_buffers.getBufferFor(uid, bar_type)
-                if len(stock_frame) > 14:
-                    rsi_padded_frame = addRSIsEMAs(stock_frame, starting_index)
-                    self.data_buffers.setBufferFor(uid, bar_type, rsi_padded_frame)
+                bars = self.data_buffers.getSnapshotFor(uid, bar_type, columns=[Constants.CLOSE, 'up_ema', 'down_ema'])
+                updated = self.indicator_engine.updateRSIs(uid, bar_type, bars, starting_index)
+                if updated is not None:
+                    self.data_buffers.setColumnValuesAtIndices(uid, bar_type, *updated)
                     if not supress_signal:
                         self.indicator_updater.emit(Constants.HAS_NEW_VALUES, {'uid': uid, 'bar_type': bar_type, 'update_type': 'rsi'})
 
@@ -0,0 +1,167 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os, json
+import numpy as np
+try:
+    import fcntl
+except ImportError:
+        #no advisory file locks (windows), every process then keeps its own buffers
+    fcntl = None
+
+from dataHandling.HistoryManagement.BarStore import BarSnapshot
+from dataHandling.HistoryManagement.BarArchive import writeAtomically
+
+
+class MappedBarCache:
+    """
+    Bars of (uid, bar_type) buffers in memory-mapped files, so that several processes reading the same
+    universe share one copy in the page cache instead of each holding their own. Every buffer has an
+    int64 timestamp file and a column-major float64 bar file with spare capacity, plus a small json
+    index with the generation, size, columns and requested ranges. The process that owns the buffers
+    publishes them, new bars are written into the existing files in place and only when the capacity
+    runs out a new generation of files is written. Readers map the files read-only.
+    """
+
+    growth_factor = 1.5
+    lock_file = 'publisher.lock'
+        #read-only mappings by (name, generation), they stay valid after the files are replaced
+    _mappings = dict()
+        #open lock files by folder of the caches this process publishes, the lock is held until the process exits
+    _publisher_locks = dict()
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+
+    def nameFor(self, uid, bar_type):
+        return str(uid) + '_' + bar_type
+
+
+    def pathFor(self, name, generation, kind):
+        return os.path.join(self.folder, f"{name}.{generation}.{kind}.npy")
+
+
+    def indexPathFor(self, name):
+        return os.path.join(self.folder, name + '.json')
+
+
+    def readIndex(self, uid, bar_type):
+        try:
+            with open(self.indexPathFor(self.nameFor(uid, bar_type)), 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+
+    @classmethod
+    def claimPublisher(cls, folder):
+            #True for the first process to claim the folder, False for later ones, None where locks are not supported
+        if fcntl is None:
+            return None
+        if folder in cls._publisher_locks:
+            return True
+
+        os.makedirs(folder, exist_ok=True)
+        lock_file = open(os.path.join(folder, cls.lock_file), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        cls._publisher_locks[folder] = lock_file
+        return True
+
+
+    def contains(self, uid, bar_type):
+        return os.path.exists(self.indexPathFor(self.nameFor(uid, bar_type)))
+
+    ###### publishing
+
+    def publish(self, uid, bar_type, snapshot, requested_ranges, from_position=0):
+        """
+        Writes the bars of snapshot from from_position on, all earlier bars must be unchanged since the
+        previous publish. requested_ranges are epoch second pairs as given by RangeObject.serialize
+        """
+        name = self.nameFor(uid, bar_type)
+        index = self.readIndex(uid, bar_type)
+        columns = snapshot.columns
+        size = len(snapshot)
+
+        if index is not None and index['columns'] == columns and size <= index['capacity'] and from_position <= index['size']:
+            generation, capacity = index['generation'], index['capacity']
+            timestamps = np.load(self.pathFor(name, generation, 'timestamps'), mmap_mode='r+')
+            bars = np.load(self.pathFor(name, generation, 'bars'), mmap_mode='r+')
+            timestamps[from_position:size] = snapshot.index[from_position:]
+            for col_index, column in enumerate(columns):
+                bars[from_position:size, col_index] = snapshot[column][from_position:]
+            timestamps.flush()
+            bars.flush()
+            del timestamps, bars
+        else:
+            generation = 0 if index is None else index['generation'] + 1
+            capacity = max(int(size * self.growth_factor), 1)
+            timestamps = np.zeros(capacity, dtype=np.int64)
+            timestamps[:size] = snapshot.index
+            bars = np.full((capacity, len(columns)), np.nan, dtype=np.float64, order='F')
+            for col_index, column in enumerate(columns):
+                bars[:size, col_index] = snapshot[column]
+            writeAtomically(self.pathFor(name, generation, 'timestamps'), lambda file: np.save(file, timestamps))
+            writeAtomically(self.pathFor(name, generation, 'bars'), lambda file: np.save(file, bars))
+
+            #readers pick up the new size (and generation) from the index, which is replaced last
+        new_index = {'generation': generation, 'size': size, 'capacity': capacity, 'columns': columns, 'version': snapshot.version, 'requested_ranges': [list(rng) for rng in requested_ranges]}
+        index_string = json.dumps(new_index).encode()
+        writeAtomically(self.indexPathFor(name), lambda file: file.write(index_string))
+
+        if index is not None and index['generation'] != generation:
+            self.removeGeneration(name, index['generation'])
+
+
+    def removeGeneration(self, name, generation):
+            #on posix existing mappings outlive the files, elsewhere the files stay until the next generation
+        for kind in ['timestamps', 'bars']:
+            try:
+                os.remove(self.pathFor(name, generation, kind))
+            except OSError:
+                pass
+
+    ###### reading
+
+    def mappedArrays(self, name, generation):
+        if (name, generation) not in self._mappings:
+            for key in [key for key in self._mappings if key[0] == name]:
+                del self._mappings[key]
+            timestamps = np.load(self.pathFor(name, generation, 'timestamps'), mmap_mode='r')
+            bars = np.load(self.pathFor(name, generation, 'bars'), mmap_mode='r')
+            self._mappings[name, generation] = (timestamps, bars)
+        return self._mappings[name, generation]
+
+
+    def snapshot(self, uid, bar_type, start=None, columns=None):
+        index = self.readIndex(uid, bar_type)
+        if index is None:
+            return None
+
+        timestamps, bars = self.mappedArrays(self.nameFor(uid, bar_type), index['generation'])
+        size = index['size']
+        selection = slice(start, size) if (start is None or start >= 0) else slice(max(size + start, 0), size)
+        column_views = {column: bars[selection, col_index] for col_index, column in enumerate(index['columns']) if columns is None or column in columns}
+        return BarSnapshot(timestamps[selection], column_views, index['version'])
+
+
+    def requestedRanges(self, uid, bar_type):
+        index = self.readIndex(uid, bar_type)
+        return [] if index is None else index['requested_ranges']
@@ -1,43 +1,21 @@
+from bisect import bisect_left, bisect_right
 from datetime import datetime
 from pytz import utc    
 
-def mergeAdjRanges(date_ranges):
-    date_ranges.sort()  # Ensure the ranges are sorted (in-place)
-    for index_right in reversed(range(len(date_ranges))):
-        date_range_right = date_ranges[index_right]
-        for index_left in range(index_right):
-            date_range_left = date_ranges[index_left]
-            if (date_range_right[0] >= date_range_left[0]) and (date_range_right[1] <= date_range_left[1]):
-                del date_ranges[index_right]
-                break
-            elif (date_range_right[0] <= date_range_left[1]) and (date_range_right[1] > date_range_left[1]):
-                date_ranges[index_left] = (date_range_left[0], date_range_right[1])
-                del date_ranges[index_right]
-                break
-            elif (date_range_right[1] >= date_range_left[0]) and (date_range_right[0] < date_range_left[0]):
-                date_ranges[index_left] = (date_range_right[0], date_range_left[1])
-                del date_ranges[index_right]
-                break
-
-    return date_ranges
-
 
 class RangeObject:
+    """
+    The date ranges that have been requested for a buffer, kept as sorted, disjoint closed intervals
+    in two parallel lists of starts and ends. Overlapping or touching ranges are merged on insert,
+    so coverage lookups and inserts are a binary search plus a slice replacement.
+    """
 
     def __init__(self, requested_ranges=None):
+        self._starts = []
+        self._ends = []
         if requested_ranges is not None:
-            self._requested_ranges = self.constrainRanges(requested_ranges)
-        else:
-            self._requested_ranges = []
-
-
-    def constrainRanges(self, ranges):
-        for index, rng in enumerate(ranges):
-            constrained_range = self.constrainRange(rng)
-            if constrained_range != []:
-                ranges[index] = constrained_range
-
-        return ranges
+            for rng in requested_ranges:
+                self.addRanges(rng)
 
 
     def constrainRange(self, rng):
@@ -51,32 +29,64 @@ class RangeObject:
 
 
     def containsRange(self, inner_range):
-
-        for req_range in self._requested_ranges:
-            if (inner_range[0] >= req_range[0]) and (inner_range[1] <= req_range[1]):
-                return True
-        return False
+        index = bisect_right(self._starts, inner_range[0]) - 1
+        return index >= 0 and inner_range[1] <= self._ends[index]
 
 
     def withinRange(self, dt_object):
-
-        for req_range in self._requested_ranges:
-            if (dt_object >= req_range[0]) and (dt_object <= req_range[1]):
-                return True
-        return False
+        index = bisect_right(self._starts, dt_object) - 1
+        return index >= 0 and dt_object <= self._ends[index]
 
 
     def addRanges(self, req_range):
         req_range = self.constrainRange(req_range)
-        self._requested_ranges.append(req_range)
-        self._requested_ranges = mergeAdjRanges(self._requested_ranges)
+        if len(req_range) == 0:
+            return
+
+        start, end = req_range
+            #the ranges from first_index up to last_index overlap or touch the new one
+        first_index = bisect_left(self._ends, start)
+        last_index = bisect_right(self._starts, end)
+        if first_index < last_index:
+            start = min(start, self._starts[first_index])
+            end = max(end, self._ends[last_index-1])
+        self._starts[first_index:last_index] = [start]
+        self._ends[first_index:last_index] = [end]
+
+
+    def missingRanges(self, desired_range):
+            #the gaps in the requested ranges that fall within the desired range
+        desired_start, desired_end = desired_range
+        missing_ranges = []
+        current_start = desired_start
+
+        first_index = bisect_right(self._ends, desired_start)
+        last_index = bisect_left(self._starts, desired_end)
+        for start, end in zip(self._starts[first_index:last_index], self._ends[first_index:last_index]):
+            if start > current_start:
+                missing_ranges.append((current_start, start))
+            current_start = max(current_start, end)
+
+        if current_start < desired_end:
+            missing_ranges.append((current_start, desired_end))
+        return missing_ranges
 
         
     def getRanges(self):
-        return self._requested_ranges
+        return list(zip(self._starts, self._ends))
         
 
     def getRequestedRanges(self):
-        return self._requested_ranges
+        return self.getRanges()
+
+    ##################### Serialization
+
+    def serialize(self):
+            #epoch seconds pairs, these pickle much smaller than timezone aware datetimes
+        return [(int(start.timestamp()), int(end.timestamp())) for start, end in zip(self._starts, self._ends)]
 
 
+    @staticmethod
+    def rangesFromSerialized(serialized_ranges):
+            #older buffers stored the datetime tuples themselves
+        return [(start, end) if isinstance(start, datetime) else (datetime.fromtimestamp(start, utc), datetime.fromtimestamp(end, utc)) for start, end in serialized_ranges]
@@ -0,0 +1,125 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import heapq
+from itertools import count
+
+
+class RequestScheduler:
+    """
+    Queue of requests waiting to be submitted, with a binary heap per owner ordered by key_function
+    (lowest first). Owners take turns: the next request comes from the owner with the highest priority,
+    then the one whose next request has the lowest first key element (its urgency), and among those from
+    the one that was served longest ago. Requests can be cancelled one by one, which marks them and skips
+    them once they come up, or per owner at once.
+    """
+
+    def __init__(self, key_function):
+        self.key_function = key_function
+        self._heaps = dict()
+        self._owner_priorities = dict()
+        self._last_served = dict()
+            #cancelled entries by sequence number, as req_ids can be handed out again
+        self._cancelled = set()
+        self._queued_ids = dict()
+        self._sequence = count()
+
+
+    def __len__(self):
+        return len(self._queued_ids)
+
+
+    def setOwnerPriority(self, owner_id, priority):
+            #owners with a higher priority go first, 0 by default
+        self._owner_priorities[owner_id] = priority
+
+
+    def push(self, owner_id, request):
+        if not (owner_id in self._heaps):
+            self._heaps[owner_id] = []
+            #the sequence keeps requests with equal keys in order of arrival
+        sequence = next(self._sequence)
+        heapq.heappush(self._heaps[owner_id], (self.key_function(request), sequence, request))
+        self._queued_ids[request.req_id] = sequence
+
+
+    def pushAll(self, owner_id, requests):
+        for request in requests:
+            self.push(owner_id, request)
+
+
+    def pop(self):
+        owner_id = self.nextOwner()
+        if owner_id is None:
+            return None
+
+        _, _, request = heapq.heappop(self._heaps[owner_id])
+        del self._queued_ids[request.req_id]
+        self._last_served[owner_id] = next(self._sequence)
+        self.dropCancelled(owner_id)
+        return request
+
+
+    def peek(self):
+            #the request pop would return, without taking it off
+        owner_id = self.nextOwner()
+        return None if owner_id is None else self._heaps[owner_id][0][2]
+
+
+    def nextOwner(self):
+        best_owner, best_rank = None, None
+        for owner_id in self._heaps:
+            self.dropCancelled(owner_id)
+            if len(self._heaps[owner_id]) > 0:
+                rank = (-self._owner_priorities.get(owner_id, 0), self._heaps[owner_id][0][0][0], self._last_served.get(owner_id, -1))
+                if best_rank is None or rank < best_rank:
+                    best_owner, best_rank = owner_id, rank
+        return best_owner
+
+
+    def dropCancelled(self, owner_id):
+            #lazy deletion, cancelled requests are only taken off when they reach the top
+        heap = self._heaps[owner_id]
+        while len(heap) > 0 and heap[0][1] in self._cancelled:
+            self._cancelled.discard(heapq.heappop(heap)[1])
+
+
+    def cancel(self, req_ids):
+        for req_id in req_ids:
+            if req_id in self._queued_ids:
+                self._cancelled.add(self._queued_ids.pop(req_id))
+
+
+    def cancelOwner(self, owner_id):
+            #returns the requests that were still queued
+        cancelled_requests = []
+        for _, sequence, request in self._heaps.pop(owner_id, []):
+            if sequence in self._cancelled:
+                self._cancelled.discard(sequence)
+            else:
+                del self._queued_ids[request.req_id]
+                cancelled_requests.append(request)
+        self._last_served.pop(owner_id, None)
+        return cancelled_requests
+
+
+    def clear(self):
+        self._heaps = dict()
+        self._last_served = dict()
+        self._cancelled = set()
+        self._queued_ids = dict()
+
+
+    def requestIds(self):
+        return set(self._queued_ids)
@@ -0,0 +1,173 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+import pandas as pd
+
+from dataHandling.Constants import Constants
+from generalFunctionality.GenFunctions import calculateRSIfromEMAs
+
+
+def emaRecurrence(start_value, inputs, alpha, loop_limit=32):
+        #returns the ema after each input, given the ema before the first one
+    if len(inputs) <= loop_limit:
+        emas = np.empty(len(inputs))
+        ema = start_value
+        for index, value in enumerate(inputs):
+            ema = (1 - alpha) * ema + alpha * value
+            emas[index] = ema
+        return emas
+    else:
+        seeded = pd.Series(np.concatenate(([start_value], inputs)))
+        return seeded.ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def upsAndDowns(closes):
+    diffs = np.diff(closes)
+    return np.clip(diffs, 0, None), np.clip(-diffs, 0, None)
+
+
+class RecurrenceState:
+    """State of a recurrence through the last completed bar; the last bar itself is never committed as it may still be revised."""
+
+    __slots__ = ('timestamp', 'close', 'values')
+
+    def __init__(self, timestamp, close, values):
+        self.timestamp = timestamp
+        self.close = close
+        self.values = values
+
+
+class StreamingIndicatorEngine:
+    """
+    Keeps the Wilder up/down EMAs (for the RSI) and close EMAs per (uid, bar_type) between updates.
+    On a live update only the bars after the last completed bar are run through the recurrence,
+    so the cost per tick does not depend on the length of the history. When older bars are revised
+    the recurrence restarts from the EMAs stored in the buffer just before the first revised bar,
+    and it falls back to a full (vectorized) computation when no usable state exists.
+    The RSI is Wilder's, seeded with the average move over the first period. The earlier pandas
+    ewm(adjust=True) version with 0.001 placeholders for the first bars gave somewhat different values,
+    mostly early in a buffer, and the first period now has no RSI instead of one from the placeholders.
+    The close EMAs start at the first close without bias correction, like pandas ewm(span=period, adjust=False).
+    The earlier ewm(adjust=True) weighed the first closes differently, so the values early in a buffer changed
+    too; the two converge after a few times the period.
+    """
+
+    rsi_period = 14
+
+    def __init__(self):
+        self._rsi_states = dict()
+        self._ema_states = dict()
+
+
+    def clearStatesFor(self, uid):
+        for states in [self._rsi_states, self._ema_states]:
+            for key in [key for key in states if key[0] == uid]:
+                del states[key]
+
+    ################ RSI
+
+    def updateRSIs(self, uid, bar_type, bars, from_index=None):
+        closes = bars[Constants.CLOSE]
+        if len(closes) <= self.rsi_period:
+            return None
+
+        restart = self.getRestartPoint(self._rsi_states.get((uid, bar_type)), bars, from_index, ['up_ema', 'down_ema'], self.rsi_period)
+        if restart is None:
+            start, up_emas, down_emas = self.calculateRSIEMAsFromScratch(closes)
+        else:
+            start, (up_ema, down_ema) = restart
+            ups, downs = upsAndDowns(closes[start:])
+            up_emas = emaRecurrence(up_ema, ups, 1/self.rsi_period)
+            down_emas = emaRecurrence(down_ema, downs, 1/self.rsi_period)
+            start += 1
+
+        if len(up_emas) == 0:
+            return None
+
+        last_complete = len(closes) - 2
+        if last_complete >= start:
+            offset = last_complete - start
+            self._rsi_states[uid, bar_type] = RecurrenceState(bars.index[last_complete], closes[last_complete], (up_emas[offset], down_emas[offset]))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsis = np.round(calculateRSIfromEMAs(up_emas, down_emas), 1)
+        return bars.index[start:], {'up_ema': up_emas, 'down_ema': down_emas, 'rsi': rsis}
+
+
+    def setRSIState(self, uid, bar_type, timestamp, close, up_ema, down_ema):
+            #the EMAs through the last completed bar when they were calculated elsewhere, like for a batch of symbols
+        self._rsi_states[uid, bar_type] = RecurrenceState(timestamp, close, (up_ema, down_ema))
+
+
+    def calculateRSIEMAsFromScratch(self, closes):
+            #Wilder's smoothing, seeded with the average move over the first period
+        ups, downs = upsAndDowns(closes)
+        period = self.rsi_period
+        up_emas = np.full(len(closes), np.nan)
+        down_emas = np.full(len(closes), np.nan)
+        up_emas[period:] = np.concatenate(([ups[:period].mean()], emaRecurrence(ups[:period].mean(), ups[period:], 1/period)))
+        down_emas[period:] = np.concatenate(([downs[:period].mean()], emaRecurrence(downs[:period].mean(), downs[period:], 1/period)))
+        return 0, up_emas, down_emas
+
+    ################ EMA
+
+    def updateEMAs(self, uid, bar_type, bars, period, from_index=None):
+        closes = bars[Constants.CLOSE]
+        if len(closes) == 0:
+            return None
+
+        column_name = 'ema_' + str(period)
+        alpha = 2/(1+period)
+        restart = self.getRestartPoint(self._ema_states.get((uid, bar_type, period)), bars, from_index, [column_name], 0)
+        if restart is None:
+            start = 0
+            emas = emaRecurrence(closes[0], closes, alpha)
+        else:
+            start, (ema,) = restart
+            emas = emaRecurrence(ema, closes[start+1:], alpha)
+            start += 1
+
+        if len(emas) == 0:
+            return None
+
+        last_complete = len(closes) - 2
+        if last_complete >= start:
+            self._ema_states[uid, bar_type, period] = RecurrenceState(bars.index[last_complete], closes[last_complete], (emas[last_complete - start],))
+
+        return bars.index[start:], {column_name: emas}
+
+    ################ Shared
+
+    def getRestartPoint(self, state, bars, from_index, columns, min_position):
+        if state is None:
+            return None
+
+            #the committed bar must still be there, unchanged
+        position = bars.positionFrom(state.timestamp)
+        if position >= len(bars) or bars.index[position] != state.timestamp or bars[Constants.CLOSE][position] != state.close:
+            return None
+
+            #if bars before the committed one changed, we restart from the values stored just before them
+        if from_index is not None:
+            from_position = bars.positionFrom(from_index) - 1
+            if from_position < position:
+                if from_position < min_position or not all(column in bars for column in columns):
+                    return None
+                values = tuple(bars[column][from_position] for column in columns)
+                if np.any(np.isnan(values)):
+                    return None
+                return from_position, values
+
+        return position, state.values
@@ -23,6 +23,7 @@ from .Constants import Constants
 
 from dataHandling.DataStructures import DetailObject
 from dataHandling.Constants import Constants
+from dataHandling.RequestPacer import RequestPacer
 
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
@@ -33,131 +34,195 @@ from ibapi.ticktype import TickTypeEnum
 from ibapi.account_summary_tags import AccountSummaryTags
 
 from queue import Queue
+from collections import deque
+from bisect import bisect_left
 from pubsub import pub
 from threading import Thread
+import time
+
+
+    #cancels of subscriptions go out before new requests, to free up lines and stop data we no longer want
+PRIORITY_REQUEST_TYPES = {'cancelMktData', 'cancelHistoricalData'}
+
+
+class LatencyHistogram:
+    """
+    Counts of latencies in milliseconds per bucket, every bound being the upper bound of its bucket.
+    """
+
+    bounds = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1_000, 2_000, 5_000, 10_000, 60_000, float('inf'))
+
+    def __init__(self):
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+
+    def add(self, latency):
+        self.counts[bisect_left(self.bounds, latency)] += 1
+        self.count += 1
+        self.total += latency
+        self.maximum = max(self.maximum, latency)
+
+
+    def percentile(self, fraction):
+            #the upper bound of the bucket in which the fraction of the latencies is reached
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= fraction * self.count:
+                return min(bound, self.maximum)
+        return self.maximum
+
+
+    def getSummary(self):
+        return {'count': self.count, 'mean': self.total / max(self.count, 1), 'p50': self.percentile(0.5), 'p99': self.percentile(0.99), 'max': self.maximum,
+                'histogram': dict(zip(self.bounds, self.counts))}
+
+
+class IDAllocator:
+    """
+    Hands out the ids of one REQID_STEP band, counting up from its base and once the band is used up
+    taking the ids released since, oldest first. Released ids are only handed out again after that, so
+    late callbacks of a finished request don't end up at a new one.
+    """
+
+    def __init__(self, base, size=Constants.REQID_STEP):
+        self.base = base
+        self.end = base + size
+        self._next_id = base
+        self._released = deque()
+        self.in_use = set()
+
+
+    def allocate(self, excluded=set()):
+        if self._next_id < self.end:
+            new_id = self._next_id
+            self._next_id += 1
+        else:
+            new_id = self.recycle(excluded)
+        self.in_use.add(new_id)
+        return new_id
+
+
+    def recycle(self, excluded):
+        for _ in range(len(self._released)):
+            candidate = self._released.popleft()
+            if candidate in excluded:
+                self._released.append(candidate)
+            else:
+                return candidate
+        raise RuntimeError(f"IDAllocator has no ids left between {self.base} and {self.end}")
+
+
+    def release(self, req_id):
+        if req_id in self.in_use:
+            self.in_use.remove(req_id)
+            self._released.append(req_id)
 
 
 class ReqIDManager:
 
+        #the id type follows from its band, the req_id divided by REQID_STEP
+    option_buffer_band = Constants.BASE_OPTION_BUFFER_REQID // Constants.REQID_STEP
+    option_live_band = Constants.BASE_OPTION_LIVE_REQID // Constants.REQID_STEP
+    hist_min_max_band = Constants.BASE_HIST_MIN_MAX_REQID // Constants.REQID_STEP
+    hist_data_band = Constants.BASE_HIST_DATA_REQID // Constants.REQID_STEP
+    hist_bars_band = Constants.BASE_HIST_BARS_REQID // Constants.REQID_STEP
+    mkt_stock_band = Constants.BASE_MKT_STOCK_REQID // Constants.REQID_STEP
+    option_bands = frozenset([option_buffer_band, option_live_band])
+    history_bands = frozenset([hist_min_max_band, hist_data_band, hist_bars_band])
+
     
     def __init__(self):
         self._open_requests = set()
-        self._hist_req_ids = set()       #general log of open history requests, allows for creating unique id's
-        self._price_req_ids = set()
-        self._option_live_ids = set()
-        self._option_buffer_ids = set()
-        self._option_contract_ids = set()
+        self._hist_ids = IDAllocator(Constants.BASE_HIST_DATA_REQID)       #general log of open history requests, allows for creating unique id's
+        self._price_ids = IDAllocator(Constants.BASE_PRICE_REQID)
+        self._option_live_ids = IDAllocator(Constants.BASE_OPTION_LIVE_REQID)
+        self._option_buffer_ids = IDAllocator(Constants.BASE_OPTION_BUFFER_REQID)
+        self._option_contract_ids = IDAllocator(Constants.OPTION_CONTRACT_DEF_ID)
 
         
 
     def getNextPriceReqID(self):
-        if len(self._price_req_ids) == 0:
-            next_id = Constants.BASE_PRICE_REQID
-        else:
-            next_id = max(self._price_req_ids)+1
-
-        self._price_req_ids.add(next_id)
-        return next_id
+        return self._price_ids.allocate()
 
 
     def getNextOptionLiveID(self):
-        if len(self._option_live_ids) == 0:
-            next_id = Constants.BASE_OPTION_LIVE_REQID
-        else:
-            next_id = max(self._option_live_ids)+1
-
-        self._option_live_ids.add(next_id)
-        return next_id
+        return self._option_live_ids.allocate()
 
 
     def getNextOptionBufferID(self):
-        if len(self._option_buffer_ids) == 0:
-            next_id = Constants.BASE_OPTION_BUFFER_REQID
-        else:
-            next_id = max(self._option_buffer_ids)+1
-
-        self._option_buffer_ids.add(next_id)
-        return next_id
+        return self._option_buffer_ids.allocate()
 
 
     def getNextHistID(self, cancelling_req_ids=set()):
-        req_ids_in_use = self._hist_req_ids.union(cancelling_req_ids)
-        if len(req_ids_in_use) == 0:
-            new_id = Constants.BASE_HIST_DATA_REQID
-        else:
-            new_id = max(req_ids_in_use) + 1
-        
-        self._hist_req_ids.add(new_id)     #keep a trace requested but not yet used requests
-        return new_id
+            #ids that are still being cancelled are not handed out again
+        return self._hist_ids.allocate(cancelling_req_ids)
 
     
     def getNextOptionContractID(self):
-        if len(self._option_contract_ids) == 0:
-            next_id = Constants.OPTION_CONTRACT_DEF_ID
-        else:
-            next_id = max(self._option_contract_ids) + 1
-
-        self._option_contract_ids.add(next_id)
-        return next_id
+        return self._option_contract_ids.allocate()
             
 
     def clearPriceReqID(self, req_id):
-        if req_id in self._price_req_ids: self._price_req_ids.remove(req_id)
+        self._price_ids.release(req_id)
 
 
     def clearHistReqID(self, req_id):
-        if req_id in self._hist_req_ids: self._hist_req_ids.remove(req_id)
+        self._hist_ids.release(req_id)
 
 
     def clearHistReqIDs(self, req_ids):
         self._open_requests = self._open_requests - req_ids
 
     def getAllHistIDs(self):
-        return self._hist_req_ids.copy()
+        return self._hist_ids.in_use.copy()
 
 
     def isActiveHistID(self, req_id):
-        return (req_id in self._hist_req_ids)
+        return (req_id in self._hist_ids.in_use)
 
 
     def isStrikeType(self, req_id):
-        return (req_id >= Constants.BASE_OPTION_BUFFER_REQID and req_id < (Constants.BASE_OPTION_BUFFER_REQID + Constants.REQID_STEP))
+        return req_id // Constants.REQID_STEP == self.option_buffer_band
 
 
     def isExpType(self, req_id):
-        return (req_id >= Constants.BASE_OPTION_LIVE_REQID and req_id < (Constants.BASE_OPTION_LIVE_REQID + Constants.REQID_STEP))
+        return req_id // Constants.REQID_STEP == self.option_live_band
 
 
     def isOptionRequest(self, req_id):
-        return self.isExpType(req_id) or self.isStrikeType(req_id)
+        return req_id // Constants.REQID_STEP in self.option_bands
 
 
     def isLiveReqID(self, req_id):
-        return req_id >= Constants.BASE_OPTION_LIVE_REQID and (req_id < Constants.BASE_OPTION_LIVE_REQID + Constants.REQID_STEP)
+        return req_id // Constants.REQID_STEP == self.option_live_band
 
     
     def isBufferReqID(self, req_id):
-        return req_id >= Constants.BASE_OPTION_BUFFER_REQID and (req_id < Constants.BASE_OPTION_BUFFER_REQID + Constants.REQID_STEP)
+        return req_id // Constants.REQID_STEP == self.option_buffer_band
 
 
     def isPriceRequest(self, req_id):
-        return (req_id >= Constants.BASE_MKT_STOCK_REQID and req_id < (Constants.BASE_MKT_STOCK_REQID + Constants.REQID_STEP))
+        return req_id // Constants.REQID_STEP == self.mkt_stock_band
 
 
     def isHistDataRequest(self, req_id):
-        return (req_id >= Constants.BASE_HIST_DATA_REQID and req_id < (Constants.BASE_HIST_DATA_REQID + Constants.REQID_STEP))
+        return req_id // Constants.REQID_STEP == self.hist_data_band
 
 
     def isHistBarsRequest(self, req_id):
-        return (req_id >= Constants.BASE_HIST_BARS_REQID and req_id < (Constants.BASE_HIST_BARS_REQID + Constants.REQID_STEP))
+        return req_id // Constants.REQID_STEP == self.hist_bars_band
 
 
     def isHistMinMaxRequest(self, req_id):
-        return (req_id >= Constants.BASE_HIST_MIN_MAX_REQID and req_id < (Constants.BASE_HIST_MIN_MAX_REQID + Constants.REQID_STEP))
+        return req_id // Constants.REQID_STEP == self.hist_min_max_band
 
 
     def isHistoryRequest(self, req_id):
-        return (self.isHistMinMaxRequest(req_id) or self.isHistDataRequest(req_id) or self.isHistBarsRequest(req_id))
+        return req_id // Constants.REQID_STEP in self.history_bands
 
 
     def addOpenReq(self, req_id):
@@ -192,11 +257,13 @@ class IBConnectivity(EClient, EWrapper, QObject):
     _cont_hist = set()
 
     req_id_manager = ReqIDManager()
+    pacer = RequestPacer()
 
     _active_price_req_id = None
     snapshot = False
 
     queue_timer = None
+    batch_size = 20
     restart_timer_signal = pyqtSignal()
     latest_price_signal = pyqtSignal(float, str)
 
@@ -213,6 +280,13 @@ class IBConnectivity(EClient, EWrapper, QObject):
         self.client_id = client_id
         self.name = name
         self.request_queue = Queue()
+            #requests waiting for the socket as (time queued, request), the ones held back by the pacer with a due time in front
+        self._cancel_requests = deque()
+        self._pending_requests = deque()
+        self._paced_requests = []
+        self._pending_req_ids = set()
+        self._withdrawn_req_ids = set()
+        self._queue_latencies = dict()
         
         EClient.__init__(self, self)
         QObject.__init__(self)
@@ -302,6 +376,11 @@ class IBConnectivity(EClient, EWrapper, QObject):
         else:
             pub.sendMessage('log', message=f"Error: {req_id}, code: {errorCode}, message: {errorString}, req_id: {req_id}")
         
+        if errorCode == 162 and 'pacing violation' in errorString.lower():
+            self.pacer.registerViolation(req_id)
+        elif errorCode == 100:
+            self.pacer.registerMessageViolation()
+
         if errorCode == 200 or errorCode == 162:
             if self.req_id_manager.isOpenReqID(req_id):
                 self.req_id_manager.clearHistReqID(req_id)
@@ -330,14 +409,14 @@ class IBConnectivity(EClient, EWrapper, QObject):
         self.next_order_ID = orderId
 
         if self._managed_accounts_initialized:
-            if (not self.queue_timer.isActive()) and not(self.request_queue.empty()):
+            if (not self.queue_timer.isActive()) and not(self.request_queue.empty() and not self.hasPendingRequests()):
                 self.restart_timer_signal.emit()
         self._next_valid_initialized = True
         
 
     def managedAccounts(self, accountsList: str):
         if self._next_valid_initialized:
-            if (not self.queue_timer.isActive()) and not(self.request_queue.empty()):
+            if (not self.queue_timer.isActive()) and not(self.request_queue.empty() and not self.hasPendingRequests()):
                 self.restart_timer_signal.emit()
         self._managed_accounts_initialized = True
         self.api_updater.emit(Constants.MANAGED_ACCOUNT_LIST, {'account_list': accountsList, 'owners': self.owners})
@@ -361,7 +440,7 @@ class IBConnectivity(EClient, EWrapper, QObject):
 
 
     def makeRequest(self, request):
-        self.request_queue.put(request)
+        self.request_queue.put((time.monotonic(), request))
         if (self.queue_timer is not None) and (not (self.queue_timer.isActive())) and self.readyForRequests():
             self.restart_timer_signal.emit()
 
@@ -373,15 +452,96 @@ class IBConnectivity(EClient, EWrapper, QObject):
 
     @pyqtSlot()
     def processQueue(self):
-        if not self.request_queue.empty():
-            request = self.request_queue.get_nowait()
+        self.collectQueuedRequests()
+
+            #up to batch_size requests per tick, as long as the message rate allows
+        dispatched = 0
+        while dispatched < self.batch_size and self.pacer.messageDelay() == 0:
+            entry = self.nextDispatchable()
+            if entry is None:
+                break
+            queued_at, request = entry
             self.processRequest(request)
-            self.request_queue.task_done()
+            self.recordQueueLatency(request['type'], queued_at)
+            dispatched += 1
         
-        if self.request_queue.empty():
+        if self.request_queue.empty() and not self.hasPendingRequests():
             self.queue_timer.stop()
 
 
+    def collectQueuedRequests(self):
+            #moves the queued requests over to the structures below, which are only touched on the queue timer
+        while not self.request_queue.empty():
+            queued_at, request = self.request_queue.get_nowait()
+            self.request_queue.task_done()
+            if request['type'] in PRIORITY_REQUEST_TYPES:
+                    #a request that is cancelled before it is sent is never sent, so neither is its cancel
+                if not self.withdrawRequest(request['req_id']):
+                    self._cancel_requests.append((queued_at, request))
+            else:
+                if 'req_id' in request:
+                    self._pending_req_ids.add(request['req_id'])
+                self._pending_requests.append((queued_at, request))
+
+
+    def withdrawRequest(self, req_id):
+        if req_id in self._pending_req_ids:
+            self._pending_req_ids.remove(req_id)
+            self._withdrawn_req_ids.add(req_id)
+            return True
+        for index, (_, _, paced_request) in enumerate(self._paced_requests):
+            if paced_request.get('req_id') == req_id:
+                del self._paced_requests[index]
+                return True
+        return False
+
+
+    def nextDispatchable(self):
+            #cancels go first, then held back requests that are due and then the others in order of arrival
+        now = time.monotonic()
+        if len(self._cancel_requests) > 0:
+            queued_at, request = self._cancel_requests.popleft()
+            self.pacer.acquire(request, now)
+            return (queued_at, request)
+
+        for index, (due_time, queued_at, request) in enumerate(self._paced_requests):
+            if due_time <= now:
+                delay = self.pacer.acquire(request, now)
+                if delay == 0:
+                    del self._paced_requests[index]
+                    return (queued_at, request)
+                self._paced_requests[index] = (now + delay, queued_at, request)
+
+        while len(self._pending_requests) > 0:
+            queued_at, request = self._pending_requests.popleft()
+            if 'req_id' in request:
+                if request['req_id'] in self._withdrawn_req_ids:
+                    self._withdrawn_req_ids.remove(request['req_id'])
+                    continue
+                self._pending_req_ids.discard(request['req_id'])
+
+            delay = self.pacer.acquire(request, now)
+            if delay == 0:
+                return (queued_at, request)
+            self._paced_requests.append((now + delay, queued_at, request))
+        return None
+
+
+    def hasPendingRequests(self):
+        return len(self._cancel_requests) > 0 or len(self._pending_requests) > 0 or len(self._paced_requests) > 0
+
+
+    def recordQueueLatency(self, req_type, queued_at):
+        if not (req_type in self._queue_latencies):
+            self._queue_latencies[req_type] = LatencyHistogram()
+        self._queue_latencies[req_type].add(1_000 * (time.monotonic() - queued_at))
+
+
+    def getQueueLatencies(self):
+            #summaries of the time requests spent between makeRequest and the socket, in ms by request type
+        return {req_type: histogram.getSummary() for req_type, histogram in list(self._queue_latencies.items())}
+
+
     def processRequest(self, request):
         req_type = request['type']
 
@@ -0,0 +1,806 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Local stand-in for TWS/the Gateway, to run the managers without an IB connection and to benchmark them.
+    #Run from the repository root: python -m dataHandling.IBSimulator [port] [speed] [buffer folder to replay]
+
+import heapq, math, socket, struct, sys, time, zlib
+from collections import deque
+from datetime import datetime, timedelta
+from itertools import count
+from threading import Condition, Lock, Thread
+import numpy as np
+import pandas as pd
+from pytz import utc
+
+from ibapi import comm
+from ibapi.contract import Contract, ContractDetails
+from ibapi.message import IN, OUT
+from ibapi.ticktype import TickTypeEnum
+
+from dataHandling.Constants import Constants, MINUTES_PER_BAR
+from dataHandling.RequestPacer import RequestPacer
+from dataHandling.HistoryManagement.BarArchive import BarArchive
+
+
+    #the layouts of all messages below are those of this version, so clients have to support it
+SERVER_VERSION = 157
+    #messages reach TWS later than the client sent them and not evenly so, the message rate is counted over a window this much shorter
+ARRIVAL_JITTER = 0.05
+PACING_VIOLATION = "Historical Market Data Service error message:Historical data request pacing violation"
+
+
+class SimulatedClock:
+    """
+    Market time that starts at start_time (epoch seconds) and runs speed times as fast as the wall clock.
+    """
+
+    def __init__(self, start_time=None, speed=1.0):
+        self.start_time = time.time() if start_time is None else start_time
+        self.speed = speed
+        self._started_at = time.monotonic()
+
+
+    def now(self):
+        return self.start_time + self.speed * (time.monotonic() - self._started_at)
+
+
+    def wallSeconds(self, market_seconds):
+        return market_seconds / self.speed
+
+
+class SimulatedMarket:
+    """
+    Deterministic data for the simulator. Prices only depend on the conId and the time, so overlapping
+    requests get the same bars and runs with the same start time the same responses. Bars that are found in
+    the BarArchive of recorded_folder, as saved by DataBuffers, are replayed from there instead.
+    """
+
+    volatility = 0.3
+    interest_rate = 0.04
+    option_exchanges = [Constants.DEFAULT_OPT_EXC, "CBOE"]
+
+    def __init__(self, clock, recorded_folder=None):
+        self.clock = clock
+        self.recorded = BarArchive(recorded_folder) if recorded_folder is not None else None
+        self._symbols = dict()
+        self._option_con_ids = dict()
+        self._chains = dict()
+
+
+    def conIdFor(self, symbol):
+        con_id = 10_000_000 + zlib.crc32(symbol.encode()) % 90_000_000
+        self._symbols[con_id] = symbol
+        return con_id
+
+
+    def symbolFor(self, con_id):
+        return self._symbols.get(con_id, f"SIM{con_id}")
+
+
+    def underlyingFor(self, contract):
+        if contract.secType == Constants.STOCK and contract.conId != 0:
+            return contract.conId
+        return self.conIdFor(contract.symbol)
+
+
+    ###### prices and bars
+
+    def uniform(self, con_id, keys, salt=0):
+            #pseudo random numbers in [0, 1) that only depend on their arguments
+        values = np.asarray(keys, dtype=np.uint64) * np.uint64(2654435761) + np.uint64(con_id * 40503 + salt * 7919)
+        values = (values ^ (values >> np.uint64(15))) % np.uint64(2**32)
+        values = (values * np.uint64(2246822519)) % np.uint64(2**32)
+        return (values ^ (values >> np.uint64(13))) / 2**32
+
+
+    def priceAt(self, con_id, timestamps):
+            #a slow and a daily wave with noise per minute around a base price that follows from the conId
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        base_price = 20 + con_id % 480
+        phase = 2 * np.pi * (con_id % 1_000) / 1_000
+        moves = 0.15 * np.sin(2 * np.pi * timestamps / (90 * 86_400) + phase) + 0.01 * np.sin(2 * np.pi * timestamps / 86_400 + 3 * phase)
+        noise = 0.004 * (self.uniform(con_id, timestamps // 60) - 0.5)
+        return np.round(base_price * np.exp(moves + noise), 2)
+
+
+    def barStarts(self, bar_type, begin, end, regular_hours):
+            #starts of the bars in [begin, end) within the sessions, day bars start at midnight New York time
+        if bar_type == Constants.DAY_BAR:
+            days = pd.date_range(pd.Timestamp(begin, unit='s', tz=utc).tz_convert(Constants.NYC_TIMEZONE).normalize(), pd.Timestamp(end, unit='s', tz=utc).tz_convert(Constants.NYC_TIMEZONE), freq='D')
+            days = days[days.dayofweek < 5]
+            starts = days.asi8 // 10**9
+            return starts[(starts >= begin - 86_400) & (starts < end)]
+
+        seconds = 60 * MINUTES_PER_BAR[bar_type]
+        starts = np.arange(int(math.ceil(begin / seconds)) * seconds, end, seconds, dtype=np.int64)
+        local_times = pd.DatetimeIndex(starts * 10**9, tz=utc).tz_convert(Constants.NYC_TIMEZONE)
+        minutes = local_times.hour * 60 + local_times.minute
+        session = (570, 960) if regular_hours else (240, 1_200)
+        in_session = (local_times.dayofweek < 5) & (minutes >= session[0]) & (minutes < session[1])
+        return starts[np.asarray(in_session)]
+
+
+    def barsFor(self, con_id, bar_type, begin, end, regular_hours):
+            #starts, opens, highs, lows, closes and volumes of the bars in [begin, end)
+        if self.recorded is not None and self.recorded.exists(con_id, bar_type):
+            frame, _ = self.recorded.load(con_id, bar_type)
+            frame = frame[(frame.index >= begin) & (frame.index < end)]
+            columns = [Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME]
+            return (frame.index.to_numpy(dtype=np.int64), *[frame[column].to_numpy() for column in columns])
+
+        starts = self.barStarts(bar_type, begin, end, regular_hours)
+        seconds = 60 * MINUTES_PER_BAR[bar_type]
+        if bar_type == Constants.DAY_BAR:
+                #the day runs from the open until the close in New York
+            opens, closes = self.priceAt(con_id, starts + 34_200), self.priceAt(con_id, starts + 57_600)
+        else:
+            opens, closes = self.priceAt(con_id, starts), self.priceAt(con_id, starts + seconds - 1)
+        highs = np.round(np.maximum(opens, closes) * (1 + 0.003 * self.uniform(con_id, starts, 1)), 2)
+        lows = np.round(np.minimum(opens, closes) * (1 - 0.003 * self.uniform(con_id, starts, 2)), 2)
+        volumes = np.floor((1_000 + 20_000 * self.uniform(con_id, starts, 3)) * seconds / 300)
+        return (starts, opens, highs, lows, closes, volumes)
+
+
+    def barInProgress(self, con_id, bar_type, now):
+            #the bar that contains now as far as it has come, for updates of kept up requests
+        if bar_type == Constants.DAY_BAR:
+            start = int(self.barStarts(bar_type, now - 4 * 86_400, now, True)[-1])
+            open_price = self.priceAt(con_id, [start + 34_200])[0]
+        else:
+            seconds = 60 * MINUTES_PER_BAR[bar_type]
+            start = int(now // seconds * seconds)
+            open_price = self.priceAt(con_id, [start])[0]
+        close = self.priceAt(con_id, [now])[0]
+        volume = math.floor(1_000 + 20_000 * self.uniform(con_id, [int(now) // 60], 4)[0])
+        return (start, open_price, max(open_price, close), min(open_price, close), close, volume)
+
+
+    def headTimestamp(self, con_id):
+        if self.recorded is not None and self.recorded.exists(con_id, Constants.DAY_BAR):
+            frame, _ = self.recorded.load(con_id, Constants.DAY_BAR)
+            if len(frame) > 0:
+                return int(frame.index.min())
+        listed = datetime.fromtimestamp(self.clock.start_time, utc).replace(hour=13, minute=30, second=0, microsecond=0)
+        return int((listed - timedelta(days=365 * (5 + con_id % 20))).timestamp())
+
+
+    ###### options
+
+    def optionChain(self, con_id):
+            #expirations and strikes are fixed at the start of the run: weeklies, monthlies and two leaps
+        if not (con_id in self._chains):
+            today = datetime.fromtimestamp(self.clock.start_time, utc).date()
+            fridays = [today + timedelta(days=offset) for offset in range(1, 800) if (today + timedelta(days=offset)).weekday() == 4]
+            third_fridays = [day for day in fridays if 15 <= day.day <= 21]
+            expirations = set(fridays[:8]) | set(third_fridays[:12]) | {day for day in third_fridays if day.month == 1 and day.year > today.year}
+            expirations = sorted(day.strftime("%Y%m%d") for day in expirations)
+
+            price = float(self.priceAt(con_id, [self.clock.start_time])[0])
+            step = 1.0 if price < 50 else (2.5 if price < 200 else 5.0)
+            strikes = [round(strike, 2) for strike in np.arange(math.floor(0.5 * price / step) * step, 1.5 * price, step)]
+            self._chains[con_id] = (expirations, strikes)
+        return self._chains[con_id]
+
+
+    def optionConId(self, con_id, expiration, strike, right):
+        option_con_id = 100_000_000 + zlib.crc32(f"{con_id}{expiration}{strike}{right}".encode()) % 900_000_000
+        self._option_con_ids[option_con_id] = (con_id, expiration, strike, right)
+        return option_con_id
+
+
+    def optionQuote(self, con_id, expiration, strike, right):
+            #Black-Scholes price and greeks, with the expiration at the close in New York
+        now = self.clock.now()
+        underlying = float(self.priceAt(con_id, [now])[0])
+        expires_at = pd.Timestamp(expiration, tz=Constants.NYC_TIMEZONE).timestamp() + 57_600
+        years = max(expires_at - now, 3_600) / (365 * 86_400)
+        volatility = self.volatility * (1 + 0.5 * abs(math.log(strike / underlying)))
+
+        root_years = math.sqrt(years)
+        d1 = (math.log(underlying / strike) + (self.interest_rate + volatility**2 / 2) * years) / (volatility * root_years)
+        d2 = d1 - volatility * root_years
+        normal_cdf = lambda value: 0.5 * (1 + math.erf(value / math.sqrt(2)))
+        density = math.exp(-d1**2 / 2) / math.sqrt(2 * math.pi)
+        discount = math.exp(-self.interest_rate * years)
+        if right == Constants.CALL:
+            price = underlying * normal_cdf(d1) - strike * discount * normal_cdf(d2)
+            delta = normal_cdf(d1)
+            theta = -underlying * density * volatility / (2 * root_years) - self.interest_rate * strike * discount * normal_cdf(d2)
+        else:
+            price = strike * discount * normal_cdf(-d2) - underlying * normal_cdf(-d1)
+            delta = normal_cdf(d1) - 1
+            theta = -underlying * density * volatility / (2 * root_years) + self.interest_rate * strike * discount * normal_cdf(-d2)
+        gamma = density / (underlying * volatility * root_years)
+        vega = underlying * density * root_years / 100
+        return {'price': max(round(price, 2), 0.01), 'underlying': underlying, 'iv': volatility, 'delta': delta, 'gamma': gamma, 'vega': vega, 'theta': theta / 365}
+
+
+    def contractDetailsFor(self, contract):
+        con_id = self.underlyingFor(contract)
+        symbol = self.symbolFor(con_id) if contract.symbol == "" else contract.symbol
+        self._symbols[con_id] = symbol
+
+        if contract.secType != "OPT":
+            details = ContractDetails()
+            details.contract.symbol, details.contract.secType, details.contract.conId = symbol, Constants.STOCK, con_id
+            details.contract.exchange, details.contract.primaryExchange = Constants.SMART, contract.primaryExchange or "NASDAQ"
+            details.contract.currency, details.contract.localSymbol, details.contract.tradingClass = Constants.USD, symbol, "NMS"
+            details.longName, details.timeZoneId, details.stockType = f"{symbol} Simulated Inc", Constants.NYC_TIMEZONE, "COMMON"
+            return [details]
+
+        expirations, strikes = self.optionChain(con_id)
+        all_details = []
+        for expiration in expirations:
+            for strike in strikes:
+                for right in [Constants.CALL, Constants.PUT]:
+                    if contract.lastTradeDateOrContractMonth in ("", expiration) and contract.strike in (0, strike) and contract.right in ("", right):
+                        details = ContractDetails()
+                        details.contract.symbol, details.contract.secType = symbol, "OPT"
+                        details.contract.lastTradeDateOrContractMonth, details.contract.strike, details.contract.right = expiration, strike, right
+                        details.contract.conId = self.optionConId(con_id, expiration, strike, right)
+                        details.contract.exchange, details.contract.currency, details.contract.multiplier = Constants.SMART, Constants.USD, "100"
+                        details.contract.localSymbol, details.contract.tradingClass = f"{symbol} {expiration[2:]}{right}{int(strike * 1_000):08d}", symbol
+                        details.underConId, details.timeZoneId = con_id, Constants.NYC_TIMEZONE
+                        all_details.append(details)
+        return all_details
+
+
+class PacingMonitor:
+    """
+    Checks historical requests against IB's pacing rules, the same ones RequestPacer keeps to, with the
+    windows in market time. Shared by the connections of a simulator like IB counts per session.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self._lock = Lock()
+        self._historical = deque()
+        self._by_key = dict()
+
+
+    def withinLimit(self, times, limit, window, now):
+        while len(times) > 0 and times[0] <= now - window:
+            times.popleft()
+        return len(times) < limit
+
+
+    def check(self, request_type, contract_key, request_key):
+            #counts the request and returns whether it keeps to the rules
+        now = self.clock.now()
+        with self._lock:
+            rules = [(self._historical, RequestPacer.historical_limit)]
+            if request_type == 'reqHistoricalData':
+                rules += [(self._by_key.setdefault(contract_key, deque()), RequestPacer.contract_limit), (self._by_key.setdefault(request_key, deque()), RequestPacer.identical_limit)]
+            allowed = all(self.withinLimit(times, *limit, now) for times, limit in rules)
+            for times, _ in rules:
+                times.append(now)
+            if len(self._by_key) > 10_000:
+                self._by_key = {key: times for key, times in self._by_key.items() if len(times) > 0 and times[-1] > now - RequestPacer.identical_limit[1]}
+            return allowed
+
+
+class SimulatorSession:
+    """
+    One client connection, with the handshake and the handlers of incoming messages on its own thread.
+    Responses are scheduled on the simulator, requests cancelled in the meantime don't get them.
+    """
+
+    def __init__(self, simulator, connection):
+        self.simulator = simulator
+        self.market = simulator.market
+        self.connection = connection
+        self._send_lock = Lock()
+        self.is_open = True
+        self.client_id = None
+        self._arrivals = deque()
+        self._kept_up = dict()
+        self._market_data = dict()
+        self._orders = dict()
+        self._held_orders = []
+        self.handlers = {OUT.START_API: self.startApi, OUT.REQ_HISTORICAL_DATA: self.reqHistoricalData, OUT.CANCEL_HISTORICAL_DATA: self.cancelHistoricalData,
+                         OUT.REQ_HEAD_TIMESTAMP: self.reqHeadTimeStamp, OUT.REQ_MKT_DATA: self.reqMktData, OUT.CANCEL_MKT_DATA: self.cancelMktData,
+                         OUT.REQ_CONTRACT_DATA: self.reqContractDetails, OUT.REQ_SEC_DEF_OPT_PARAMS: self.reqSecDefOptParams, OUT.PLACE_ORDER: self.placeOrder,
+                         OUT.CANCEL_ORDER: self.cancelOrder, OUT.REQ_GLOBAL_CANCEL: self.reqGlobalCancel, OUT.REQ_IDS: self.reqIds,
+                         OUT.REQ_OPEN_ORDERS: self.reqOpenOrders, OUT.REQ_ALL_OPEN_ORDERS: self.reqOpenOrders}
+
+
+    ###### socket
+
+    def run(self):
+        try:
+            if self.receiveExactly(4) == b"API\0" and self.handshake():
+                while self.is_open:
+                    fields = self.receiveMessage()
+                    if fields is None:
+                        break
+                    self.handleMessage(fields)
+        except (OSError, struct.error):
+            pass
+        finally:
+            self.close()
+
+
+    def receiveExactly(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.connection.recv(size - len(data))
+            if len(chunk) == 0:
+                return None
+            data += chunk
+        return data
+
+
+    def receiveBody(self):
+        prefix = self.receiveExactly(4)
+        return None if prefix is None else self.receiveExactly(struct.unpack("!I", prefix)[0])
+
+
+    def receiveMessage(self):
+        body = self.receiveBody()
+        return None if body is None else [field.decode() for field in body.split(b"\0")[:-1]]
+
+
+    def send(self, *fields):
+        message = comm.make_msg("".join(comm.make_field(field) for field in fields))
+        with self._send_lock:
+            if self.is_open:
+                try:
+                    self.connection.sendall(message)
+                except OSError:
+                    self.is_open = False
+
+
+    def close(self):
+        self.is_open = False
+        self._kept_up.clear()
+        self._market_data.clear()
+        self.connection.close()
+        self.simulator.removeSession(self)
+
+
+    def handshake(self):
+            #"v100..157" without a terminator, optionally followed by connection options
+        body = self.receiveBody()
+        if body is None:
+            return False
+        max_version = int(body.decode().split()[0].split("..")[-1])
+        if max_version < SERVER_VERSION:
+            return False
+        self.send(SERVER_VERSION, datetime.fromtimestamp(self.simulator.clock.now(), utc).strftime("%Y%m%d %H:%M:%S UTC"))
+        return True
+
+
+    def handleMessage(self, fields):
+        self.simulator.countMessage('received')
+        now = time.monotonic()
+        self._arrivals.append(now)
+        limit, window = RequestPacer.message_limit
+        while self._arrivals[0] <= now - window + ARRIVAL_JITTER:
+            self._arrivals.popleft()
+        if len(self._arrivals) > limit:
+                #TWS rejects messages over the limit
+            self.sendError(-1, 100, f"Max rate of messages per second has been exceeded:max={limit} rec={len(self._arrivals)}")
+            return
+
+        handler = self.handlers.get(int(fields[0]))
+        if handler is None:
+            self.simulator.countMessage('ignored')
+        else:
+            handler(iter(fields[1:]))
+
+
+    def sendError(self, req_id, code, text):
+        self.simulator.countMessage(f"error {code}")
+        self.send(IN.ERR_MSG, 2, req_id, code, text)
+
+
+    def later(self, market_seconds, function, *args):
+        self.simulator.schedule(market_seconds, function, *args)
+
+
+    def readContract(self, fields):
+            #conId through tradingClass, as laid out by most requests
+        contract = Contract()
+        contract.conId = int(next(fields) or 0)
+        contract.symbol, contract.secType, contract.lastTradeDateOrContractMonth = next(fields), next(fields), next(fields)
+        contract.strike = float(next(fields) or 0)
+        contract.right, contract.multiplier, contract.exchange, contract.primaryExchange = next(fields), next(fields), next(fields), next(fields)
+        contract.currency, contract.localSymbol, contract.tradingClass = next(fields), next(fields), next(fields)
+        return contract
+
+
+    def skipComboLegs(self, contract, fields, field_count=4):
+        if contract.secType == "BAG":
+            for _ in range(int(next(fields)) * field_count):
+                next(fields)
+
+
+    ###### connection
+
+    def startApi(self, fields):
+        next(fields)
+        self.client_id = int(next(fields))
+        self.send(IN.NEXT_VALID_ID, 1, self.simulator.nextOrderId())
+        self.send(IN.MANAGED_ACCTS, 1, self.simulator.account)
+
+
+    def reqIds(self, fields):
+        self.send(IN.NEXT_VALID_ID, 1, self.simulator.nextOrderId())
+
+
+    ###### historical data
+
+    def reqHistoricalData(self, fields):
+        req_id = int(next(fields))
+        contract = self.readContract(fields)
+        next(fields)
+        end_date, bar_type, duration, regular_hours, what_to_show, format_date = [next(fields) for _ in range(6)]
+        self.skipComboLegs(contract, fields)
+        keep_up_to_date = next(fields) == "1"
+
+        con_id = self.market.underlyingFor(contract)
+        contract_key = (con_id, contract.exchange, what_to_show)
+        if not self.simulator.pacing.check('reqHistoricalData', contract_key, (contract_key, end_date, duration, bar_type, regular_hours)):
+            self.sendError(req_id, 162, PACING_VIOLATION)
+        elif not (bar_type in MINUTES_PER_BAR):
+            self.sendError(req_id, 162, f"Historical Market Data Service error message:Invalid bar size {bar_type}")
+        else:
+            request = {'con_id': con_id, 'end_date': end_date, 'bar_type': bar_type, 'duration': duration, 'regular_hours': regular_hours == "1", 'format_date': format_date}
+            if keep_up_to_date:
+                self._kept_up[req_id] = request
+            self.later(self.simulator.latencies['historical'], self.sendHistoricalData, req_id, request)
+
+
+    def durationSeconds(self, duration):
+        amount, unit = duration.split()
+        return int(amount) * {'S': 1, 'D': 86_400, 'W': 7 * 86_400, 'M': 31 * 86_400, 'Y': 365 * 86_400}[unit]
+
+
+    def endTime(self, end_date):
+            #"" for now or "20240105 16:00:00 UTC", also with a dash between date and time
+        if end_date == "":
+            return self.simulator.clock.now()
+        return utc.localize(datetime.strptime(end_date.replace("-", " ")[:17], "%Y%m%d %H:%M:%S")).timestamp()
+
+
+    def barDate(self, start, bar_type, format_date):
+        if bar_type == Constants.DAY_BAR:
+            return pd.Timestamp(start, unit='s', tz=utc).tz_convert(Constants.NYC_TIMEZONE).strftime("%Y%m%d")
+        if format_date == "2":
+            return str(int(start))
+        return datetime.fromtimestamp(start, utc).strftime("%Y%m%d %H:%M:%S UTC")
+
+
+    def sendHistoricalData(self, req_id, request):
+        end = self.endTime(request['end_date'])
+        begin = end - self.durationSeconds(request['duration'])
+        starts, opens, highs, lows, closes, volumes = self.market.barsFor(request['con_id'], request['bar_type'], begin, end, request['regular_hours'])
+
+        fields = [IN.HISTORICAL_DATA, req_id, datetime.fromtimestamp(begin, utc).strftime("%Y%m%d %H:%M:%S UTC"), datetime.fromtimestamp(end, utc).strftime("%Y%m%d %H:%M:%S UTC"), len(starts)]
+        for start, open_price, high, low, close, volume in zip(starts.tolist(), opens.tolist(), highs.tolist(), lows.tolist(), closes.tolist(), volumes.tolist()):
+            fields += [self.barDate(start, request['bar_type'], request['format_date']), open_price, high, low, close, int(volume), round((high + low + close) / 3, 4), 1 + int(volume) // 100]
+        self.send(*fields)
+        self.simulator.countMessage('bars', len(starts))
+
+        if req_id in self._kept_up:
+            self.later(self.simulator.update_interval, self.sendBarUpdate, req_id)
+
+
+    def sendBarUpdate(self, req_id):
+        if req_id in self._kept_up:
+            request = self._kept_up[req_id]
+            start, open_price, high, low, close, volume = self.market.barInProgress(request['con_id'], request['bar_type'], self.simulator.clock.now())
+            self.send(IN.HISTORICAL_DATA_UPDATE, req_id, -1, self.barDate(start, request['bar_type'], request['format_date']), open_price, close, high, low, round((high + low + close) / 3, 4), volume)
+            self.simulator.countMessage('bar updates')
+            self.later(self.simulator.update_interval, self.sendBarUpdate, req_id)
+
+
+    def cancelHistoricalData(self, fields):
+        next(fields)
+        self._kept_up.pop(int(next(fields)), None)
+
+
+    def reqHeadTimeStamp(self, fields):
+        req_id = int(next(fields))
+        contract = self.readContract(fields)
+        _, _, _, format_date = [next(fields) for _ in range(4)]
+        if not self.simulator.pacing.check('reqHeadTimeStamp', None, None):
+            self.sendError(req_id, 162, PACING_VIOLATION)
+            return
+
+        head_timestamp = self.market.headTimestamp(self.market.underlyingFor(contract))
+        date_string = str(head_timestamp) if format_date == "2" else datetime.fromtimestamp(head_timestamp, utc).strftime("%Y%m%d-%H:%M:%S")
+        self.later(self.simulator.latencies['head_timestamp'], self.send, IN.HEAD_TIMESTAMP, req_id, date_string)
+
+
+    ###### market data
+
+    def reqMktData(self, fields):
+        next(fields)
+        req_id = int(next(fields))
+        contract = self.readContract(fields)
+        self.skipComboLegs(contract, fields)
+        if next(fields) == "1":
+            [next(fields) for _ in range(3)]
+        next(fields)
+        snapshot = next(fields) == "1"
+
+        if len(self._market_data) >= self.simulator.market_data_lines:
+            self.sendError(req_id, 101, "Max number of tickers has been reached")
+            return
+        self._market_data[req_id] = (contract, snapshot)
+        self.later(self.simulator.latencies['market_data'], self.sendMarketData, req_id)
+
+
+    def sendMarketData(self, req_id):
+        if not (req_id in self._market_data):
+            return
+        contract, snapshot = self._market_data[req_id]
+        con_id = self.market.underlyingFor(contract)
+
+        if contract.secType == "OPT":
+            quote = self.market.optionQuote(con_id, contract.lastTradeDateOrContractMonth, contract.strike, contract.right)
+            price, spread = quote['price'], max(0.01, round(0.02 * quote['price'], 2))
+        else:
+            price = float(self.market.priceAt(con_id, [self.simulator.clock.now()])[0])
+            spread = 0.01
+
+        for tick_type, tick_price in [(TickTypeEnum.BID, max(0.01, round(price - spread / 2, 2))), (TickTypeEnum.ASK, round(price + spread / 2, 2)), (TickTypeEnum.LAST, price), (TickTypeEnum.CLOSE, price)]:
+            self.send(IN.TICK_PRICE, 6, req_id, tick_type, tick_price, 10, 0)
+        if contract.secType == "OPT":
+            self.send(IN.TICK_OPTION_COMPUTATION, req_id, TickTypeEnum.MODEL_OPTION, 0, quote['iv'], quote['delta'], quote['price'], 0.0, quote['gamma'], quote['vega'], quote['theta'], quote['underlying'])
+        self.simulator.countMessage('quotes')
+
+        if snapshot:
+            del self._market_data[req_id]
+            self.send(IN.TICK_SNAPSHOT_END, 1, req_id)
+        else:
+            self.later(self.simulator.update_interval, self.sendMarketData, req_id)
+
+
+    def cancelMktData(self, fields):
+        next(fields)
+        self._market_data.pop(int(next(fields)), None)
+
+
+    ###### contracts
+
+    def reqContractDetails(self, fields):
+        next(fields)
+        req_id = int(next(fields))
+        contract = self.readContract(fields)
+        self.later(self.simulator.latencies['contract_details'], self.sendContractDetails, req_id, contract)
+
+
+    def sendContractDetails(self, req_id, contract):
+        all_details = self.market.contractDetailsFor(contract)
+        if len(all_details) == 0:
+            self.sendError(req_id, 200, "No security definition has been found for the request")
+            return
+
+        for details in all_details:
+            c = details.contract
+            self.send(IN.CONTRACT_DATA, 8, req_id, c.symbol, c.secType, c.lastTradeDateOrContractMonth, c.strike, c.right, c.exchange, c.currency, c.localSymbol,
+                      c.tradingClass, c.tradingClass, c.conId, 0.01, 1, c.multiplier, "LMT,MKT,STP", "SMART,CBOE,ISE", 1, details.underConId, details.longName,
+                      c.primaryExchange, "", "", "", "", details.timeZoneId, "", "", "", 1, 0, 1, "", "", "", "", details.stockType)
+        self.send(IN.CONTRACT_DATA_END, 1, req_id)
+
+
+    def reqSecDefOptParams(self, fields):
+        req_id = int(next(fields))
+        symbol, _, _, con_id = next(fields), next(fields), next(fields), int(next(fields) or 0)
+        self.market._symbols[con_id] = symbol
+        self.later(self.simulator.latencies['contract_details'], self.sendSecDefOptParams, req_id, con_id or self.market.conIdFor(symbol), symbol)
+
+
+    def sendSecDefOptParams(self, req_id, con_id, symbol):
+        expirations, strikes = self.market.optionChain(con_id)
+        for exchange in self.market.option_exchanges:
+            self.send(IN.SECURITY_DEFINITION_OPTION_PARAMETER, req_id, exchange, con_id, symbol, "100", len(expirations), *expirations, len(strikes), *strikes)
+        self.send(IN.SECURITY_DEFINITION_OPTION_PARAMETER_END, req_id)
+
+
+    ###### orders
+
+    def placeOrder(self, fields):
+        order_id = int(next(fields))
+        contract = self.readContract(fields)
+        next(fields), next(fields)
+        order = {'order_id': order_id, 'con_id': self.market.underlyingFor(contract), 'action': next(fields), 'quantity': float(next(fields)), 'order_type': next(fields),
+                 'limit': float(next(fields) or 0), 'aux': float(next(fields) or 0), 'status': 'PendingSubmit'}
+        [next(fields) for _ in range(6)]
+        transmit, order['parent_id'] = next(fields) == "1", int(next(fields) or 0)
+        self.simulator.seeOrderId(order_id)
+
+            #orders that are not transmitted wait for the next one of the session that is, like a bracket
+        if order_id in self._orders and self._orders[order_id]['status'] in ('Filled', 'Cancelled'):
+            self.sendError(order_id, 104, "Can't modify a filled order")
+            return
+        self._orders[order_id] = order
+        self._held_orders.append(order_id)
+        if transmit:
+            for held_id in self._held_orders:
+                self.later(self.simulator.latencies['order'], self.submitOrder, held_id)
+            self._held_orders = []
+
+
+    def sendOrderStatus(self, order):
+        filled = order['quantity'] if order['status'] == 'Filled' else 0.0
+        self.send(IN.ORDER_STATUS, order['order_id'], order['status'], filled, order['quantity'] - filled, order.get('fill_price', 0.0), order['order_id'] + 1_000_000,
+                  order['parent_id'], order.get('fill_price', 0.0), self.client_id or 0, "", 0.0)
+
+
+    def submitOrder(self, order_id):
+        order = self._orders.get(order_id)
+        if order is not None and order['status'] in ('PendingSubmit', 'Submitted'):
+            order['status'] = 'Submitted'
+            self.sendOrderStatus(order)
+                #entries fill, the exits attached to them keep waiting
+            if order['parent_id'] == 0 and order['order_type'] in ('MKT', 'LMT'):
+                self.later(self.simulator.latencies['fill'], self.fillOrder, order_id)
+
+
+    def fillOrder(self, order_id):
+        order = self._orders.get(order_id)
+        if order is not None and order['status'] == 'Submitted':
+            market_price = float(self.market.priceAt(order['con_id'], [self.simulator.clock.now()])[0])
+            order['status'], order['fill_price'] = 'Filled', order['limit'] if order['order_type'] == 'LMT' else market_price
+            self.sendOrderStatus(order)
+            self.simulator.countMessage('fills')
+
+
+    def cancelOrder(self, fields):
+        next(fields)
+        self.cancelOrderById(int(next(fields)))
+
+
+    def cancelOrderById(self, order_id):
+        order = self._orders.get(order_id)
+        if order is None or order['status'] in ('Filled', 'Cancelled'):
+            self.sendError(order_id, 161, f"Cancel attempted when order is not in a cancellable state. Order permId = {order_id + 1_000_000}")
+        else:
+            order['status'] = 'Cancelled'
+            self.later(self.simulator.latencies['order'], self.sendOrderStatus, order)
+
+
+    def reqGlobalCancel(self, fields):
+        for order_id, order in list(self._orders.items()):
+            if not (order['status'] in ('Filled', 'Cancelled')):
+                self.cancelOrderById(order_id)
+
+
+    def reqOpenOrders(self, fields):
+        self.send(IN.OPEN_ORDER_END, 1)
+
+
+class IBSimulator:
+    """
+    Stand-in for TWS or the Gateway on a local socket, speaking server version 157 of the API for historical
+    bars (also kept up to date), head timestamps, market data snapshots and streams, contract details, option
+    chain parameters and orders, with pacing errors for requests that break IB's rules. Data is synthetic or
+    replayed from recorded buffers. Responses come after latencies in market time, so they, the updates and
+    the pacing windows all shrink with the speed of the clock. One thread sends whatever is due.
+    """
+
+        #seconds of market time before the responses, and the fill of entry orders
+    latencies = {'historical': 0.3, 'head_timestamp': 0.1, 'contract_details': 0.1, 'market_data': 0.05, 'order': 0.02, 'fill': 0.5}
+    update_interval = 5.0
+    market_data_lines = 100
+    account = "DU0000000"
+
+    def __init__(self, host=Constants.LOCAL_ADDRESS, port=0, speed=1.0, start_time=None, recorded_folder=None):
+        self.clock = SimulatedClock(start_time, speed)
+        self.market = SimulatedMarket(self.clock, recorded_folder)
+        self.pacing = PacingMonitor(self.clock)
+        self.sessions = set()
+        self._lock = Lock()
+        self._next_order_id = 1
+        self._metrics = dict()
+
+        self._tasks = []
+        self._task_sequence = count()
+        self._task_condition = Condition()
+        self.is_running = False
+
+        self._server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server_socket.bind((host, port))
+        self.host, self.port = self._server_socket.getsockname()
+
+
+    def start(self):
+        self.is_running = True
+        self._server_socket.listen()
+        Thread(target=self.acceptConnections, daemon=True).start()
+        Thread(target=self.runScheduler, daemon=True).start()
+        return self
+
+
+    def stop(self):
+        self.is_running = False
+        self._server_socket.close()
+        for session in list(self.sessions):
+            session.connection.shutdown(socket.SHUT_RDWR)
+        with self._task_condition:
+            self._task_condition.notify()
+
+
+    def acceptConnections(self):
+        while self.is_running:
+            try:
+                connection, _ = self._server_socket.accept()
+            except OSError:
+                break
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session = SimulatorSession(self, connection)
+            with self._lock:
+                self.sessions.add(session)
+            Thread(target=session.run, daemon=True).start()
+
+
+    def removeSession(self, session):
+        with self._lock:
+            self.sessions.discard(session)
+
+
+    def schedule(self, market_seconds, function, *args):
+        due_time = time.monotonic() + self.clock.wallSeconds(market_seconds)
+        with self._task_condition:
+            heapq.heappush(self._tasks, (due_time, next(self._task_sequence), function, args))
+            self._task_condition.notify()
+
+
+    def runScheduler(self):
+        while self.is_running:
+            with self._task_condition:
+                while self.is_running and (len(self._tasks) == 0 or self._tasks[0][0] > time.monotonic()):
+                    self._task_condition.wait(None if len(self._tasks) == 0 else self._tasks[0][0] - time.monotonic())
+                if not self.is_running:
+                    break
+                _, _, function, args = heapq.heappop(self._tasks)
+            function(*args)
+
+
+    def nextOrderId(self):
+        with self._lock:
+            return self._next_order_id
+
+
+    def seeOrderId(self, order_id):
+        with self._lock:
+            self._next_order_id = max(self._next_order_id, order_id + 1)
+
+
+    def countMessage(self, key, amount=1):
+        with self._lock:
+            self._metrics[key] = self._metrics.get(key, 0) + amount
+
+
+    def getMetrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else Constants.PAPER_TWS_SOCKET
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    simulator = IBSimulator(port=port, speed=speed, recorded_folder=sys.argv[3] if len(sys.argv) > 3 else None).start()
+    print(f"Simulating IB on {simulator.host}:{simulator.port} at {speed}x")
+    try:
+        while True:
+            time.sleep(60)
+            print(simulator.getMetrics())
+    except KeyboardInterrupt:
+        simulator.stop()
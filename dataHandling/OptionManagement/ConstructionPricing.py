@@ -0,0 +1,99 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from dataHandling.Constants import Constants, OptionConstrType
+
+
+class PriceDetails:
+    """
+    The detail strings of the points of a line, formatted only when one is looked up, as the plots
+    do for the point under the mouse. Values holds a price per point, or the strikes of the legs.
+    """
+
+    def __init__(self, values, precision=2):
+        self.values = values
+        self.precision = precision
+
+
+    def __len__(self):
+        return len(self.values)
+
+
+    def __getitem__(self, index):
+        value = self.values[index]
+        if np.ndim(value) == 0:
+            return f"{value:.{self.precision}f}"
+        return ', '.join(f"{strike:.2f}".rstrip('0').rstrip('.') for strike in value)
+
+
+class ConstructionPricer:
+    """
+    Prices a construction for every strike and expiration of an OptionPriceGrid at once. A construction
+    is a list of legs, each an offset from the strike it is listed under, an option type and a weight.
+    The strike of every leg is found on the strike axis with searchsorted, so a leg costs one lookup per
+    strike for all expirations together, and a construction is priced where the grid has all its legs.
+    """
+
+    def __init__(self, constr_type, option_type, offsets, ratios):
+        self.legs, self.strike_offset = self.getLegs(constr_type, option_type, offsets, ratios)
+        self.is_single = (len(self.legs) == 1)
+
+
+    def getLegs(self, constr_type, option_type, offsets, ratios):
+            #the legs, with the offset from the first leg of the strike the construction is listed under
+        if constr_type == OptionConstrType.vertical_spread:
+            direction = 1 if option_type == Constants.CALL else -1
+            legs = [(0, option_type, ratios[0]), (direction * offsets[0], option_type, -ratios[1])]
+            return legs, direction * offsets[0] / 2
+        elif constr_type == OptionConstrType.butterfly:
+            legs = [(0, option_type, -ratios[0]), (-offsets[0], option_type, ratios[2]), (offsets[0], option_type, ratios[1])]
+            return legs, 0
+        elif constr_type == OptionConstrType.split_butterfly:
+            legs = [(0, option_type, ratios[0]), (offsets[0], option_type, -ratios[1]), (2 * offsets[0], option_type, -ratios[2]), (3 * offsets[0], option_type, ratios[3])]
+            return legs, 0
+        elif constr_type == OptionConstrType.iron_condor:
+            price_diff, price_spread = offsets[0], offsets[1]
+            legs = [(0, Constants.PUT, -ratios[0]), (price_spread, Constants.CALL, -ratios[1]), (-price_diff, Constants.PUT, ratios[2]), (price_spread + price_diff, Constants.CALL, ratios[2])]
+            return legs, price_spread / 2
+        else:
+            return [(0, option_type, 1)], 0
+
+
+    def findStrikes(self, strikes, offset):
+            #positions of the strikes offset from every strike on the axis and whether they are on it
+        positions = np.minimum(np.searchsorted(strikes, strikes + offset), len(strikes) - 1)
+        return positions, np.isclose(strikes[positions], strikes + offset, rtol=0, atol=1e-6)
+
+
+    def priceSurface(self, price_grid):
+            #the strikes the construction is listed under, the expiration by strike surface of prices with its mask of
+            #valid prices and the strikes of the legs per listed strike, leaving out strikes without a price at any expiration
+        strikes = price_grid.strikes
+        if len(strikes) == 0:
+            return strikes, np.empty((len(price_grid.expirations), 0)), np.zeros((len(price_grid.expirations), 0), dtype=bool), np.empty((0, len(self.legs)))
+
+        prices = np.zeros((len(price_grid.expirations), len(strikes)))
+        valid = np.ones(prices.shape, dtype=bool)
+        leg_strikes = []
+        for offset, option_type, weight in self.legs:
+            positions, found = self.findStrikes(strikes, offset)
+            valid &= found & price_grid.getPresence(option_type)[:, positions]
+            prices += weight * price_grid.getValues(option_type, 'price_est')[:, positions]
+            leg_strikes.append(strikes[positions])
+
+        listed = valid.any(axis=0)
+        prices = np.where(valid, prices, np.nan)[:, listed]
+        return strikes[listed] + self.strike_offset, prices, valid[:, listed], np.column_stack(leg_strikes)[listed]
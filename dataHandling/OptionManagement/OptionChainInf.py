@@ -1,6 +1,9 @@
-import pickle
+import os
+import numpy as np
 from generalFunctionality.GenFunctions import getDaysTillExpiration
 from dataHandling.Constants import Constants
+from dataHandling.OptionManagement.OptionChainStore import OptionChainStore
+from dataHandling.OptionManagement.OptionPriceGrid import TICK_TYPES
 from datetime import datetime, timezone
 
 class OptionChainInf:
@@ -8,24 +11,22 @@ class OptionChainInf:
     _expirations = []
     _contract_ids = dict()
     _strikes = []
-    _option_chain_dict = dict()
 
     def __init__(self, uid):
         self._underlying_uid = uid
-        self._option_chain_dict = self.readOptionChainInfo()
+        self._chain_store = OptionChainStore(os.path.join(Constants.OPTION_CHAIN_FOLDER, str(uid)))
+        self.readOptionChainInfo()
 
     @property
     def is_empty(self):
-        return (len(self._option_chain_dict['chains'][Constants.CALL]) == 0) and (len(self._option_chain_dict['chains'][Constants.PUT]) == 0)
+        return self._chain_store.row_count == 0
 
     @property
     def last_update(self):
-        if 'timestamp' in self._option_chain_dict:
-            return self._option_chain_dict['timestamp']
-        return None
+        return self._chain_store.last_update
 
     def updateUnderlyingPrice(self, price):
-        self._option_chain_dict['underlying_price'] = price
+        self._chain_store.underlying_price = price
         self.writeOptionChain()
 
         
@@ -41,120 +42,120 @@ class OptionChainInf:
 
     def addContractID(self, opt_type, strike, expiration, contract_id):
         self._contract_ids[opt_type, strike, expiration] = contract_id
-        if not expiration in self._option_chain_dict['chains'][opt_type]:
-            self._option_chain_dict['chains'][opt_type][expiration] = dict()
-
-        self._option_chain_dict['chains'][opt_type][expiration][strike] = {'con_id': self._contract_ids[opt_type, strike, expiration]}
+        self._chain_store.addContract(opt_type, expiration, strike, contract_id)
 
 
     def removeEntireOptionChain(self):
         self.removeSavedOptionInfo()
-        self._option_chain_dict = dict()
 
 
     def fetchPricesFromFrame(self, option_frame_2D):
-        for opt_type in [Constants.CALL, Constants.PUT]:
-            for expiration in self._option_chain_dict['chains'][opt_type].keys():
-                for tick_type in [Constants.BID, Constants.ASK, Constants.CLOSE]:
-                    if option_frame_2D.hasDataForExp(opt_type, expiration):
-                        strikes, y_values = option_frame_2D.getValuesByExpiration(opt_type, expiration, tick_type)
-                        for strike, price in zip(strikes, y_values):
-                            self._option_chain_dict['chains'][opt_type][expiration][strike][tick_type] = price
-
-        self.writeOptionChain()
+            #only contracts with prices newer or other than the stored ones are updated
+        price_grid = option_frame_2D.getPriceSnapshot()
+        option_types = self._chain_store.getColumn('option_type')
+        exp_rows, strike_columns, found = price_grid.positionsOf(self._chain_store.getColumn('expiration'), self._chain_store.getColumn('strike'))
+        stored_prices = self._chain_store.getPrices()
+        stored_times = self._chain_store.getColumn('timestamp')
+
+        for opt_type in price_grid.option_types:
+            rows = np.flatnonzero(found & (option_types == opt_type))
+            update_times = price_grid.getUpdateTimes(opt_type)[exp_rows[rows], strike_columns[rows]]
+            prices = {tick_type: price_grid.getValues(opt_type, tick_type)[exp_rows[rows], strike_columns[rows]] for tick_type in TICK_TYPES}
+
+            changed = (update_times != stored_times[rows])
+            for tick_type, values in prices.items():
+                stored_values = stored_prices[tick_type][rows]
+                changed |= ~((values == stored_values) | (np.isnan(values) & np.isnan(stored_values)))
+            changed &= ~np.isnan(update_times)
+            if changed.any():
+                self._chain_store.setPrices(rows[changed], {tick_type: values[changed] for tick_type, values in prices.items()}, update_times[changed])
 
 
     def loadPricesToFrame(self, option_frame_2D):
-        if len(self._option_chain_dict) > 0:
-            expirations_to_remove = []
-            chain_dict = self._option_chain_dict['chains']
-
-            for opt_type in chain_dict.keys():
-                for expiration in chain_dict[opt_type].keys():
-                    days_till_exp = getDaysTillExpiration(expiration)
-                    if days_till_exp < 0:
-                        expirations_to_remove.append((opt_type, expiration))
-                    else:
-                        for strike in chain_dict[opt_type][expiration].keys():
-                            for tick_type in [Constants.BID, Constants.ASK, Constants.CLOSE]:
-                                if tick_type in chain_dict[opt_type][expiration][strike]:
-                                    option_price = float(chain_dict[opt_type][expiration][strike][tick_type])
-                                    option_frame_2D.setValueFor(opt_type, (expiration, strike), tick_type, option_price)
-
-            for (opt_type, expiration) in expirations_to_remove:
-                del self._option_chain_dict['chains'][opt_type][expiration]
+        if not self.is_empty:
+            expirations = np.unique(self._chain_store.getColumn('expiration'))
+            expirations_to_remove = [expiration for expiration in expirations if getDaysTillExpiration(expiration) < 0]
+            self._chain_store.removeExpirations(expirations_to_remove)
+
+                #one write into the frame for all contracts with stored prices
+            timestamps = self._chain_store.getColumn('timestamp')
+            priced = ~np.isnan(timestamps)
+            if priced.any():
+                prices_by_tick = {tick_type: prices[priced] for tick_type, prices in self._chain_store.getPrices().items()}
+                option_frame_2D.setValuesFor(self._chain_store.getColumn('option_type')[priced], self._chain_store.getColumn('expiration')[priced],
+                                             self._chain_store.getColumn('strike')[priced], prices_by_tick, timestamps[priced])
 
             if option_frame_2D.has_data:
-                if 'underlying_price' in self._option_chain_dict:
-                    option_frame_2D.setUnderlyingPrice(self._option_chain_dict['underlying_price'])
+                if self._chain_store.underlying_price is not None:
+                    option_frame_2D.setUnderlyingPrice(self._chain_store.underlying_price)
 
         return option_frame_2D
 
 
     def getContractIdsFromChain(self):
-        self._contract_ids = dict()
-        for opt_type in [Constants.CALL, Constants.PUT]:
-            expiration_strings = list(self._option_chain_dict['chains'][opt_type].keys())
-            self.setExpirationsFrom(expiration_strings)
-            
-            strikes = set()
-            for exp_str in expiration_strings:
-                float_strikes = set(map(float, self._option_chain_dict['chains'][opt_type][exp_str].keys()))
-                strikes.update(float_strikes)
-                for strike in self._option_chain_dict['chains'][opt_type][exp_str].keys():
-                    self._contract_ids[opt_type, strike, exp_str] = self._option_chain_dict['chains'][opt_type][exp_str][strike]['con_id']
+        option_types = self._chain_store.getColumn('option_type').tolist()
+        expirations = self._chain_store.getColumn('expiration').tolist()
+        strikes = self._chain_store.getColumn('strike').tolist()
+        con_ids = self._chain_store.getColumn('con_id').tolist()
+        self._contract_ids = {(opt_type, strike, expiration): con_id for opt_type, expiration, strike, con_id in zip(option_types, expirations, strikes, con_ids)}
 
-            self._strikes = list(strikes)
+        expiration_strings = list(dict.fromkeys(expirations))
+        self.setExpirationsFrom(expiration_strings)
+        self._strikes = list(set(strikes))
 
         return expiration_strings, self._strikes
 
 
+    def getStaleContractItems(self, max_age):
+            #contracts of which the stored prices are older than max_age seconds or never came in
+        stale_rows = self._chain_store.staleRows(max_age, datetime.now(timezone.utc).timestamp())
+        option_types = self._chain_store.getColumn('option_type')[stale_rows].tolist()
+        expirations = self._chain_store.getColumn('expiration')[stale_rows].tolist()
+        strikes = self._chain_store.getColumn('strike')[stale_rows].tolist()
+        con_ids = self._chain_store.getColumn('con_id')[stale_rows].tolist()
+        return [((opt_type, strike, expiration), con_id) for opt_type, expiration, strike, con_id in zip(option_types, expirations, strikes, con_ids)]
+
+
+    def pickleFile(self):
+            #where the versions before the chain store kept the chain
+        return f"{Constants.OPTION_CHAIN_FOLDER}{self._underlying_uid}_chain.pkl"
+
+
     def readOptionChainInfo(self):
         try:
-            with open(f"{Constants.OPTION_CHAIN_FOLDER}{self._underlying_uid}_chain.pkl", 'rb') as pickle_file:
-                option_inf = pickle.load(pickle_file)
-                return option_inf
-        except (IOError, OSError) as e:
-            inner_dict = dict()
-            inner_dict['chains'] = dict()
-            inner_dict['chains'][Constants.PUT] = dict()
-            inner_dict['chains'][Constants.CALL] = dict()
-            return inner_dict
+            if self._chain_store.exists():
+                self._chain_store.load()
+            elif os.path.exists(self.pickleFile()):
+                self._chain_store.migratePickle(self.pickleFile())
+        except (IOError, OSError, ValueError) as e:
+            print("We couldn't read the option chain")
+            print(e)
+            self._chain_store.reset()
 
 
     def writeOptionChain(self, price_data=None):
         if price_data is not None:
             self.fetchPricesFromFrame(price_data)
         try:
-            with open(f"{Constants.OPTION_CHAIN_FOLDER}{self._underlying_uid}_chain.pkl", 'wb') as outfile:
-                pickle.dump(self._option_chain_dict, outfile)
+            self._chain_store.save()
         except (IOError, OSError) as e:
-            print("We couldn't wite the JSON file.... :(")
+            print("We couldn't write the option chain.... :(")
             print(e)
-    
 
 
     def removeSavedOptionInfo(self):
-        os.remove(f"{Constants.OPTION_CHAIN_FOLDER}{self._underlying_uid}_chain.pkl")
+        self._chain_store.remove()
+        if os.path.exists(self.pickleFile()):
+            os.remove(self.pickleFile())
 
 
     def removeSavedPriceInf(self):
-        if len(self._option_chain_dict) > 0:
-
-            chain_dict = self._option_chain_dict['chains']
-
-            for opt_type in chain_dict.keys():
-                for expiration in chain_dict[opt_type].keys():
-                    for strike in chain_dict[opt_type][expiration].keys():
-                        for tick_type in [Constants.BID, Constants.ASK, Constants.CLOSE]:
-                            if tick_type in chain_dict[opt_type][expiration][strike]:
-                                del self._option_chain_dict['chains'][opt_type][expiration][strike][tick_type]
-
+        self._chain_store.clearPrices()
         self.writeOptionChain()
 
 
     def finalizeChainGathering(self):
-        self._option_chain_dict['timestamp'] = datetime.now(timezone.utc).timestamp()
+        self._chain_store.last_update = datetime.now(timezone.utc).timestamp()
             
         self.writeOptionChain()
 
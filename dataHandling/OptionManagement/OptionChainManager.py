@@ -71,6 +71,11 @@ class OptionChainManager(IBConnectivity):
         super().moveToThread(thread)
 
 
+    def stop(self):
+        self._all_option_frame.stop()
+        super().stop()
+
+
     @pyqtSlot(DetailObject)
     def makeStockSelection(self, contract_details):
         
@@ -0,0 +1,194 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os, json, pickle, shutil
+import numpy as np
+
+from dataHandling.Constants import Constants
+from dataHandling.HistoryManagement.BarArchive import writeAtomically
+
+
+PRICE_COLUMNS = {Constants.BID: 'bid', Constants.ASK: 'ask', Constants.CLOSE: 'close'}
+
+
+class OptionChainStore:
+    """
+    On disk store of the contracts of an option chain with their last prices, one row per contract in flat
+    columns of option type, expiration, strike, con_id, bid, ask, close and the epoch second timestamp of
+    the prices, NaN where none came in. Every column is an .npy file in the folder of the chain, next to a
+    meta.json with the row count, the time the chain was gathered and the underlying price. A save after
+    only prices changed writes the changed rows into the price columns in place, new or removed contracts
+    rewrite the columns.
+    """
+
+    meta_file = 'meta.json'
+    columns = {'option_type': 'U1', 'expiration': 'U8', 'strike': np.float64, 'con_id': np.int64,
+               'bid': np.float64, 'ask': np.float64, 'close': np.float64, 'timestamp': np.float64}
+    price_columns = ['bid', 'ask', 'close', 'timestamp']
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.reset()
+
+
+    def reset(self):
+        self.last_update = None
+        self.underlying_price = None
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in self.columns.items()}
+            #row by (option type, expiration, strike)
+        self._rows = dict()
+            #contracts added since the columns were last built, appended on the next access
+        self._new_rows = []
+        self._dirty_rows = set()
+        self._rewrite = True
+
+
+    @property
+    def row_count(self):
+        return len(self._rows)
+
+
+    def getColumn(self, name):
+        self.appendNewRows()
+        return self._columns[name]
+
+
+    def getPrices(self):
+            #the price columns by tick type
+        return {tick_type: self.getColumn(name) for tick_type, name in PRICE_COLUMNS.items()}
+
+
+    def appendNewRows(self):
+        if len(self._new_rows) > 0:
+            new_columns = list(zip(*self._new_rows))
+            for (name, dtype), values in zip(self.columns.items(), new_columns):
+                self._columns[name] = np.concatenate([self._columns[name], np.array(values, dtype=dtype)])
+            self._new_rows = []
+
+    ###### changes
+
+    def addContract(self, option_type, expiration, strike, con_id):
+        key = (option_type, expiration, float(strike))
+        if key in self._rows:
+            con_ids = self.getColumn('con_id')
+            if con_ids[self._rows[key]] != con_id:
+                con_ids[self._rows[key]] = con_id
+                self._rewrite = True
+        else:
+            self._rows[key] = len(self._rows)
+            self._new_rows.append((option_type, expiration, float(strike), con_id, np.nan, np.nan, np.nan, np.nan))
+            self._rewrite = True
+
+
+    def removeExpirations(self, expirations):
+        self.appendNewRows()
+        keep = ~np.isin(self._columns['expiration'], list(expirations))
+        if not keep.all():
+            self._columns = {name: values[keep] for name, values in self._columns.items()}
+            self._rows = {key: row for row, key in enumerate(zip(self._columns['option_type'], self._columns['expiration'], self._columns['strike'].tolist()))}
+            self._rewrite = True
+
+
+    def setPrices(self, rows, prices_by_tick, timestamps):
+            #rows are positions in the columns, prices_by_tick has an array of prices per tick type
+        self.appendNewRows()
+        for tick_type, prices in prices_by_tick.items():
+            self._columns[PRICE_COLUMNS[tick_type]][rows] = prices
+        self._columns['timestamp'][rows] = timestamps
+        self._dirty_rows.update(np.asarray(rows).tolist())
+
+
+    def clearPrices(self):
+        self.appendNewRows()
+        for name in self.price_columns:
+            self._columns[name][:] = np.nan
+        self._dirty_rows.update(range(self.row_count))
+
+
+    def staleRows(self, max_age, now):
+            #rows of which the prices are older than max_age seconds or never came in
+        timestamps = self.getColumn('timestamp')
+        return np.flatnonzero(np.isnan(timestamps) | (timestamps < now - max_age))
+
+    ###### storage
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.folder, self.meta_file))
+
+
+    def columnFile(self, name):
+        return os.path.join(self.folder, name + '.npy')
+
+
+    def load(self):
+        self.reset()
+        with open(os.path.join(self.folder, self.meta_file), 'r') as file:
+            meta = json.load(file)
+        self.last_update, self.underlying_price = meta['last_update'], meta['underlying_price']
+
+        columns = {name: np.load(self.columnFile(name)) for name in self.columns}
+            #columns of a different length are left over from a rewrite that did not finish
+        if all(len(values) == meta['rows'] for values in columns.values()):
+            self._columns = columns
+            self._rows = {key: row for row, key in enumerate(zip(columns['option_type'], columns['expiration'], columns['strike'].tolist()))}
+            self._rewrite = False
+
+
+    def save(self):
+        self.appendNewRows()
+        os.makedirs(self.folder, exist_ok=True)
+        if self._rewrite:
+            for name, values in self._columns.items():
+                writeAtomically(self.columnFile(name), lambda file: np.save(file, values))
+            self._rewrite = False
+        elif len(self._dirty_rows) > 0:
+                #the changed rows go into the price columns in place
+            rows = np.fromiter(self._dirty_rows, dtype=np.int64)
+            for name in self.price_columns:
+                stored_column = np.load(self.columnFile(name), mmap_mode='r+')
+                stored_column[rows] = self._columns[name][rows]
+                stored_column.flush()
+                del stored_column
+        self._dirty_rows = set()
+
+        last_update, underlying_price = [None if value is None else float(value) for value in (self.last_update, self.underlying_price)]
+        meta_string = json.dumps({'rows': self.row_count, 'last_update': last_update, 'underlying_price': underlying_price}).encode()
+        writeAtomically(os.path.join(self.folder, self.meta_file), lambda file: file.write(meta_string))
+
+
+    def remove(self):
+        if os.path.exists(self.folder):
+            shutil.rmtree(self.folder)
+        self.reset()
+
+    ###### migration
+
+    def migratePickle(self, pickle_file):
+            #moves a chain saved by the pickle based versions into the store, the pickle is left in place. Those
+            #kept no times per contract, so prices get the time the chain was gathered
+        with open(pickle_file, 'rb') as file:
+            option_inf = pickle.load(file)
+
+        self.reset()
+        self.last_update = option_inf.get('timestamp')
+        self.underlying_price = option_inf.get('underlying_price')
+        price_time = np.nan if self.last_update is None else self.last_update
+        for option_type, expirations in option_inf.get('chains', dict()).items():
+            for expiration, strikes in expirations.items():
+                for strike, contract_inf in strikes.items():
+                    prices = [float(contract_inf.get(tick_type, np.nan)) for tick_type in PRICE_COLUMNS]
+                    timestamp = np.nan if np.isnan(prices).all() else price_time
+                    self._rows[option_type, expiration, float(strike)] = len(self._rows)
+                    self._new_rows.append((option_type, expiration, float(strike), contract_inf['con_id'], *prices, timestamp))
+        self.save()
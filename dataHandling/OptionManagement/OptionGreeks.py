@@ -0,0 +1,162 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from datetime import datetime
+import numpy as np
+from pytz import timezone, utc
+
+from dataHandling.Constants import Constants
+
+
+GREEK_TYPES = ['implied_volatility', 'delta', 'gamma', 'theta', 'vega']
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+
+def normalPdf(values):
+    return np.exp(-values**2 / 2) / np.sqrt(2 * np.pi)
+
+
+def normalCdf(values):
+        #Abramowitz and Stegun 26.2.17, within 7.5e-8 of the exact value
+    t = 1 / (1 + 0.2316419 * np.abs(values))
+    tail = normalPdf(values) * t * (0.319381530 + t * (-0.356563782 + t * (1.781477937 + t * (-1.821255978 + t * 1.330274429))))
+    return np.where(values >= 0, 1 - tail, tail)
+
+
+def blackScholes(is_call, underlying, strikes, years, rate, volatilities):
+        #price and vega per unit of volatility, all arguments but the underlying price are arrays of the same shape
+    root_years = np.sqrt(years)
+    d1 = (np.log(underlying / strikes) + (rate + volatilities**2 / 2) * years) / (volatilities * root_years)
+    d2 = d1 - volatilities * root_years
+    discounted_strikes = strikes * np.exp(-rate * years)
+    call_prices = underlying * normalCdf(d1) - discounted_strikes * normalCdf(d2)
+    prices = np.where(is_call, call_prices, call_prices - underlying + discounted_strikes)
+    return prices, underlying * normalPdf(d1) * root_years
+
+
+class GreeksCalculator:
+    """
+    Implied volatility, delta, gamma, theta and vega of every contract of an OptionPriceGrid, with the
+    Black-Scholes model on the estimated prices and without dividends. The volatilities of all contracts
+    are solved at once with Newton steps that fall back to bisection when they leave the bracket of the
+    solution. The volatilities of the previous calculation are the starting point while the axes of the
+    grid stay the same, so a move of the underlying takes a few steps only, and without a move only the
+    expirations with new prices are solved again.
+    """
+
+    interest_rate = 0.05
+    initial_volatility = 0.3
+    volatility_bounds = (1e-4, 5.0)
+    tolerance = 1e-6
+    max_iterations = 50
+
+    def __init__(self):
+            #the expiration and strike axes of the last grid with the volatilities found by option type
+        self._previous = dict()
+
+
+    def getYearsTillExpiration(self, expirations, now=None):
+            #options expire at the close in New York
+        now = datetime.now(utc) if now is None else now
+        market_timezone = timezone(Constants.NYC_TIMEZONE)
+        closes = [market_timezone.localize(datetime.strptime(expiration, '%Y%m%d').replace(hour=16)) for expiration in expirations]
+        return np.array([(close - now).total_seconds() / SECONDS_PER_YEAR for close in closes], dtype=float)
+
+
+    def impliedVolatility(self, is_call, underlying, strikes, years, prices, initial):
+            #nan for prices outside the bounds of the model
+        discounted_strikes = strikes * np.exp(-self.interest_rate * years)
+        lower_bounds = np.maximum(np.where(is_call, underlying - discounted_strikes, discounted_strikes - underlying), 0)
+        upper_bounds = np.where(is_call, underlying, discounted_strikes)
+        solvable = (prices > lower_bounds) & (prices < upper_bounds)
+
+        volatilities = np.full(prices.shape, np.nan)
+        active = np.flatnonzero(solvable)
+        low = np.full(len(active), self.volatility_bounds[0])
+        high = np.full(len(active), self.volatility_bounds[1])
+        guesses = np.clip(initial[active], *self.volatility_bounds)
+        for _ in range(self.max_iterations):
+            if len(active) == 0:
+                break
+
+            model_prices, vegas = blackScholes(is_call[active], underlying, strikes[active], years[active], self.interest_rate, guesses)
+            differences = model_prices - prices[active]
+
+                #the price rises with the volatility, so the sign of the difference narrows the bracket
+            high = np.where(differences > 0, guesses, high)
+            low = np.where(differences < 0, guesses, low)
+                #deep in or out of the money the price hardly changes with the volatility, there the bracket decides
+            converged = (np.abs(differences) < self.tolerance) | (high - low < self.tolerance)
+            volatilities[active[converged]] = guesses[converged]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                steps = guesses - differences / vegas
+            guesses = np.where(np.isfinite(steps) & (steps > low) & (steps < high), steps, (low + high) / 2)
+
+            remaining = ~converged
+            active, low, high, guesses = active[remaining], low[remaining], high[remaining], guesses[remaining]
+
+        return volatilities
+
+
+    def calculate(self, price_grid, underlying_price, expirations=None, now=None):
+            #expiration by strike surfaces of GREEK_TYPES by option type, theta per day and vega per volatility point,
+            #with expirations the ones whose prices changed since the last calculation
+        years = self.getYearsTillExpiration(price_grid.expirations, now)[:, None]
+        strikes = price_grid.strikes[None, :]
+        greeks = dict()
+        for option_type in price_grid.option_types:
+            prices = price_grid.getValues(option_type, 'price_est')
+            shape = prices.shape
+            is_call = np.full(shape, option_type == Constants.CALL)
+            contract_years = np.broadcast_to(years, shape)
+            contract_strikes = np.broadcast_to(strikes, shape)
+            valid = price_grid.getPresence(option_type) & (contract_years > 0) & ~np.isnan(prices)
+
+            initial = np.full(shape, self.initial_volatility)
+            volatilities = np.full(shape, np.nan)
+            if option_type in self._previous:
+                previous_expirations, previous_strikes, previous_underlying, previous_volatilities = self._previous[option_type]
+                if (previous_expirations is price_grid.expirations) and (previous_strikes is price_grid.strikes):
+                    initial = np.where(np.isnan(previous_volatilities), initial, previous_volatilities)
+                    if (expirations is not None) and (previous_underlying == underlying_price):
+                            #only the changed expirations are solved again
+                        changed_rows = np.isin(price_grid.expirations, list(expirations))
+                        volatilities = np.where(changed_rows[:, None], np.nan, previous_volatilities)
+                        valid &= changed_rows[:, None]
+
+            volatilities[valid] = self.impliedVolatility(is_call[valid], underlying_price, contract_strikes[valid], contract_years[valid], prices[valid], initial[valid])
+            self._previous[option_type] = (price_grid.expirations, price_grid.strikes, underlying_price, volatilities)
+
+            greeks[option_type] = self.calculateGreeks(option_type == Constants.CALL, underlying_price, contract_strikes, contract_years, volatilities)
+        return greeks
+
+
+    def calculateGreeks(self, is_call, underlying, strikes, years, volatilities):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            root_years = np.sqrt(years)
+            d1 = (np.log(underlying / strikes) + (self.interest_rate + volatilities**2 / 2) * years) / (volatilities * root_years)
+            d2 = d1 - volatilities * root_years
+            density = normalPdf(d1)
+            discounted_strikes = strikes * np.exp(-self.interest_rate * years)
+
+            delta = normalCdf(d1) if is_call else normalCdf(d1) - 1
+            gamma = density / (underlying * volatilities * root_years)
+            decay = -underlying * density * volatilities / (2 * root_years)
+            if is_call:
+                theta = decay - self.interest_rate * discounted_strikes * normalCdf(d2)
+            else:
+                theta = decay + self.interest_rate * discounted_strikes * normalCdf(-d2)
+            vega = underlying * density * root_years
+
+        return {'implied_volatility': volatilities, 'delta': delta, 'gamma': gamma, 'theta': theta / 365, 'vega': vega / 100}
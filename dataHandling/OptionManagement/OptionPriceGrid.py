@@ -0,0 +1,213 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+import numpy as np
+
+from dataHandling.Constants import Constants
+
+
+TICK_TYPES = [Constants.BID, Constants.ASK, Constants.CLOSE]
+TICK_ROWS = {tick_type: row for row, tick_type in enumerate(TICK_TYPES)}
+
+
+class OptionPriceGrid:
+    """
+    The bid, ask and close prices of the calls and puts of a chain on a dense grid of the sorted expirations
+    (IB date strings) by the sorted strikes, one array of tick type by expiration by strike per option type.
+    The position of every expiration and strike is kept in a dict, so a tick is written in place. Prices that
+    did not come in are NaN, and the time the prices of a contract last came in is kept with them. New
+    expirations and strikes are inserted into the axes, which only happens while a chain is first filled in.
+    """
+
+    option_types = [Constants.CALL, Constants.PUT]
+
+    def __init__(self):
+        self.reset()
+
+
+    def reset(self):
+        self.expirations = np.empty(0, dtype=object)
+        self.strikes = np.empty(0, dtype=float)
+        self._expiration_index = dict()
+        self._strike_index = dict()
+        self._prices = {option_type: np.full((len(TICK_TYPES), 0, 0), np.nan) for option_type in self.option_types}
+            #estimates per option type, calculated on first use after its prices changed
+        self._estimates = dict()
+            #expiration by strike mask per option type of the contracts for which a price came in
+        self._presence = {option_type: np.zeros((0, 0), dtype=bool) for option_type in self.option_types}
+        self._update_times = {option_type: np.full((0, 0), np.nan) for option_type in self.option_types}
+
+
+    def snapshot(self):
+            #a copy to calculate on while ticks come in, the axes and their dicts are replaced rather than changed so they are shared
+        grid = OptionPriceGrid.__new__(OptionPriceGrid)
+        grid.expirations, grid.strikes = self.expirations, self.strikes
+        grid._expiration_index, grid._strike_index = self._expiration_index, self._strike_index
+        grid._prices = {option_type: prices.copy() for option_type, prices in self._prices.items()}
+        grid._presence = {option_type: presence.copy() for option_type, presence in self._presence.items()}
+        grid._update_times = {option_type: update_times.copy() for option_type, update_times in self._update_times.items()}
+        grid._estimates = dict(self._estimates)
+        return grid
+
+
+    def expirationIndex(self, expiration):
+        if not (expiration in self._expiration_index):
+            position = int(np.searchsorted(self.expirations, expiration))
+            self.expirations = np.insert(self.expirations, position, expiration)
+            for option_type in self.option_types:
+                self._prices[option_type] = np.insert(self._prices[option_type], position, np.nan, axis=1)
+                self._presence[option_type] = np.insert(self._presence[option_type], position, False, axis=0)
+                self._update_times[option_type] = np.insert(self._update_times[option_type], position, np.nan, axis=0)
+            self._expiration_index = {value: index for index, value in enumerate(self.expirations)}
+        return self._expiration_index[expiration]
+
+
+    def strikeIndex(self, strike):
+        strike = float(strike)
+        if not (strike in self._strike_index):
+            position = int(np.searchsorted(self.strikes, strike))
+            self.strikes = np.insert(self.strikes, position, strike)
+            for option_type in self.option_types:
+                self._prices[option_type] = np.insert(self._prices[option_type], position, np.nan, axis=2)
+                self._presence[option_type] = np.insert(self._presence[option_type], position, False, axis=1)
+                self._update_times[option_type] = np.insert(self._update_times[option_type], position, np.nan, axis=1)
+            self._strike_index = {value: index for index, value in enumerate(self.strikes)}
+        return self._strike_index[strike]
+
+
+    def extendAxes(self, expirations, strikes):
+            #adds all expirations and strikes that are new at once
+        expiration_axis = np.union1d(self.expirations, np.unique(expirations)).astype(object)
+        strike_axis = np.union1d(self.strikes, np.unique(strikes))
+        if len(expiration_axis) == len(self.expirations) and len(strike_axis) == len(self.strikes):
+            return
+
+        rows = np.searchsorted(expiration_axis, self.expirations)[:, None]
+        columns = np.searchsorted(strike_axis, self.strikes)[None, :]
+        shape = (len(expiration_axis), len(strike_axis))
+        for option_type in self.option_types:
+            prices = np.full((len(TICK_TYPES),) + shape, np.nan)
+            prices[:, rows, columns] = self._prices[option_type]
+            presence = np.zeros(shape, dtype=bool)
+            presence[rows, columns] = self._presence[option_type]
+            update_times = np.full(shape, np.nan)
+            update_times[rows, columns] = self._update_times[option_type]
+            self._prices[option_type], self._presence[option_type], self._update_times[option_type] = prices, presence, update_times
+
+        self.expirations, self.strikes = expiration_axis, strike_axis
+        self._expiration_index = {value: index for index, value in enumerate(self.expirations)}
+        self._strike_index = {value: index for index, value in enumerate(self.strikes)}
+
+
+    def positionsOf(self, expirations, strikes):
+            #the rows and columns of the contracts with the expirations and strikes, and whether they are on the grid
+        expirations = np.asarray(expirations, dtype=object)
+        strikes = np.asarray(strikes, dtype=float)
+        if len(self.expirations) == 0 or len(self.strikes) == 0:
+            return np.zeros(len(expirations), dtype=int), np.zeros(len(strikes), dtype=int), np.zeros(len(expirations), dtype=bool)
+
+        rows = np.minimum(np.searchsorted(self.expirations, expirations), len(self.expirations) - 1)
+        columns = np.minimum(np.searchsorted(self.strikes, strikes), len(self.strikes) - 1)
+        found = (self.expirations[rows] == expirations) & (self.strikes[columns] == strikes)
+        return rows, columns, found
+
+
+    def setValue(self, option_type, expiration, strike, tick_type, price):
+        expiration_index = self.expirationIndex(expiration)
+        strike_index = self.strikeIndex(strike)
+        self._prices[option_type][TICK_ROWS[tick_type], expiration_index, strike_index] = price
+        self._estimates.pop(option_type, None)
+        if not np.isnan(price):
+            self._presence[option_type][expiration_index, strike_index] = True
+            self._update_times[option_type][expiration_index, strike_index] = time.time()
+
+
+    def setValues(self, option_types, expirations, strikes, prices_by_tick, update_times):
+            #all contracts at once, prices_by_tick has an array of prices per tick type, NaN for the ones that are missing
+        option_types = np.asarray(option_types)
+        expirations = np.asarray(expirations, dtype=object)
+        strikes = np.asarray(strikes, dtype=float)
+        self.extendAxes(expirations, strikes)
+        self._estimates = dict()
+
+        rows, columns, _ = self.positionsOf(expirations, strikes)
+        for option_type in self.option_types:
+            selection = (option_types == option_type)
+            for tick_type, prices in prices_by_tick.items():
+                priced = selection & ~np.isnan(prices)
+                self._prices[option_type][TICK_ROWS[tick_type], rows[priced], columns[priced]] = prices[priced]
+                self._presence[option_type][rows[priced], columns[priced]] = True
+            self._update_times[option_type][rows[selection], columns[selection]] = update_times[selection]
+
+
+    def getValues(self, option_type, tick_type):
+            #expiration by strike surface of one tick type, or of the estimates for 'price_est'
+        if tick_type == 'price_est':
+            if not (option_type in self._estimates):
+                self.estimatePrices()
+            return self._estimates[option_type]
+        return self._prices[option_type][TICK_ROWS[tick_type]]
+
+
+    def estimatePrices(self):
+            #the middle of bid and ask, where either is missing the close, and without a close the bid or ask there is
+        for option_type in self.option_types:
+            bid_prices, ask_prices, close_prices = self._prices[option_type]
+            estimates = (bid_prices + ask_prices) / 2
+            estimates = np.where(np.isnan(estimates), close_prices, estimates)
+            estimates = np.where(np.isnan(estimates), ask_prices, estimates)
+            self._estimates[option_type] = np.where(np.isnan(estimates), bid_prices, estimates)
+
+
+    def getPresence(self, option_type):
+        return self._presence[option_type]
+
+
+    def getUpdateTimes(self, option_type):
+            #epoch seconds at which the prices of every contract last came in
+        return self._update_times[option_type]
+
+
+    def hasData(self, option_type):
+        return bool(self.getPresence(option_type).any())
+
+
+    def hasDataForExp(self, option_type, expiration):
+        if expiration in self._expiration_index:
+            return bool(self.getPresence(option_type)[self._expiration_index[expiration]].any())
+        return False
+
+
+    def getExpirations(self, option_type):
+        return self.expirations[self.getPresence(option_type).any(axis=1)]
+
+
+    def getStrikes(self, option_type):
+        return self.strikes[self.getPresence(option_type).any(axis=0)]
+
+
+    def getRow(self, option_type, expiration, tick_type):
+            #strikes with prices for the expiration and their values of the tick type
+        expiration_index = self._expiration_index[expiration]
+        present = self.getPresence(option_type)[expiration_index]
+        return self.strikes[present], self.getValues(option_type, tick_type)[expiration_index, present]
+
+
+    def getPairedRow(self, expiration, tick_type):
+            #strikes with prices for both calls and puts for the expiration, with a column of call and one of put values
+        expiration_index = self._expiration_index[expiration]
+        present = self.getPresence(Constants.CALL)[expiration_index] & self.getPresence(Constants.PUT)[expiration_index]
+        values = [self.getValues(option_type, tick_type)[expiration_index, present] for option_type in self.option_types]
+        return self.strikes[present], np.column_stack(values)
@@ -0,0 +1,129 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from threading import Lock
+import time
+from PyQt6.QtCore import pyqtSignal, pyqtSlot, QCoreApplication, QMetaObject, QObject, Qt, QThread, QTimer
+
+from dataHandling.IBConnectivity import LatencyHistogram
+
+
+class RecalculationScheduler(QObject):
+    """
+    Runs the recalculations of a frame on a thread of its own. Changes are marked from any thread, and all
+    that come in while a recalculation is waiting or running are coalesced into the next one, which starts
+    no sooner than 1/max_rate seconds after the previous one started. Structural changes, like another
+    construction, don't wait for that. recalculate_function gets the changed expirations, None when
+    everything changed, and whether the change was structural.
+    """
+
+    _schedule_signal = pyqtSignal()
+
+    def __init__(self, recalculate_function, max_rate=1.0):
+        super().__init__()
+        self.recalculate_function = recalculate_function
+        self.max_rate = max_rate
+
+        self._lock = Lock()
+        self._dirty_expirations = set()
+        self._all_dirty = False
+        self._structural_change = False
+        self._scheduled = False
+        self._last_start = None
+        self._metrics = {'marks': 0, 'coalesced': 0, 'recalculations': 0}
+        self._compute_times = LatencyHistogram()
+
+            #the timer moves along to the thread, where it is started by the queued schedule signal
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.recalculate)
+        self._schedule_signal.connect(self.schedule, Qt.ConnectionType.QueuedConnection)
+
+        self.worker_thread = QThread()
+        self.moveToThread(self.worker_thread)
+        self.worker_thread.start()
+
+
+    def setMaxRate(self, max_rate):
+            #recalculations per second
+        self.max_rate = max_rate
+
+
+    def markDirty(self, expiration=None, structural_change=False):
+            #without an expiration everything changed, unless only the structure did
+        with self._lock:
+            self._metrics['marks'] += 1
+            if expiration is not None:
+                self._dirty_expirations.add(expiration)
+            elif not structural_change:
+                self._all_dirty = True
+
+            if self._scheduled and not (structural_change and not self._structural_change):
+                self._metrics['coalesced'] += 1
+                self._structural_change = self._structural_change or structural_change
+                return
+            self._structural_change = self._structural_change or structural_change
+            self._scheduled = True
+
+        self._schedule_signal.emit()
+
+
+    @pyqtSlot()
+    def schedule(self):
+        with self._lock:
+            structural_change = self._structural_change
+
+        if structural_change or self._last_start is None:
+            delay = 0.0
+        else:
+            delay = max(0.0, self._last_start + 1 / self.max_rate - time.monotonic())
+        self.timer.start(int(delay * 1000))
+
+
+    @pyqtSlot()
+    def recalculate(self):
+        with self._lock:
+            expirations = None if self._all_dirty else self._dirty_expirations
+            structural_change = self._structural_change
+            self._dirty_expirations = set()
+            self._all_dirty = False
+            self._structural_change = False
+            self._scheduled = False
+
+        self._last_start = time.monotonic()
+        self.recalculate_function(expirations, structural_change)
+        with self._lock:
+            self._metrics['recalculations'] += 1
+            self._compute_times.add(1_000 * (time.monotonic() - self._last_start))
+
+
+    def getMetrics(self):
+            #marks coalesced into a recalculation that was already scheduled, and the compute times in milliseconds
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['compute_ms'] = self._compute_times.getSummary()
+            return metrics
+
+
+    @pyqtSlot()
+    def release(self):
+            #the timer can only be stopped on the thread it lives on, after which both go back to the main thread
+        self.timer.stop()
+        self.moveToThread(QCoreApplication.instance().thread())
+
+
+    def stop(self):
+        QMetaObject.invokeMethod(self, 'release', Qt.ConnectionType.BlockingQueuedConnection)
+        self.worker_thread.quit()
+        self.worker_thread.wait()
@@ -0,0 +1,183 @@
+#
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import time
+from collections import deque
+from threading import Lock
+
+
+HISTORICAL_REQUEST_TYPES = {'reqHistoricalData', 'reqHeadTimeStamp'}
+
+
+class TokenBucket:
+    """
+    A bucket of capacity tokens where every token taken returns window seconds later, so no more than
+    capacity are taken in any window (the way IB counts). A violation halves the capacity, after which
+    it grows back by one token every window without violations up to the limit.
+    """
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.capacity = limit
+        self.window = window
+        self._taken = deque()
+        self._reduced_at = None
+
+
+    def release(self, now):
+        while len(self._taken) > 0 and self._taken[0] <= now - self.window:
+            self._taken.popleft()
+        if self._reduced_at is not None and now - self._reduced_at >= self.window:
+            self.capacity += 1
+            self._reduced_at = None if self.capacity >= self.limit else now
+
+
+    def waitTime(self, now):
+            #seconds until a token is available
+        self.release(now)
+        if len(self._taken) < self.capacity:
+            return 0.0
+        return self._taken[len(self._taken) - self.capacity] + self.window - now
+
+
+    def take(self, now):
+        self._taken.append(now)
+
+
+    def reduce(self, now):
+        self.capacity = max(1, self.capacity // 2)
+        self._reduced_at = now
+
+
+    def isIdle(self, now):
+        self.release(now)
+        return len(self._taken) == 0 and self._reduced_at is None
+
+
+class RequestPacer:
+    """
+    Keeps requests within IB's pacing rules, with a token bucket per rule class: the message rate for
+    every request and for historical requests the overall limit, the limit per contract and the one on
+    identical requests. Pacing violations reported by IB reduce the buckets that the violating request
+    went through. Shared between the connections of a process, so the methods are thread safe.
+    """
+
+    message_limit = (50, 1.0)
+    historical_limit = (60, 600.0)
+        #six or more requests for the same contract, exchange and tick type within 2 seconds are a violation
+    contract_limit = (5, 2.0)
+    identical_limit = (1, 15.0)
+
+    prune_size = 1_000
+
+
+    def __init__(self):
+        self._lock = Lock()
+        self.message_bucket = TokenBucket(*self.message_limit)
+        self.historical_bucket = TokenBucket(*self.historical_limit)
+        self._contract_buckets = dict()
+        self._identical_buckets = dict()
+            #buckets that historical requests went through by req_id, in order of dispatch
+        self._buckets_by_req = dict()
+        self._metrics = {'dispatched': 0, 'paced': 0, 'violations': 0}
+
+
+    def contractKey(self, request):
+        contract = request['contract']
+        return (contract.conId or contract.symbol, contract.secType, contract.exchange, contract.primaryExchange)
+
+
+    def bucketsFor(self, request):
+        buckets = [self.message_bucket]
+        if request['type'] in HISTORICAL_REQUEST_TYPES:
+            contract_key = self.contractKey(request)
+            identical_key = (request['type'], contract_key, request.get('end_date'), request.get('duration'), request.get('bar_type'), request.get('regular_hours'))
+            if not (contract_key in self._contract_buckets):
+                self._contract_buckets[contract_key] = TokenBucket(*self.contract_limit)
+            if not (identical_key in self._identical_buckets):
+                self._identical_buckets[identical_key] = TokenBucket(*self.identical_limit)
+            buckets += [self.historical_bucket, self._contract_buckets[contract_key], self._identical_buckets[identical_key]]
+        return buckets
+
+
+    def delayFor(self, request, now=None):
+            #seconds until the request can go out without breaking a pacing rule
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return max(bucket.waitTime(now) for bucket in self.bucketsFor(request))
+
+
+    def messageDelay(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self.message_bucket.waitTime(now)
+
+
+    def acquire(self, request, now=None):
+            #takes the tokens for the request when it can go out now, otherwise returns the seconds to wait
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            buckets = self.bucketsFor(request)
+            delay = max(bucket.waitTime(now) for bucket in buckets)
+            if delay > 0:
+                self._metrics['paced'] += 1
+                return delay
+
+            for bucket in buckets:
+                bucket.take(now)
+            self._metrics['dispatched'] += 1
+            if len(buckets) > 1 and 'req_id' in request:
+                self._buckets_by_req[request['req_id']] = (now, buckets)
+                self.prune(now)
+            return 0.0
+
+
+    def prune(self, now):
+        while len(self._buckets_by_req) > 0:
+            req_id, (dispatched_at, _) = next(iter(self._buckets_by_req.items()))
+            if now - dispatched_at < self.historical_bucket.window:
+                break
+            del self._buckets_by_req[req_id]
+
+        for buckets in [self._contract_buckets, self._identical_buckets]:
+            if len(buckets) > self.prune_size:
+                for key in [key for key, bucket in buckets.items() if bucket.isIdle(now)]:
+                    del buckets[key]
+
+
+    def registerViolation(self, req_id, now=None):
+            #a pacing violation of a historical request, without a known request the overall limit is reduced
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._metrics['violations'] += 1
+            _, buckets = self._buckets_by_req.pop(req_id, (None, [self.historical_bucket]))
+            for bucket in buckets:
+                if bucket is not self.message_bucket:
+                    bucket.reduce(now)
+
+
+    def registerMessageViolation(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._metrics['violations'] += 1
+            self.message_bucket.reduce(now)
+
+
+    def getMetrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['message_capacity'] = self.message_bucket.capacity
+            metrics['historical_capacity'] = self.historical_bucket.capacity
+            return metrics
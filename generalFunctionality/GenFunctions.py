@@ -94,9 +94,9 @@ def floatFromString(str_flt, default=0.0):
         return default
 
 
-def getLowsHighsCount(stock_frame):
+def getLowsHighsCount(stock_frame, count=50):
 
-    lows, highs = getFilteredArrays(stock_frame, count=50)
+    lows, highs = getFilteredArrays(stock_frame, count=count)
 
     last_high = highs[-1]
     last_low = lows[-1]
@@ -128,48 +128,54 @@ def getLowsHighsCount(stock_frame):
 
 
 def getFilteredArrays(stock_frame, count):
-    lows = stock_frame[Constants.LOW].to_numpy()[-count:]
-    highs = stock_frame[Constants.HIGH].to_numpy()[-count:]
+        #works on frames as well as on read-only buffer snapshots
+    lows = np.asarray(stock_frame[Constants.LOW])[-count:]
+    highs = np.asarray(stock_frame[Constants.HIGH])[-count:]
 
     return lows, highs
 
-def greatherThan(value_1, value_2): return value_1 > value_2
-def smallerThan(value_1, value_2): return value_1 < value_2 
-
-
-def addEMAColumns(stock_frame, for_periods=[12, 26], from_index=None):
-    column_names, ema_columns = getEMAColumns(stock_frame, for_periods, from_index)
-    stock_frame[column_names] = np.column_stack(ema_columns)
-    return stock_frame
-
+def getLowsHighsCounts(lows, highs):
+        #getLowsHighsCount for many symbols at once, rows are symbols and short histories are NaN padded at the front
+    bar_count = lows.shape[1]
+    rows = np.arange(lows.shape[0])
+    first_valid = bar_count - np.count_nonzero(~np.isnan(lows), axis=1)
+
+        #np.roll wraps the first bar around to the last, for padded rows that has to be the first valid bar
+    previous_lows = np.roll(lows, 1, axis=1)
+    previous_highs = np.roll(highs, 1, axis=1)
+    padded = first_valid < bar_count
+    previous_lows[rows[padded], first_valid[padded]] = lows[padded, -1]
+    previous_highs[rows[padded], first_valid[padded]] = highs[padded, -1]
+
+        #the padding does not exist in the single symbol version, so it must never end a run
+    padding = np.arange(bar_count) < first_valid[:, None]
+    increasing_low_rev = ((lows >= previous_lows) | padding)[:, ::-1]
+    decreasing_high_rev = ((highs <= previous_highs) | padding)[:, ::-1]
+    increasing_low_count = firstFalseCount(increasing_low_rev, 1)
+    decreasing_high_count = firstFalseCount(decreasing_high_rev, 1)
+    inner_bar_count = firstFalseCount(np.logical_and(decreasing_high_rev, increasing_low_rev), 0)
+
+        #a count of 0 picks the first bar, like lows[-0] does in the single symbol version
+    last_low = lows[:, -1]
+    last_high = highs[:, -1]
+    low_starts = lows[rows, np.where(increasing_low_count == 0, first_valid, bar_count - increasing_low_count)]
+    high_starts = highs[rows, np.where(decreasing_high_count == 0, first_valid, bar_count - decreasing_high_count)]
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        from_low_move = {'start': low_starts, 'level': last_low, 'apex': last_high, 'move': 100*(last_high-low_starts)/low_starts, 'count': increasing_low_count}
+        from_high_move = {'start': high_starts, 'level': last_high, 'apex': last_low, 'move': 100*(last_low-high_starts)/high_starts, 'count': decreasing_high_count}
+    inner_bar_specs = {'count': inner_bar_count}
 
-def getEMAColumns(stock_frame, periods, from_index):
+    return from_low_move, from_high_move, inner_bar_specs
 
-    columns = []
-    column_names = []
-    for period in periods:
-        emas = pd.Series.ewm(stock_frame[Constants.CLOSE], alpha=2/(1+period)).mean() #, alpha=1/(1+period)
-        smoothed_ema_sma = emas.rolling(window=5).mean()
-        column_names.append('ema_' + str(period))
-        columns.append(emas.to_numpy())
-    return column_names, columns
 
+def firstFalseCount(reversed_mask, offset):
+    transitions = np.logical_not(reversed_mask)
+    return np.where(transitions.any(axis=1), np.argmax(transitions, axis=1) + offset, 0)
 
-def addRSIsEMAs(stock_frame, from_index=None):
-    updated_indices, up_emas, down_emas = getUpDownEMAColumns(stock_frame, from_index)
-    
-    up_emas = up_emas.to_numpy()
-    down_emas = down_emas.to_numpy()
-    rsi = calculateRSIfromEMAs(up_emas, down_emas)
-    
-    stock_frame.loc[updated_indices, ['up_ema', 'down_ema', 'rsi']] = np.column_stack([up_emas, down_emas, rsi])
-    
-        #we want to remove any NaNs, not sure if this is still necesarry 
-    if len(stock_frame['rsi']) != 0:
-        stock_frame['rsi'] = stock_frame['rsi'].ffill()
-        stock_frame['rsi'] = stock_frame['rsi'].round(1)
 
-    return stock_frame
+def greatherThan(value_1, value_2): return value_1 > value_2
+def smallerThan(value_1, value_2): return value_1 < value_2 
 
 
 def calculateRSIfromEMAs(up_emas, down_emas):
@@ -178,87 +184,42 @@ def calculateRSIfromEMAs(up_emas, down_emas):
     return rsi
 
 
-def getUpDownEMAColumns(stock_frame, from_index=None):
-
-        #if have calculated EMAs before we just want to supplement what's there
-    up_ema_column_exists = ('up_ema' in stock_frame.columns) and (stock_frame.iloc[0]['up_ema'] == 0.001)
-    down_ema_column_exists = ('down_ema' in stock_frame.columns) and (stock_frame.iloc[0]['down_ema'] == 0.001)
-    if up_ema_column_exists and down_ema_column_exists:
-        return calculateUpDownEMAsFromIndex(stock_frame, from_index)
-    else:
-        return calculateUpDownEMAsFromScratch(stock_frame)
-
-
-def calculateUpDownEMAsFromScratch(stock_frame):
-    closes = stock_frame[Constants.CLOSE]
-    indices = stock_frame.index
-    up_emas, down_emas = calculateUpDownEMAs(closes)
-    return indices, up_emas, down_emas
+def calculateLastRSIs(closes, period=14):
+        #Wilder RSI on the last bar for each row of a (symbols x bars) array, rows are NaN padded at the front,
+        #with the up and down EMAs through the bar before it to continue the recurrence from, as the last bar may
+        #still be revised. The recurrence runs over the columns, so all symbols are stepped at once
+    if len(closes) == 0 or closes.shape[1] <= period:
+        return np.full(len(closes), np.nan), np.full(len(closes), np.nan), np.full(len(closes), np.nan)
+
+    diffs = np.diff(closes, axis=1)
+    ups = np.clip(diffs, 0, None)
+    downs = np.clip(-diffs, 0, None)
+    diff_count = diffs.shape[1]
+
+        #seeded with the average move over the first period of each row, as in the single symbol version
+    first_diff = diff_count - np.count_nonzero(~np.isnan(diffs), axis=1)
+    seed_pos = first_diff + period - 1
+    has_seed = seed_pos < diff_count
+    has_previous_seed = seed_pos < diff_count - 1
+    seed_pos = np.minimum(seed_pos, diff_count - 1)
+    rows = np.arange(len(closes))
+    up_emas = np.cumsum(np.nan_to_num(ups), axis=1)[rows, seed_pos]/period
+    down_emas = np.cumsum(np.nan_to_num(downs), axis=1)[rows, seed_pos]/period
+
+    alpha = 1/period
+    previous_up_emas, previous_down_emas = up_emas, down_emas
+    for column in range(seed_pos.min() + 1, diff_count):
+        if column == diff_count - 1:
+            previous_up_emas, previous_down_emas = up_emas, down_emas
+        running = column > seed_pos
+        up_emas = np.where(running, (1 - alpha) * up_emas + alpha * ups[:, column], up_emas)
+        down_emas = np.where(running, (1 - alpha) * down_emas + alpha * downs[:, column], down_emas)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsis = np.round(calculateRSIfromEMAs(up_emas, down_emas), 1)
+    return np.where(has_seed, rsis, np.nan), np.where(has_previous_seed, previous_up_emas, np.nan), np.where(has_previous_seed, previous_down_emas, np.nan)
 
 
-def calculateUpDownEMAs(closes, period=14):
-
-        #we need up and down movements to calculate emas
-    ups, downs = getUpsAndDownsSeries(closes)
-        #pandas provides the fastest way to calculate emas
-    up_emas = pd.Series.ewm(ups, alpha=1/period).mean()
-    up_emas.iloc[:14] = 0.001     #we don't want the initial NaN, we also don't want zero, because it doesnt divide
-    down_emas = pd.Series.ewm(downs, alpha=1/period).mean()
-    down_emas.iloc[:14] = 0.001   #we don't want the initial NaN
-
-    return up_emas, down_emas
-    
-
-def calculateUpDownEMAsFromIndex(stock_frame, from_index):
-    
-        #we only want to recalculate those emas that are necesarry
-    alpha = 1/14
-    recalc_size = min(100, len(stock_frame))
-
-    integer_index = getStartRecalcIndex(stock_frame, from_index)
-    if integer_index < 10:
-        return calculateUpDownEMAsFromScratch(stock_frame)
-    else:
-            #we need up and down movements to calculate emas
-        last_closes = stock_frame.iloc[max(0,(integer_index-recalc_size)):][Constants.CLOSE]
-        ups, downs = getUpsAndDownsSeries(last_closes)
-            #pandas provides the fastest way to calculate emas
-        up_emas = pd.Series.ewm(ups, alpha=alpha).mean()
-        down_emas = pd.Series.ewm(downs, alpha=alpha).mean()
-
-        return last_closes.index[recalc_size:], up_emas[recalc_size:], down_emas[recalc_size:]
-
-
-def getStartRecalcIndex(stock_frame, from_index):
-    
-      #at the least we want to recalculate the last two values
-    indexer = len(stock_frame)-2
-
-      #if we have a from index we want to see if we need to go further back
-    if from_index is not None:
-        try:
-            from_int_index = stock_frame.index.get_loc(from_index)
-            indexer = min(indexer, from_int_index)
-        except KeyError:
-            print(f"FROM INDEX not found {from_index}")
-      
-        
-        #finally we want to make sure there are no NaNs that may need recomputing
-    first_up_nan = stock_frame['up_ema'].isna().idxmax()
-    first_down_nan = stock_frame['down_ema'].isna().idxmax()
-    if first_up_nan < first_down_nan:
-        smaller_selection = stock_frame.index < first_up_nan
-    else:
-        smaller_selection = stock_frame.index < first_down_nan
-
-    if len(smaller_selection) > 0:
-
-        true_value_set = np.where(smaller_selection)[0]
-        if len(true_value_set) > 0:
-            from_int_index = true_value_set.max()
-            indexer = min(indexer, from_int_index)
-
-    return indexer
 # def calculateEMAsFrom(stock_frame, from_index):
     
 #         #we only want to recalculate those emas that are necesarry
@@ -316,17 +277,6 @@ def getUpsAndDownsNumpy(closes):
     return ups, downs
 
 
-def getUpsAndDownsSeries(closes):
-    diffs = closes.diff()
-
-    ups = diffs.copy()
-    downs = diffs.copy()
-    ups[ups < 0] = 0
-    downs[downs > 0] = 0
-    downs *= -1
-
-    return ups, downs
-
 # def getEma(prices, days=14, counter=0):
 #     if len(prices) > days and counter < 150:
 #         counter += 1
@@ -353,8 +303,6 @@ def getDaysTillExpiration(expiration_date):
     return (datetime_obj - today).days
 
 
-
-
 def calculateCorrelation(frame_1, frame_2):
     r = np.corrcoef(np.vstack((frame_1, frame_2)))
 
@@ -0,0 +1,62 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Saves of the bar archive from several threads at once into the same folder.
+    #Run from the repository root: python -m pytest tests
+
+import glob, os
+from threading import Thread
+import numpy as np
+import pandas as pd
+
+from dataHandling.Constants import Constants
+from dataHandling.HistoryManagement.BarArchive import BarArchive
+
+
+MONTH_SECONDS = 31 * 86400
+COLUMNS = [Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME]
+
+
+def monthOfBars(month):
+    index = pd.Index(1_600_000_000 + month * MONTH_SECONDS + 300 * np.arange(100))
+    return pd.DataFrame({column: np.full(len(index), float(month)) for column in COLUMNS}, index=index)
+
+
+def test_concurrent_partial_saves(tmp_path):
+    archive = BarArchive(str(tmp_path))
+    def saveMonth(month):
+        bars = monthOfBars(month)
+        archive.save(1, Constants.FIVE_MIN_BAR, bars, [(int(bars.index[0]), int(bars.index[-1]))], partial=True)
+
+    threads = [Thread(target=saveMonth, args=(month,)) for month in range(12)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    bars, requested_ranges = BarArchive(str(tmp_path)).load(1, Constants.FIVE_MIN_BAR)
+    assert sorted(set(bars[Constants.CLOSE].astype(int))) == list(range(12))
+    assert len(bars) == 1200
+    assert len(requested_ranges) == 12
+    assert glob.glob(os.path.join(str(tmp_path), '**', '*.tmp'), recursive=True) == []
+
+
+def test_full_save_drops_later_partitions(tmp_path):
+    archive = BarArchive(str(tmp_path))
+    bars = pd.concat([monthOfBars(month) for month in range(3)])
+    archive.save(1, Constants.FIVE_MIN_BAR, bars, [(int(bars.index[0]), int(bars.index[-1]))])
+    first_month = monthOfBars(0)
+    archive.save(1, Constants.FIVE_MIN_BAR, first_month, [(int(first_month.index[0]), int(first_month.index[-1]))])
+
+    loaded_bars, _ = archive.load(1, Constants.FIVE_MIN_BAR)
+    assert len(loaded_bars) == 100
+    assert len(glob.glob(os.path.join(archive.folderFor(1, Constants.FIVE_MIN_BAR), '*.npy'))) == 1
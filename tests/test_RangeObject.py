@@ -0,0 +1,167 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Property tests of RangeObject against the list based implementation it replaced, on random intervals.
+    #Run from the repository root: python -m pytest tests
+
+import random
+from datetime import datetime, timedelta
+import pytest
+from pytz import utc
+
+from dataHandling.HistoryManagement.RangeObject import RangeObject
+
+
+BASE_TIME = datetime(2020, 1, 1, tzinfo=utc)
+SEEDS = range(200)
+
+
+def mergeAdjRanges(date_ranges):
+        #the merge of the list based RangeObject
+    date_ranges.sort()
+    for index_right in reversed(range(len(date_ranges))):
+        date_range_right = date_ranges[index_right]
+        for index_left in range(index_right):
+            date_range_left = date_ranges[index_left]
+            if (date_range_right[0] >= date_range_left[0]) and (date_range_right[1] <= date_range_left[1]):
+                del date_ranges[index_right]
+                break
+            elif (date_range_right[0] <= date_range_left[1]) and (date_range_right[1] > date_range_left[1]):
+                date_ranges[index_left] = (date_range_left[0], date_range_right[1])
+                del date_ranges[index_right]
+                break
+            elif (date_range_right[1] >= date_range_left[0]) and (date_range_right[0] < date_range_left[0]):
+                date_ranges[index_left] = (date_range_right[0], date_range_left[1])
+                del date_ranges[index_right]
+                break
+
+    return date_ranges
+
+
+class ListRangeObject:
+    """The list based RangeObject with DataBuffers.determineMissingRanges, for past ranges only"""
+
+    def __init__(self):
+        self._requested_ranges = []
+
+
+    def addRanges(self, req_range):
+        self._requested_ranges.append(req_range)
+        self._requested_ranges = mergeAdjRanges(self._requested_ranges)
+
+
+    def containsRange(self, inner_range):
+        for req_range in self._requested_ranges:
+            if (inner_range[0] >= req_range[0]) and (inner_range[1] <= req_range[1]):
+                return True
+        return False
+
+
+    def withinRange(self, dt_object):
+        for req_range in self._requested_ranges:
+            if (dt_object >= req_range[0]) and (dt_object <= req_range[1]):
+                return True
+        return False
+
+
+    def missingRanges(self, desired_range):
+        desired_start, desired_end = desired_range
+        missing_ranges = []
+        current_start = desired_start
+        for start, end in self._requested_ranges:
+            if start > current_start:
+                if current_start < min(desired_end, start):
+                    missing_ranges.append((current_start, min(desired_end, start)))
+            current_start = max(current_start, end)
+
+        if current_start < desired_end:
+            missing_ranges.append((current_start, desired_end))
+        return missing_ranges
+
+
+    def getRanges(self):
+        return self._requested_ranges
+
+
+def randomRange(generator, span=1000, max_length=120):
+        #minutes from BASE_TIME, including empty ranges
+    start = generator.randrange(span)
+    end = start + generator.choice([0, generator.randrange(max_length), generator.randrange(max_length // 10 + 1)])
+    return (BASE_TIME + timedelta(minutes=start), BASE_TIME + timedelta(minutes=end))
+
+
+def filledPair(generator, count):
+    ranges = [randomRange(generator) for _ in range(count)]
+    range_object = RangeObject()
+    list_object = ListRangeObject()
+    for rng in ranges:
+        range_object.addRanges(rng)
+        list_object.addRanges(rng)
+    return range_object, list_object
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_addRanges(seed):
+    generator = random.Random(seed)
+    range_object, list_object = filledPair(generator, generator.randrange(1, 40))
+    assert range_object.getRanges() == list_object.getRanges()
+
+    ranges = range_object.getRanges()
+    assert all(start <= end for start, end in ranges)
+    assert all(ranges[index][1] < ranges[index+1][0] for index in range(len(ranges) - 1))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_containsRange(seed):
+    generator = random.Random(seed)
+    range_object, list_object = filledPair(generator, generator.randrange(1, 40))
+    for _ in range(50):
+        query = randomRange(generator, span=1100)
+        assert range_object.containsRange(query) == list_object.containsRange(query)
+        assert range_object.withinRange(query[0]) == list_object.withinRange(query[0])
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_missingRanges(seed):
+    generator = random.Random(seed)
+    range_object, list_object = filledPair(generator, generator.randrange(0, 40))
+    for _ in range(50):
+        query = randomRange(generator, span=1100, max_length=600)
+        missing_ranges = range_object.missingRanges(query)
+        assert missing_ranges == list_object.missingRanges(query)
+        for missing_range in missing_ranges:
+            assert not range_object.containsRange((missing_range[0] + timedelta(seconds=1), missing_range[0] + timedelta(seconds=1)))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_serialize(seed):
+    generator = random.Random(seed)
+    range_object, list_object = filledPair(generator, generator.randrange(0, 40))
+    serialized = range_object.serialize()
+    assert all(isinstance(value, int) for pair in serialized for value in pair)
+    assert RangeObject.rangesFromSerialized(serialized) == list_object.getRanges()
+        #buffers saved by the list based version stored the datetime tuples themselves
+    assert RangeObject(RangeObject.rangesFromSerialized(list(list_object.getRanges()))).getRanges() == range_object.getRanges()
+
+
+def test_future_ranges():
+        #ranges that start in the future are dropped and ranges that end there are cut off at the current time
+    now = datetime.now(utc)
+    past_range = (now - timedelta(days=2), now - timedelta(days=1))
+    range_object = RangeObject([past_range, (now + timedelta(days=1), now + timedelta(days=2)), (now - timedelta(hours=1), now + timedelta(days=1))])
+    ranges = range_object.getRanges()
+    assert ranges[0] == past_range
+    assert len(ranges) == 2
+    assert ranges[1][0] == now - timedelta(hours=1)
+    assert ranges[1][1] <= datetime.now(utc)
@@ -0,0 +1,70 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #Completion of request groups when owners share joined requests, without a connection to IB.
+    #Run from the repository root: python -m pytest tests
+
+import pytest
+
+from dataHandling.Constants import Constants
+from dataHandling.HistoryManagement.HistoricalDataManagement import HistoricalDataManager
+
+
+@pytest.fixture
+def manager():
+    history_manager = HistoricalDataManager('127.0.0.1', 0, 0)
+    completed_groups = []
+    history_manager.api_updater.connect(lambda signal, sub_signal: completed_groups.append(sub_signal['type']) if signal == Constants.HISTORICAL_GROUP_COMPLETE else None)
+    history_manager.completed_groups = completed_groups
+    return history_manager
+
+
+def groupFor(history_manager, owner_id, req_ids, group_type):
+    for req_id in req_ids:
+        history_manager.joinRequest(owner_id, req_id, False)
+    history_manager.groupCurrentRequests(group_type)
+
+
+def test_shared_request_completes_every_group(manager):
+    shared_id = manager.req_id_manager.getNextHistID()
+    first_owner, second_owner = manager.registerOwner(), manager.registerOwner()
+    groupFor(manager, first_owner, [shared_id], 'first')
+    groupFor(manager, second_owner, [shared_id], 'second')
+
+    manager.processGroupSignal(shared_id)
+    assert sorted(manager.completed_groups) == ['first', 'second']
+    assert manager._grouped_req_ids == []
+
+
+def test_shared_request_leaves_unfinished_groups(manager):
+    shared_id, own_id = manager.req_id_manager.getNextHistID(), manager.req_id_manager.getNextHistID()
+    first_owner, second_owner = manager.registerOwner(), manager.registerOwner()
+    groupFor(manager, first_owner, [shared_id, own_id], 'first')
+    groupFor(manager, second_owner, [shared_id], 'second')
+
+    manager.processGroupSignal(shared_id)
+    assert manager.completed_groups == ['second']
+    manager.processGroupSignal(own_id)
+    assert manager.completed_groups == ['second', 'first']
+
+
+def test_suppressed_completion(manager):
+    shared_id = manager.req_id_manager.getNextHistID()
+    first_owner, second_owner = manager.registerOwner(), manager.registerOwner()
+    groupFor(manager, first_owner, [shared_id], 'first')
+    groupFor(manager, second_owner, [shared_id], 'second')
+
+    manager.processGroupSignal(shared_id, supress_signal=True)
+    assert manager.completed_groups == []
+    assert manager._grouped_req_ids == []
@@ -0,0 +1,92 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #The getters of DataBuffers for buffers that a process only maps from the shared cache, as a second process
+    #would see them. Run from the repository root: python -m pytest tests
+
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+from pytz import utc
+
+from dataHandling.Constants import Constants
+from dataHandling.HistoryManagement.BarArchive import BarArchive
+from dataHandling.HistoryManagement.DataBuffer import DataBuffers
+
+
+UID = 1
+BAR_TYPE = Constants.FIVE_MIN_BAR
+FIRST_TIMESTAMP = 1_700_000_100
+BAR_COUNT = 50
+
+
+@pytest.fixture
+def mapped_buffers(tmp_path, monkeypatch):
+    data_folder = str(tmp_path) + '/'
+    index = pd.Index(FIRST_TIMESTAMP + 300 * np.arange(BAR_COUNT))
+    bars = pd.DataFrame({column: np.arange(BAR_COUNT, dtype=float) for column in [Constants.OPEN, Constants.HIGH, Constants.LOW, Constants.CLOSE, Constants.VOLUME]}, index=index)
+    BarArchive(data_folder).save(UID, BAR_TYPE, bars, [(int(index[0]), int(index[-1]))])
+
+    monkeypatch.setattr(DataBuffers, 'lazy_loading', False)
+    monkeypatch.setattr(DataBuffers, 'save_on', False)
+    monkeypatch.setattr(DataBuffers, 'share_bars', 'publish')
+    publisher = DataBuffers(data_folder)
+    publisher.loadExistingBuffer(UID, BAR_TYPE)
+        #the buffers are shared per process, so the publisher's copy is dropped to leave only the mapped one
+    publisher.clearBufferFor(UID)
+
+    monkeypatch.setattr(DataBuffers, 'share_bars', 'map')
+    data_buffers = DataBuffers(data_folder)
+    yield data_buffers
+    data_buffers.clearBufferFor(UID)
+
+
+def test_getters_on_mapped_buffer(mapped_buffers):
+    assert mapped_buffers.isSharedOnly(UID, BAR_TYPE)
+    assert mapped_buffers.bufferExists(UID, BAR_TYPE)
+    last_timestamp = FIRST_TIMESTAMP + 300 * (BAR_COUNT - 1)
+    inner_range = (datetime.fromtimestamp(FIRST_TIMESTAMP + 600, utc), datetime.fromtimestamp(FIRST_TIMESTAMP + 1200, utc))
+
+    assert mapped_buffers.getVersionFor(UID, BAR_TYPE) >= 0
+    assert mapped_buffers.containsRange(UID, BAR_TYPE, inner_range)
+    assert mapped_buffers.withinRange(UID, BAR_TYPE, inner_range[0])
+    assert mapped_buffers.getMissingRangesFor(UID, BAR_TYPE, inner_range) == []
+    assert mapped_buffers.getLatestPrice(UID) == BAR_COUNT - 1
+    assert mapped_buffers.getLatestRow(UID, BAR_TYPE)[Constants.CLOSE] == BAR_COUNT - 1
+    assert mapped_buffers.getLastIndexLabel(UID, BAR_TYPE) == last_timestamp
+    assert mapped_buffers.getIndexAtPos(UID, BAR_TYPE, 0) == FIRST_TIMESTAMP
+    assert list(mapped_buffers.getIndicesFor(UID, BAR_TYPE)) == list(FIRST_TIMESTAMP + 300 * np.arange(BAR_COUNT))
+    assert len(mapped_buffers.getBarsFromIntIndex(UID, BAR_TYPE, -5)) == 5
+    assert len(mapped_buffers.getBarsFromLabelIndex(UID, BAR_TYPE, last_timestamp - 600)) == 3
+    assert mapped_buffers.getBarForIntIndex(UID, BAR_TYPE, 2)[Constants.CLOSE] == 2
+    assert mapped_buffers.getColumnValueForPos(UID, BAR_TYPE, Constants.CLOSE, -1) == BAR_COUNT - 1
+    assert mapped_buffers.getColumnFor(UID, BAR_TYPE, Constants.CLOSE).iloc[3] == 3
+    assert mapped_buffers.getValueForColumnByIndex(UID, BAR_TYPE, Constants.CLOSE, FIRST_TIMESTAMP + 300) == 1
+    assert mapped_buffers.hasBarForDtIndex(UID, BAR_TYPE, datetime.fromtimestamp(last_timestamp, utc))
+
+    mapped_buffers.setIndicatorValues(UID, BAR_TYPE, {'rsi_state': 1})
+    assert mapped_buffers.getIndicatorValues(UID, BAR_TYPE, ['rsi_state']) == {'rsi_state': 1}
+    assert mapped_buffers.isSharedOnly(UID, BAR_TYPE)
+
+
+def test_indicator_write_copies_mapped_buffer(mapped_buffers):
+    labels = FIRST_TIMESTAMP + 300 * np.arange(BAR_COUNT - 2, BAR_COUNT)
+    mapped_buffers.setColumnValuesAtIndices(UID, BAR_TYPE, labels, {'rsi': np.array([40.0, 60.0])})
+
+    assert not mapped_buffers.isSharedOnly(UID, BAR_TYPE)
+    bars = mapped_buffers.getBufferFor(UID, BAR_TYPE)
+    assert len(bars) == BAR_COUNT
+    assert list(bars['rsi'].iloc[-2:]) == [40.0, 60.0]
+    assert mapped_buffers.containsRange(UID, BAR_TYPE, (datetime.fromtimestamp(FIRST_TIMESTAMP, utc), datetime.fromtimestamp(FIRST_TIMESTAMP + 300, utc)))
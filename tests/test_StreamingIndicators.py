@@ -0,0 +1,99 @@
+# Copyright (c) 2024 Jelmer de Vries
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation in its latest version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+    #The streaming EMAs and RSIs against the pandas calculations they follow, from scratch and continued bar by bar.
+    #Run from the repository root: python -m pytest tests
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataHandling.Constants import Constants
+from dataHandling.HistoryManagement.BarStore import ColumnarBarStore
+from dataHandling.HistoryManagement.StreamingIndicators import StreamingIndicatorEngine
+
+
+BAR_SECONDS = 60
+
+
+def randomCloses(seed, count):
+    generator = np.random.default_rng(seed)
+    return 100 + generator.standard_normal(count).cumsum()
+
+
+def snapshotOf(closes, columns=None):
+    frame = pd.DataFrame({Constants.CLOSE: closes}, index=pd.Index(1_700_000_000 + BAR_SECONDS * np.arange(len(closes))))
+    for column_name, values in (columns or dict()).items():
+        frame[column_name] = values
+    return ColumnarBarStore.fromFrame(frame).snapshot()
+
+
+def pandasEMAs(closes, period):
+    return pd.Series(closes).ewm(span=period, adjust=False).mean().to_numpy()
+
+
+def pandasRSIs(closes, period):
+        #Wilder's smoothing seeded with the average move over the first period
+    diffs = pd.Series(closes).diff()
+    ups, downs = diffs.clip(lower=0), (-diffs).clip(lower=0)
+    def smoothed(moves):
+        seeded = moves.copy()
+        seeded.iloc[:period] = np.nan
+        seeded.iloc[period] = moves.iloc[1:period+1].mean()
+        return seeded.ewm(alpha=1/period, adjust=False, ignore_na=True).mean().where(seeded.index >= period)
+    return (100 - 100 / (1 + smoothed(ups) / smoothed(downs))).to_numpy()
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('period', [12, 26])
+def test_emas_from_scratch(seed, period):
+    closes = randomCloses(seed, 300)
+    index, values = StreamingIndicatorEngine().updateEMAs(1, Constants.ONE_MIN_BAR, snapshotOf(closes), period)
+    assert len(index) == len(closes)
+    np.testing.assert_allclose(values['ema_' + str(period)], pandasEMAs(closes, period))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_emas_continued(seed):
+        #every live bar is run through the recurrence from the state of the bar before it
+    period = 12
+    closes = randomCloses(seed, 200)
+    engine = StreamingIndicatorEngine()
+    column_name = 'ema_' + str(period)
+    emas = np.full(len(closes), np.nan)
+    for count in range(100, len(closes) + 1):
+        index, values = engine.updateEMAs(1, Constants.ONE_MIN_BAR, snapshotOf(closes[:count], {column_name: emas[:count]}), period)
+        emas[count - len(index):count] = values[column_name]
+    np.testing.assert_allclose(emas, pandasEMAs(closes, period))
+
+
+def test_emas_converge_to_adjusted():
+        #the ewm(adjust=True) values of the earlier version only differ early in the buffer
+    period = 26
+    closes = randomCloses(0, 500)
+    _, values = StreamingIndicatorEngine().updateEMAs(1, Constants.ONE_MIN_BAR, snapshotOf(closes), period)
+    adjusted = pd.Series(closes).ewm(span=period).mean().to_numpy()
+    assert not np.allclose(values['ema_26'][:period], adjusted[:period])
+    np.testing.assert_allclose(values['ema_26'][10*period:], adjusted[10*period:], rtol=1e-6)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_rsis_from_scratch(seed):
+    closes = randomCloses(seed, 300)
+    engine = StreamingIndicatorEngine()
+    index, values = engine.updateRSIs(1, Constants.ONE_MIN_BAR, snapshotOf(closes))
+    expected = pandasRSIs(closes, engine.rsi_period)
+    assert len(index) == len(closes)
+    np.testing.assert_array_equal(np.isnan(values['rsi']), np.isnan(expected))
+    np.testing.assert_allclose(values['rsi'][engine.rsi_period:], np.round(expected[engine.rsi_period:], 1))
@@ -114,7 +114,13 @@ class PandasDataModel(QAbstractTableModel):
         if signal == Constants.DATA_WILL_CHANGE:
             self.layoutAboutToBeChanged.emit()
         elif signal == Constants.DATA_DID_CHANGE:
-            if 'column_name' in sub_signal:
+            if 'changed_ranges' in sub_signal:
+                for top, left, bottom, right in self.getChangedRectangles(sub_signal['changed_ranges']):
+                    for row in range(top, bottom + 1):
+                        for column in range(left, right + 1):
+                            self.changed_list.add(self.index(row, column))
+                    self.dataChanged.emit(self.index(top, left), self.index(bottom, right))
+            elif 'column_name' in sub_signal:
                 column_index = self.getMappingIndex(sub_signal['column_name'])
                 if column_index is not None:
                     index = self.index(sub_signal['row_index'], column_index)
@@ -136,6 +142,31 @@ class PandasDataModel(QAbstractTableModel):
         else:
             return False
 
+    def getChangedRectangles(self, changed_ranges):
+            #changed_ranges maps column names to runs of changed rows. Neighbouring columns
+            #with the same changed runs are merged, so each run is announced once per block of columns
+        column_indices = dict()
+        for key, value in self._mapping.items():
+            column_indices.setdefault(value, []).append(key)
+
+        columns_by_run = dict()
+        for column_name, row_runs in changed_ranges.items():
+            for column_index in column_indices.get(column_name, []):
+                for row_run in row_runs:
+                    columns_by_run.setdefault(tuple(row_run), []).append(column_index)
+
+        rectangles = []
+        for (top, bottom), columns in columns_by_run.items():
+            columns = sorted(columns)
+            left = columns[0]
+            for previous, column in zip(columns, columns[1:]):
+                if column != previous + 1:
+                    rectangles.append((top, left, bottom, previous))
+                    left = column
+            rectangles.append((top, left, bottom, columns[-1]))
+        return rectangles
+
+
     def getMappingIndex(self, column_name):
         # Iterate through the dictionary items
         for key, value in self._mapping.items():
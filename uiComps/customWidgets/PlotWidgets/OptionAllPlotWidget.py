@@ -41,14 +41,14 @@ class OptionAllPlotWidget(pg.PlotWidget):
     min_key = None
     max_key = None
 
-    def __init__(self, delegate, plot_type, bottom_label, legend_alignment='right', difference_plot=False):
+    def __init__(self, delegate, plot_type, bottom_label, legend_alignment='right', difference_plot=False, left_label='Option Price'):
         super().__init__()
 
         self.delegate = delegate
         self.plot_type = plot_type
         self.difference_plot = difference_plot
         self.legend_alignment = legend_alignment
-        self.setupGraphs(bottom_label)
+        self.setupGraphs(bottom_label, left_label)
         self.addLegend()
 
         
@@ -59,13 +59,13 @@ class OptionAllPlotWidget(pg.PlotWidget):
         return rgb_colors
 
 
-    def setupGraphs(self, bottom_label, inverted=False):
+    def setupGraphs(self, bottom_label, left_label='Option Price', inverted=False):
 
         self.addCrossHair()
         self.proxy = pg.SignalProxy(self.scene().sigMouseMoved, rateLimit=60, slot=self.mouseMoved)
             
         # self.setMouseEnabled(y=False) 
-        self.setLabels(left='Option Price', bottom=bottom_label)
+        self.setLabels(left=left_label, bottom=bottom_label)
 
 
     
@@ -311,6 +311,9 @@ class OptionAllPlotWidget(pg.PlotWidget):
                         self.text_mid.setText(f"{min_key} dte: ${x_mouse:.2f}, {y_mouse:.2f}, ({y_details})")
                     else:
                         self.text_mid.setText(f"At expiration: ${x_mouse:.2f}, {y_mouse:.2f}, ({y_details})")
+                else:
+                        #the greeks, by expiration against the strikes
+                    self.text_mid.setText(f"{min_key} dte: ${x_mouse}, {y_details}")
 
 
                 self.current_selection = {'plot_type': self.plot_type, 'key': min_key, 'x_value': x_mouse, 'y_value': y_mouse, 'y_details': y_details}